@@ -0,0 +1,131 @@
+"""
+书籍组装基准测试。
+
+生成一个合成的目录（默认 5k 个节点，三层嵌套）及对应片段，对比：
+  - legacy: 递归 text += 拼接，整本书拼成一个字符串后一次性写入（旧实现）
+  - streaming: generate_book 逐节写入临时文件（当前实现）
+
+报告耗时与 Python 堆内存峰值 (tracemalloc)。
+
+用法:
+    PYTHONPATH=. python benchmarks/bench_book.py [--nodes 5000] [--points 8]
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+def build_project(root: str, nodes: int, points: int):
+    fragments_dir = os.path.join(root, "fragments")
+    os.makedirs(fragments_dir)
+    toc, count = [], 0
+    while count < nodes:
+        chapter = {"title": f"Chapter {count}", "children": []}
+        count += 1
+        for _ in range(10):
+            section = {"title": f"Section {count}", "title_cn": f"小节 {count}", "children": []}
+            count += 1
+            for _ in range(8):
+                section["children"].append({"title": f"Page {count}", "url": f"https://docs.example.com/p/{count}"})
+                count += 1
+            chapter["children"].append(section)
+        toc.append(chapter)
+    for i in range(count):
+        data = {
+            "url": f"https://docs.example.com/p/{i}", "summary": f"Summary of page {i}. " * 20,
+            "page_type": "Guide",
+            "knowledge_points": [{"concept": f"Concept {i}.{k}", "explanation": "Explanation " * 15,
+                                  "importance": k % 5 + 1} for k in range(points)]
+        }
+        with open(os.path.join(fragments_dir, f"{i}.json"), "w", encoding="utf-8") as f:
+            json.dump(data, f)
+    with open(os.path.join(root, "toc_raw.json"), "w", encoding="utf-8") as f:
+        json.dump(toc, f)
+    return fragments_dir, toc, count
+
+def legacy_book(generator, toc, fragments_dir, output_file):
+    """旧实现：递归字符串拼接 + 整本书一次写入"""
+    from src.core.indexer import FragmentIndexer
+
+    indexer = FragmentIndexer(fragments_dir)
+    indexer.build_index()
+
+    def process_node(node, level=1):
+        text = ""
+        title_cn = node.get("title_cn")
+        text += f"{'#' * level} {node['title']} ({title_cn})\n\n" if title_cn else f"{'#' * level} {node['title']}\n\n"
+        fragment = indexer.find_fragment(node["url"]) if node.get("url") else None
+        if fragment:
+            with open(fragment['path'], 'r', encoding='utf-8') as f:
+                data = json.load(f)
+                text += f"{data.get('summary', '')}\n\n"
+                if data.get('knowledge_points'):
+                    text += "#### Core Concepts\n"
+                    for kp in data['knowledge_points']:
+                        imp_str = generator._format_importance(kp.get('importance', 3))
+                        text += f"- **{kp['concept']}** {imp_str}: {kp['explanation']}\n"
+                text += "\n"
+        elif not node.get("children"):
+            text += "*(Content not found)*\n\n"
+        for child in node.get("children", []):
+            text += process_node(child, level + 1)
+        return text
+
+    content = ""
+    for node in toc:
+        content += process_node(node, level=2)
+    final_content = "# Bench Official Guide (Structured)\n\n"
+    final_content += "> Document generated via Content Extraction Pipeline based on official TOC.\n\n"
+    final_content += content
+    with open(output_file, "w", encoding="utf-8") as f:
+        f.write(final_content)
+
+def measure(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak / 1024 / 1024
+
+def main():
+    parser = argparse.ArgumentParser(description="Book assembly benchmark")
+    parser.add_argument("--nodes", type=int, default=5000)
+    parser.add_argument("--points", type=int, default=8)
+    args = parser.parse_args()
+
+    from loguru import logger
+    logger.remove()
+    from src.core.generator import Generator
+    from src.core.indexer import FragmentIndexer
+    from src.core.structure_generator import generate_book
+    import src.core.structure_generator as structure_generator
+
+    root = tempfile.mkdtemp()
+    fragments_dir, toc, count = build_project(root, args.nodes, args.points)
+    # 预先建立片段清单，两种实现在相同条件下比较
+    FragmentIndexer(fragments_dir).build_index()
+    # 生成阶段不调用 LLM，无需初始化模型客户端
+    generator = Generator.__new__(Generator)
+    structure_generator.generator = generator
+
+    legacy_out = os.path.join(root, "legacy.md")
+    streaming_out = os.path.join(root, "structured.md")
+    results = {
+        "legacy": measure(lambda: legacy_book(generator, toc, fragments_dir, legacy_out)),
+        "streaming": measure(lambda: generate_book("bench", fragments_dir, streaming_out)),
+    }
+    with open(legacy_out, encoding="utf-8") as a, open(streaming_out, encoding="utf-8") as b:
+        assert a.read() == b.read()
+
+    size_mb = os.path.getsize(streaming_out) / 1024 / 1024
+    print(f"TOC: {count} nodes, output {size_mb:.1f} MB")
+    print(f"{'variant':<12}{'seconds':>10}{'peak heap (MB)':>18}")
+    for name, (elapsed, peak) in results.items():
+        print(f"{name:<12}{elapsed:>10.2f}{peak:>18.1f}")
+
+if __name__ == "__main__":
+    main()
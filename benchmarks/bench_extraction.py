@@ -0,0 +1,91 @@
+"""
+正文提取 CPU 基准测试。
+
+对一组保存下来的 HTML 页面，对比每页 CPU 时间：
+  - legacy: trafilatura.extract + trafilatura.bare_extraction + BeautifulSoup 补标题（三次解析，旧实现）
+  - parse_page: 单次解析（当前实现）
+
+未指定语料目录时生成合成文档页面。
+
+用法:
+    PYTHONPATH=. python benchmarks/bench_extraction.py [--corpus DIR] [--pages 200] [--repeat 3]
+"""
+import argparse
+import os
+import time
+
+def synthetic_corpus(pages: int):
+    corpus = []
+    for i in range(pages):
+        nav = "".join(f"<li><a href='/docs/{j}'>Link {j}</a></li>" for j in range(80))
+        body = "".join(
+            f"<h2>Section {k}</h2>"
+            + "".join(f"<p>Paragraph {k}.{p} of page {i}: agents call tools, tools return observations "
+                      f"and the model decides what to do next based on the accumulated messages.</p>"
+                      for p in range(6))
+            + f"<pre><code>agent.invoke({{'input': 'step {k}'}})</code></pre>"
+            for k in range(12)
+        )
+        table = "<table>" + "".join(f"<tr><td>param_{r}</td><td>str</td><td>description {r}</td></tr>"
+                                    for r in range(15)) + "</table>"
+        corpus.append(f"<html><head><meta charset='utf-8'></head><body><nav><ul>{nav}</ul></nav>"
+                      f"<main><h1>Page {i}</h1>{body}{table}</main><footer>footer</footer></body></html>")
+    return corpus
+
+def load_corpus(directory: str):
+    corpus = []
+    for name in sorted(os.listdir(directory)):
+        if name.endswith((".html", ".htm")):
+            with open(os.path.join(directory, name), "r", encoding="utf-8", errors="replace") as f:
+                corpus.append(f.read())
+    return corpus
+
+def legacy_parse(html: str):
+    """旧实现：三次解析"""
+    import trafilatura
+    from bs4 import BeautifulSoup
+
+    content = trafilatura.extract(html, include_comments=False, include_tables=True)
+    metadata = trafilatura.bare_extraction(html)
+    title = getattr(metadata, "title", None) if metadata else None
+    text = (getattr(metadata, "text", None) if metadata else None) or content
+    if not title:
+        soup = BeautifulSoup(html, 'lxml')
+        if soup.title and soup.title.string:
+            title = soup.title.string.strip()
+        if not title:
+            h1 = soup.find('h1')
+            if h1:
+                title = h1.get_text().strip()
+    return title, text
+
+def main():
+    parser = argparse.ArgumentParser(description="Extraction CPU benchmark")
+    parser.add_argument("--corpus", type=str, help="保存的 HTML 页面目录")
+    parser.add_argument("--pages", type=int, default=200, help="合成页面数量（未指定 --corpus 时）")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    from loguru import logger
+    logger.remove()
+    from src.core.extractor import parse_page
+
+    corpus = load_corpus(args.corpus) if args.corpus else synthetic_corpus(args.pages)
+    print(f"Corpus: {len(corpus)} pages")
+
+    variants = {
+        "legacy": legacy_parse,
+        "parse_page": lambda html: parse_page("https://example.com", html),
+    }
+    for name, fn in variants.items():
+        best = None
+        for _ in range(args.repeat):
+            start = time.process_time()
+            for html in corpus:
+                fn(html)
+            elapsed = time.process_time() - start
+            best = elapsed if best is None else min(best, elapsed)
+        print(f"{name:<12} {best * 1000 / len(corpus):8.2f} ms CPU / page")
+
+if __name__ == "__main__":
+    main()
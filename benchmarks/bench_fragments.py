@@ -0,0 +1,75 @@
+"""
+片段存储后端基准测试。
+
+写入 N 个合成片段（默认 20k），对比两种后端：
+  - files: 每个 URL 一个缩进 JSON 文件（FileFragmentBackend）
+  - jsonl: 追加写入的单一日志 + 偏移索引（JsonlFragmentBackend）
+
+报告写入耗时、冷启动建立索引（全量读取）的耗时、磁盘占用与文件数。
+
+用法:
+    PYTHONPATH=. python benchmarks/bench_fragments.py [--fragments 20000] [--points 8]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+def make_fragment(i: int, points: int) -> dict:
+    return {
+        "url": f"https://docs.example.com/section-{i % 50}/page-{i}", "title": f"Page {i}",
+        "summary": f"Summary of page {i}. " * 20, "page_type": "Guide",
+        "knowledge_points": [{"concept": f"Concept {i}.{k}", "explanation": "Explanation " * 15,
+                              "tags": ["bench"], "importance": k % 5 + 1} for k in range(points)],
+        "content_hash": f"{i:064x}", "prompt_version": "bench", "model": "bench"
+    }
+
+def disk_usage(directory: str):
+    files = [os.path.join(directory, name) for name in os.listdir(directory)]
+    return len(files), sum(os.path.getsize(path) for path in files)
+
+def run(kind: str, count: int, points: int):
+    from src.core import fragment_backend
+    from src.core import indexer as indexer_module
+    from src.core.indexer import FragmentIndexer, FragmentStore
+    from src.utils.config import settings
+
+    directory = os.path.join(tempfile.mkdtemp(), "fragments")
+    os.makedirs(directory)
+    settings.generation.fragment_backend = kind
+    backend = fragment_backend.get_fragment_backend(directory)
+
+    started = time.perf_counter()
+    for i in range(count):
+        data = make_fragment(i, points)
+        backend.save(data["url"], data)
+    if kind == "jsonl":
+        backend.close()
+    write = time.perf_counter() - started
+
+    # 冷启动：丢弃后端实例与片段清单，模拟新进程
+    fragment_backend._backends.clear()
+    indexer_module._manifests.clear()
+    manifest_path = os.path.join(os.path.dirname(directory), indexer_module.FragmentManifest.FILENAME)
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+
+    started = time.perf_counter()
+    store = FragmentStore(max_bytes=1024 * 1024 * 1024)
+    indexer = FragmentIndexer(directory, store=store)
+    indexer.build_index()
+    read = time.perf_counter() - started
+    files, size = disk_usage(directory)
+    print(f"{kind:>6}: write {write:6.2f}s  cold index {read:6.2f}s  "
+          f"{files:>6} files  {size / 1024 / 1024:7.1f} MB  indexed {len(indexer.index)}")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fragments", type=int, default=20000)
+    parser.add_argument("--points", type=int, default=8)
+    args = parser.parse_args()
+    for kind in ("files", "jsonl"):
+        run(kind, args.fragments, args.points)
+
+if __name__ == "__main__":
+    main()
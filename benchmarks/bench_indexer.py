@@ -0,0 +1,104 @@
+"""
+片段查找基准测试。
+
+生成 N 个合成片段（默认 10k）与一个 M 节点的目录（默认 2k，每个节点带 URL 与关键词），
+按 generate_from_structure 的查找方式（先 URL，后逐个关键词）对比：
+  - linear: 旧实现，每次查找最多三次全量线性扫描
+  - indexed: FragmentIndexer.find_fragment（后缀索引 + 三元组索引）
+
+同时报告 build_index 首次（解析全部 JSON）与再次打开（片段清单命中）的耗时。
+
+用法:
+    PYTHONPATH=. python benchmarks/bench_indexer.py [--fragments 10000] [--nodes 2000]
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+SECTIONS = ["agents", "tools", "memory", "streaming", "models", "messages", "retrieval",
+            "middleware", "deployment", "observability", "integrations", "evaluation"]
+
+def build_fragments(directory: str, count: int, rng: random.Random):
+    for i in range(count):
+        path = f"{rng.choice(SECTIONS)}/{rng.choice(SECTIONS)}/page-{i}"
+        data = {"url": f"https://docs.example.com/oss/python/{path}", "title": f"Page {i}",
+                "summary": "", "page_type": "Guide", "knowledge_points": []}
+        with open(os.path.join(directory, f"{i}.json"), "w", encoding="utf-8") as f:
+            json.dump(data, f)
+
+def build_queries(fragments: int, nodes: int, rng: random.Random):
+    queries = []
+    for n in range(nodes):
+        target = rng.randrange(fragments * 2)  # 约一半节点找不到对应片段
+        url = f"https://docs.example.com/oss/python/x/y/page-{target}"
+        keywords = [f"page-{target}", rng.choice(SECTIONS), f"topic {n}"]
+        queries.append((url, keywords))
+    return queries
+
+def linear_find(index, keyword_or_suffix):
+    keyword_or_suffix = keyword_or_suffix.lower()
+    for url, data in index.items():
+        if url.endswith(keyword_or_suffix):
+            return data
+    for url, data in index.items():
+        if keyword_or_suffix in url:
+            return data
+    for url, data in index.items():
+        if keyword_or_suffix in data.get("title", "").lower():
+            return data
+    return None
+
+def walk(find, queries):
+    found = 0
+    for url, keywords in queries:
+        fragment = find(url)
+        if not fragment:
+            for kw in keywords:
+                fragment = find(kw)
+                if fragment:
+                    break
+        found += fragment is not None
+    return found
+
+def main():
+    parser = argparse.ArgumentParser(description="Fragment lookup benchmark")
+    parser.add_argument("--fragments", type=int, default=10000)
+    parser.add_argument("--nodes", type=int, default=2000)
+    args = parser.parse_args()
+
+    from src.core.indexer import FragmentIndexer
+
+    rng = random.Random(0)
+    directory = os.path.join(tempfile.mkdtemp(), "fragments")
+    os.makedirs(directory)
+    build_fragments(directory, args.fragments, rng)
+    queries = build_queries(args.fragments, args.nodes, rng)
+
+    start = time.perf_counter()
+    FragmentIndexer(directory).build_index()
+    print(f"build_index cold ({args.fragments} fragments): {time.perf_counter() - start:.2f}s")
+
+    # 第二次打开：清单命中，只需 stat 文件
+    indexer = FragmentIndexer(directory)
+    start = time.perf_counter()
+    indexer.build_index()
+    print(f"build_index warm ({args.fragments} fragments): {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    found_indexed = walk(indexer.find_fragment, queries)
+    indexed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    found_linear = walk(lambda q: linear_find(indexer.index, q), queries)
+    linear = time.perf_counter() - start
+
+    assert found_indexed == found_linear
+    print(f"TOC walk ({args.nodes} nodes, {found_indexed} matched):")
+    print(f"  linear   {linear:8.3f}s")
+    print(f"  indexed  {indexed:8.3f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Sitemap 扫描基准测试。
+
+在本地启动一个 HTTP 服务，提供合成的 sitemap index（默认 20 个子 sitemap × 2500 个 URL = 50k URL），
+每个请求附加固定延迟以模拟网络往返，对比：
+  - legacy: 逐个请求子 sitemap + BeautifulSoup 整树解析（旧实现）
+  - scanner: 并发抓取 + iterparse 流式解析（当前实现，同时测试 .xml.gz）
+
+每种实现在独立子进程中运行，报告耗时与峰值 RSS。
+
+用法:
+    PYTHONPATH=. python benchmarks/bench_sitemap.py [--children 20] [--urls 2500] [--latency 0.03]
+"""
+import argparse
+import gzip
+import http.server
+import multiprocessing
+import resource
+import threading
+import time
+
+NS = "http://www.sitemaps.org/schemas/sitemap/0.9"
+
+def build_site(children: int, urls: int):
+    files = {}
+    for suffix, compress in (("xml", False), ("xml.gz", True)):
+        locs = []
+        for c in range(children):
+            body = [f'<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns="{NS}">']
+            for u in range(urls):
+                body.append(f"<url><loc>https://docs.example.com/section-{c}/page-{u}</loc>"
+                            f"<lastmod>2024-01-{(u % 28) + 1:02d}</lastmod>"
+                            f"<changefreq>weekly</changefreq><priority>0.5</priority></url>")
+            body.append("</urlset>")
+            data = "\n".join(body).encode("utf-8")
+            name = f"/sitemap-{c}.{suffix}"
+            files[name] = gzip.compress(data) if compress else data
+            locs.append(name)
+        index = [f'<?xml version="1.0" encoding="UTF-8"?>\n<sitemapindex xmlns="{NS}">']
+        index += [f"<sitemap><loc>{{base}}{loc}</loc></sitemap>" for loc in locs]
+        index.append("</sitemapindex>")
+        files[f"/sitemap-index.{suffix}"] = "\n".join(index)
+    return files
+
+def serve(files, latency: float):
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            time.sleep(latency)
+            body = files.get(self.path)
+            if body is None:
+                self.send_response(404)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            if isinstance(body, str):
+                body = body.format(base=base).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/xml")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    base = f"http://127.0.0.1:{server.server_port}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, base
+
+def legacy_fetch(url: str):
+    """旧实现：串行递归 + BeautifulSoup XML 整树解析"""
+    import requests
+    from bs4 import BeautifulSoup
+
+    urls = set()
+    response = requests.get(url, timeout=30)
+    response.raise_for_status()
+    soup = BeautifulSoup(response.content, 'xml')
+    for sm in soup.find_all('sitemap'):
+        loc = sm.find('loc')
+        if loc and loc.text:
+            urls.update(legacy_fetch(loc.text.strip()))
+    for url_tag in soup.find_all('url'):
+        loc = url_tag.find('loc')
+        if loc and loc.text:
+            urls.add(loc.text.strip())
+    return urls
+
+def run_variant(name: str, url: str, out):
+    from loguru import logger
+    logger.remove()
+    start = time.perf_counter()
+    if name == "legacy":
+        count = len(legacy_fetch(url))
+    else:
+        from src.core.scanner import Scanner
+        count = len(Scanner(cache=None)._fetch_entries_recursive(url))
+    elapsed = time.perf_counter() - start
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    out.put((count, elapsed, peak_mb))
+
+def main():
+    parser = argparse.ArgumentParser(description="Sitemap scanning benchmark")
+    parser.add_argument("--children", type=int, default=20)
+    parser.add_argument("--urls", type=int, default=2500)
+    parser.add_argument("--latency", type=float, default=0.03)
+    args = parser.parse_args()
+
+    files = build_site(args.children, args.urls)
+    server, base = serve(files, args.latency)
+    ctx = multiprocessing.get_context("spawn")
+
+    print(f"{'variant':<16}{'urls':>8}{'seconds':>10}{'peak RSS (MB)':>16}")
+    for name, path in (("legacy", "/sitemap-index.xml"),
+                       ("scanner", "/sitemap-index.xml"),
+                       ("scanner (gzip)", "/sitemap-index.xml.gz")):
+        out = ctx.Queue()
+        proc = ctx.Process(target=run_variant, args=(name.split()[0], base + path, out))
+        proc.start()
+        count, elapsed, peak_mb = out.get()
+        proc.join()
+        print(f"{name:<16}{count:>8}{elapsed:>10.2f}{peak_mb:>16.1f}")
+
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -4,18 +4,110 @@ import uuid
 import os
 import json
 from loguru import logger
-from src.graph.workflow import create_graph
-from src.utils.config import settings
+from src.graph.workflow import create_graph, create_checkpointer
+from src.utils.config import settings, PipelineSettings
 from src.core.discovery import discovery
+from src.utils.llm_cache import llm_cache
+from src.utils.llm_metrics import llm_metrics
+from src.core.generator import generator
+
+def _graph_config(thread_id: str) -> dict:
+    # 每个 URL 一个分支，同时运行的分支数受 max_concurrency 限制
+    max_concurrency = (settings.pipeline if settings else PipelineSettings()).max_concurrency
+    return {"configurable": {"thread_id": thread_id}, "max_concurrency": max(1, max_concurrency)}
+
+def write_metrics(output_dir: str):
+    """汇总本次运行每个调用位置的 token、延迟、重试与缓存命中，写入 outputs/<project>/metrics.json"""
+    if llm_cache:
+        llm_cache.log_stats()
+    llm_metrics.log_summary()
+    path = os.path.join(output_dir, "metrics.json")
+    try:
+        llm_metrics.write(path)
+        logger.info(f"LLM metrics written to {path}")
+    except OSError as e:
+        logger.warning(f"Failed to write LLM metrics to {path}: {e}")
+
+def run_extraction(app, config: dict, initial_state: dict = None):
+    """
+    驱动提取图。提供 initial_state 时从头运行（扫描后自动批准候选 URL）；
+    否则从检查点继续。
+    """
+    try:
+        if initial_state is not None:
+            # 1. Start Graph (Runs 'scan' node)
+            # Since we provided candidate_urls, scan_node will just pass them through
+            for event in app.stream(initial_state, config=config):
+                if "scan" in event:
+                    logger.info("Scan node completed.")
+                
+        # 2. Check state (Paused after scan, or interrupted during extraction)
+        snapshot = app.get_state(config)
+        if not snapshot.next:
+            if initial_state is not None:
+                logger.warning("Graph finished unexpectedly.")
+                sys.exit(0)
+            logger.info("Nothing left to run for this thread.")
+            return
+            
+        # 3. Approve URLs (We already confirmed them in main.py)
+        if not snapshot.values.get("approved_urls"):
+            candidates = snapshot.values.get("candidate_urls", [])
+            if not candidates:
+                logger.warning("No candidates found in graph state.")
+                sys.exit(0)
+            logger.info(f"Auto-approving {len(candidates)} URLs (already confirmed).")
+            app.update_state(config, {"approved_urls": candidates})
+        else:
+            done = len(snapshot.values.get("results") or {})
+            logger.info(f"Resuming extraction: {done}/{len(snapshot.values['approved_urls'])} URLs already processed.")
+        
+        # 4. Resume Graph (Fans out one 'extract_url' branch per pending URL, then 'join')
+        logger.info("Resuming graph for extraction...")
+        for event in app.stream(None, config=config):
+            if "join" in event:
+                results = app.get_state(config).values.get("results") or {}
+                logger.success(f"Extracted {len(results)} pages.")
+        logger.info("Extraction completed.")
+            
+    except Exception as e:
+        logger.error(f"Extraction Phase encountered an error: {e}")
+        logger.warning("Proceeding to Generation Phase with available fragments...")
+
+def run_generation(project_name: str, fragments_dir: str, output_dir: str):
+    # Phase 3: Generation (Always run after extraction)
+    logger.info("\n=== Starting Phase 3: Generation ===")
+    from src.core.structure_generator import generate_book
+    
+    output_file = os.path.join(output_dir, "structured.md")
+    logger.info(f"Generating structured document for {project_name}...")
+    
+    try:
+        generate_book(project_name, fragments_dir, output_file)
+        logger.success(f"Full process complete! Document available at: {output_file}")
+    except Exception as e:
+        logger.error(f"Generation failed: {e}")
+
+    if generator:
+        generator.log_pack_stats()
+        generator.log_output_stats()
+    write_metrics(output_dir)
 
 def main():
     parser = argparse.ArgumentParser(description="内容提取智能代理")
     parser.add_argument("--project", type=str, required=True, help="项目名称 (如 langgraph)")
     parser.add_argument("--home", type=str, help="项目文档首页 URL (用于提取目录结构)")
     parser.add_argument("--prefix", type=str, help="URL 前缀过滤 (可选)")
+    parser.add_argument("--sitemap", type=str, help="sitemap.xml 地址 (可选，用于获取 lastmod 或在没有目录结构时发现 URL)")
+    parser.add_argument("--changed-only", action="store_true", help="仅处理 sitemap lastmod 比上次运行更新的页面 (需配合 --sitemap)")
     parser.add_argument("--filter", type=str, help="页面过滤关键词或 URL (用于测试)")
     parser.add_argument("--generate", action="store_true", help="仅运行生成阶段")
     parser.add_argument("--visualize", action="store_true", help="为现有文档生成图表 (Mermaid/AntV)")
+    parser.add_argument("--force", action="store_true", help="忽略已有片段，强制重新分析所有页面")
+    parser.add_argument("--resume", type=str, metavar="THREAD_ID", help="从检查点恢复之前中断的运行 (需与原运行相同的 --project)")
+    parser.add_argument("--no-llm-cache", action="store_true", help="不读取 LLM 响应缓存，所有调用重新请求模型 (新结果仍会写入缓存)")
+    parser.add_argument("--compact-fragments", action="store_true",
+                        help="压缩 JSONL 片段日志，只保留每个 URL 的最新片段 (目录中已有的逐页 JSON 片段会先导入)")
     
     args = parser.parse_args()
     project_name = args.project
@@ -24,18 +116,32 @@ def main():
     output_dir = os.path.join(os.getcwd(), "outputs", project_name)
     fragments_dir = os.path.join(output_dir, "fragments")
     toc_path = os.path.join(output_dir, "toc_raw.json")
+    checkpoint_path = os.path.join(output_dir, "checkpoints.sqlite")
+    
+    if args.compact_fragments:
+        from src.core.fragment_backend import get_fragment_backend
+        backend = get_fragment_backend(fragments_dir, backend="jsonl")
+        imported = backend.import_files()
+        before, after = backend.compact()
+        logger.success(f"Compacted {backend.log_path}: {len(backend)} fragments ({imported} imported from JSON files), "
+                       f"{before / 1024:.1f} KB -> {after / 1024:.1f} KB")
+        return
     
     # 检查配置
     if not settings.llm.api_key:
         logger.error("LLM API Key not found. Please set LLM_API_KEY env var.")
         sys.exit(1)
 
+    if llm_cache and args.no_llm_cache:
+        llm_cache.bypass = True
+
     if args.visualize:
         from src.core.visualizer import Visualizer
         visualizer = Visualizer()
         input_file = os.path.join(output_dir, "structured.md")
         output_file = os.path.join(output_dir, "structured_with_diagrams.md")
         visualizer.process_document(input_file, output_file)
+        write_metrics(output_dir)
         return
         
     if args.generate:
@@ -47,10 +153,23 @@ def main():
         logger.info(f"Reading fragments from: {fragments_dir}")
         
         generate_book(project_name, fragments_dir, output_file)
+        write_metrics(output_dir)
+        return
+
+    if args.resume:
+        app = create_graph(checkpointer=create_checkpointer(checkpoint_path))
+        snapshot = app.get_state({"configurable": {"thread_id": args.resume}})
+        if not snapshot.values:
+            logger.error(f"No checkpoint found for thread {args.resume} in {checkpoint_path}.")
+            sys.exit(1)
+        logger.info(f"Resuming thread {args.resume} for project {project_name}...")
+        run_extraction(app, _graph_config(args.resume))
+        run_generation(project_name, fragments_dir, output_dir)
         return
 
     # Phase 1: Discovery (Agent Flow)
     toc_structure = []
+    sitemap_lastmod = {}
     
     # If home URL is provided, discover fresh TOC
     if args.home:
@@ -65,9 +184,18 @@ def main():
         logger.info(f"Loading existing TOC from {toc_path}...")
         with open(toc_path, 'r', encoding='utf-8') as f:
             toc_structure = json.load(f)
+    
+    # No TOC at all: discover candidate URLs from the sitemap
+    elif args.sitemap:
+        from src.core.scanner import scanner
+        logger.info(f"No TOC found, discovering URLs from sitemap {args.sitemap}...")
+        entries = scanner.scan_entries(args.sitemap, args.prefix or "")
+        # lastmod 随初始状态传给 scan_node，避免再次扫描 sitemap
+        sitemap_lastmod = {e.loc: e.lastmod for e in entries}
+        toc_structure = [{"title": project_name, "children": [{"title": e.loc, "url": e.loc} for e in entries]}]
     else:
         logger.error("No --home provided and no existing TOC found at {toc_path}.")
-        logger.error("Please provide --home to initialize the project structure.")
+        logger.error("Please provide --home (or --sitemap) to initialize the project structure.")
         sys.exit(1)
         
     # Flatten candidates from TOC
@@ -169,72 +297,31 @@ def main():
 
     # Phase 2: Extraction (Graph)
     thread_id = str(uuid.uuid4())
-    config = {"configurable": {"thread_id": thread_id}}
-    app = create_graph()
+    config = _graph_config(thread_id)
+    app = create_graph(checkpointer=create_checkpointer(checkpoint_path))
     
     initial_state = {
         "project_name": project_name,
         "home_url": args.home or "",
         "target_url_prefix": args.prefix or "",
-        "sitemap_url": "", # Deprecated
+        "sitemap_url": args.sitemap or "",
+        "changed_only": args.changed_only,
+        "sitemap_lastmod": sitemap_lastmod,
         "toc_structure": toc_structure,
         "candidate_urls": candidates,
         "approved_urls": [], # Will be handled by graph logic if needed, but we essentially pre-approved here
         "results": {},
         "fragment_files": [],
+        "force_refresh": args.force,
         "current_step": "start",
         "error": None
     }
     
     logger.info(f"Starting Extraction Graph (Thread: {thread_id})...")
+    logger.info(f"If interrupted, continue with: python main.py --project {project_name} --resume {thread_id}")
     
-    try:
-        # 1. Start Graph (Runs 'scan' node)
-        # Since we provided candidate_urls, scan_node will just pass them through
-        for event in app.stream(initial_state, config=config):
-            if "scan" in event:
-                logger.info("Scan node completed.")
-                
-        # 2. Check state (Paused after scan)
-        snapshot = app.get_state(config)
-        if not snapshot.next:
-            logger.warning("Graph finished unexpectedly.")
-            sys.exit(0)
-            
-        # 3. Approve URLs (We already confirmed them in main.py)
-        candidates = snapshot.values.get("candidate_urls", [])
-        if not candidates:
-            logger.warning("No candidates found in graph state.")
-            sys.exit(0)
-            
-        logger.info(f"Auto-approving {len(candidates)} URLs (already confirmed).")
-        app.update_state(config, {"approved_urls": candidates})
-        
-        # 4. Resume Graph (Runs 'extract' node)
-        logger.info("Resuming graph for extraction...")
-        for event in app.stream(None, config=config):
-            if "extract" in event:
-                logger.info("Extraction completed.")
-                res = event["extract"]
-                if "results" in res:
-                     logger.success(f"Extracted {len(res['results'])} pages.")
-            
-    except Exception as e:
-        logger.error(f"Extraction Phase encountered an error: {e}")
-        logger.warning("Proceeding to Generation Phase with available fragments...")
-
-    # Phase 3: Generation (Always run after extraction)
-    logger.info("\n=== Starting Phase 3: Generation ===")
-    from src.core.structure_generator import generate_book
-    
-    output_file = os.path.join(output_dir, "structured.md")
-    logger.info(f"Generating structured document for {project_name}...")
-    
-    try:
-        generate_book(project_name, fragments_dir, output_file)
-        logger.success(f"Full process complete! Document available at: {output_file}")
-    except Exception as e:
-        logger.error(f"Generation failed: {e}")
+    run_extraction(app, config, initial_state)
+    run_generation(project_name, fragments_dir, output_dir)
 
 if __name__ == "__main__":
     main()
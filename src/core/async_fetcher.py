@@ -0,0 +1,173 @@
+import asyncio
+import random
+import threading
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlparse
+import httpx
+from loguru import logger
+from src.utils.http_cache import HttpCache
+
+_RETRY_STATUS = {429, 500, 502, 503, 504}
+
+class _HostState:
+    """单个主机的并发与礼貌延迟状态"""
+
+    def __init__(self, limit: int):
+        self.slots = asyncio.Semaphore(limit)
+        self.lock = asyncio.Lock()
+        self.next_allowed = 0.0
+
+class AsyncFetcher:
+    """
+    基于 asyncio + httpx 的抓取后端。
+    后台线程中的单个事件循环即可维持数百个在途请求，提取图的各分支通过 fetch 提交请求：
+    - keep-alive 连接池按主机复用，省去重复的 TCP/TLS 握手
+    - 每个主机独立的并发上限与请求间隔（礼貌延迟）
+    - 429 / 5xx / 网络错误按带抖动的指数退避重试
+    """
+
+    def __init__(self, concurrency: int = 100, per_host: int = 8, politeness_delay: float = 0.0,
+                 timeout: int = 10, max_retries: int = 3, backoff_base: float = 0.5,
+                 user_agent: str = None, cache: Optional[HttpCache] = None):
+        self.concurrency = max(1, concurrency)
+        self.per_host = max(1, per_host)
+        self.politeness_delay = politeness_delay
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.user_agent = user_agent
+        self.cache = cache
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._hosts: Dict[str, _HostState] = {}
+
+    async def _polite_wait(self, host: _HostState):
+        if not self.politeness_delay:
+            return
+        loop = asyncio.get_running_loop()
+        async with host.lock:
+            wait = host.next_allowed - loop.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            host.next_allowed = loop.time() + self.politeness_delay
+
+    def _backoff(self, attempt: int, response: Optional[httpx.Response] = None) -> float:
+        delay = random.uniform(0, self.backoff_base * (2 ** attempt))
+        if response is not None:
+            try:
+                delay = max(delay, float(response.headers.get("retry-after")))
+            except (TypeError, ValueError):
+                pass
+        return delay
+
+    async def _fetch(self, client: httpx.AsyncClient, host: _HostState, url: str) -> Tuple[bytes, Optional[str]]:
+        """
+        下载单个 URL。Returns: (正文字节, 编码)
+        """
+        use_validators = True
+        attempt = 0
+        while True:
+            # 缓存读写是同步的 SQLite / 文件 I/O（含 LRU 淘汰），放到线程中执行，不阻塞其他在途请求
+            headers = {}
+            if self.cache and use_validators:
+                headers = await asyncio.to_thread(self.cache.conditional_headers, url)
+            try:
+                async with host.slots:
+                    await self._polite_wait(host)
+                    logger.debug(f"Fetching content: {url}")
+                    response = await client.get(url, headers=headers)
+            except httpx.TransportError as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+                attempt += 1
+                logger.warning(f"Fetch {url} failed ({e!r}), retry {attempt}/{self.max_retries} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+
+            if response.status_code == 304 and self.cache:
+                cached = await asyncio.to_thread(self.cache.revalidated, url)
+                if cached is not None:
+                    return cached.content, cached.encoding
+                # 本地副本已丢失，去掉条件头重新请求
+                use_validators = False
+                continue
+
+            if response.status_code in _RETRY_STATUS and attempt < self.max_retries:
+                delay = self._backoff(attempt, response)
+                attempt += 1
+                logger.warning(f"Fetch {url} returned {response.status_code}, "
+                               f"retry {attempt}/{self.max_retries} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+
+            response.raise_for_status()
+            content = response.content
+            encoding = response.charset_encoding
+            if self.cache:
+                self.cache.count_miss()
+                await asyncio.to_thread(self.cache.store, url, content, response.headers.get("ETag"),
+                                        response.headers.get("Last-Modified"), encoding)
+            return content, encoding
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        """首次调用时在后台线程中启动事件循环，之后所有调用方共享同一个循环、连接池与主机限流状态"""
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name="async-fetcher", daemon=True)
+                thread.start()
+                asyncio.run_coroutine_threadsafe(self._setup(), loop).result()
+                self._loop, self._thread = loop, thread
+            return self._loop
+
+    async def _setup(self):
+        # asyncio 原语与 httpx 客户端需要在事件循环所在的线程中创建
+        self._slots = asyncio.Semaphore(self.concurrency)
+        limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+        headers = {"User-Agent": self.user_agent} if self.user_agent else None
+        self._client = httpx.AsyncClient(timeout=self.timeout, limits=limits, headers=headers, follow_redirects=True)
+
+    async def _fetch_one(self, url: str) -> Tuple[bytes, Optional[str]]:
+        host = self._hosts.setdefault(urlparse(url).netloc, _HostState(self.per_host))
+        async with self._slots:
+            return await self._fetch(self._client, host, url)
+
+    def fetch(self, url: str) -> Tuple[bytes, Optional[str]]:
+        """
+        在共享事件循环中下载单个 URL 并等待结果（线程安全，供多个提取分支并发调用）。
+        Returns: (正文字节, 编码)；重试耗尽后抛出异常。
+        """
+        future = asyncio.run_coroutine_threadsafe(self._fetch_one(url), self._ensure_loop())
+        try:
+            return future.result()
+        except BaseException:
+            future.cancel()
+            raise
+
+    def close(self):
+        """取消仍在进行的请求，关闭 httpx 客户端并停止事件循环"""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = None
+        if loop is None:
+            return
+
+        async def shutdown():
+            # 调用方已放弃等待（中断、超时）的请求可能仍在排队或下载，先取消，避免循环停止时遗留任务
+            current = asyncio.current_task()
+            tasks = [task for task in asyncio.all_tasks() if task is not current]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self._client.aclose()
+
+        try:
+            asyncio.run_coroutine_threadsafe(shutdown(), loop).result(timeout=self.timeout)
+        except Exception as e:
+            logger.warning(f"Failed to close async fetcher cleanly: {e}")
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+        self._hosts.clear()
@@ -0,0 +1,133 @@
+import hashlib
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# 不影响页面内容的查询参数
+_TRACKING_PARAMS = re.compile(r"^(utm_\w+|ref|source|fbclid|gclid)$", re.IGNORECASE)
+# 只去掉目录索引文件名；/readme 等是独立页面，不能合并
+_INDEX_PAGES = re.compile(r"/index(\.html?|\.md)?$", re.IGNORECASE)
+_WORDS = re.compile(r"\w+", re.UNICODE)
+
+def canonicalize_url(url: str) -> str:
+    """
+    URL 规范化：协议与主机名小写、去掉默认端口与锚点、去掉跟踪参数并排序其余参数、
+    去掉末尾的 /index(.html) 与斜杠。规范化结果相同的 URL 视为同一页面。
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and (scheme, parts.port) not in (("http", 80), ("https", 443)):
+        host = f"{host}:{parts.port}"
+    path = re.sub(r"/{2,}", "/", parts.path)
+    path = _INDEX_PAGES.sub("", path).rstrip("/") or "/"
+    query = urlencode(sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+                             if not _TRACKING_PARAMS.match(k)))
+    return urlunsplit((scheme, host, path, query, ""))
+
+def simhash(text: str, shingle: int = 3) -> Optional[int]:
+    """
+    64 位 SimHash：对词级 shingle 取哈希后按位加权投票。内容相近的页面指纹的汉明距离小。
+    词数不足以形成 shingle 时返回 None。
+    """
+    words = _WORDS.findall(text.lower())
+    if len(words) < shingle:
+        return None
+    weights = [0] * 64
+    for i in range(len(words) - shingle + 1):
+        h = int.from_bytes(hashlib.blake2b(" ".join(words[i:i + shingle]).encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(64):
+            weights[bit] += 1 if h >> bit & 1 else -1
+    return sum(1 << bit for bit in range(64) if weights[bit] > 0)
+
+class DuplicateDetector:
+    """
+    抓取之后、LLM 分析之前的去重：内容哈希完全相同，或 SimHash 汉明距离不超过 max_distance。
+    SimHash 分为 max_distance + 1 段建立倒排：距离不超过 max_distance 的两个指纹至少有一段完全相同（抽屉原理），
+    查询只需比较同段的候选而不是全部页面。阈值越大段越短，候选越多。
+    线程安全，同一项目的所有提取分支共享一个实例。
+    """
+
+    def __init__(self, max_distance: int = 3, min_words: int = 50):
+        self.max_distance = max_distance
+        # 词数过少的页面（导航页、占位页）SimHash 不稳定，只做精确匹配
+        self.min_words = min_words
+        self._exact: Dict[str, str] = {}  # 正文哈希 -> 规范页面 URL
+        # 各段的 (起始位, 位数)，64 位不能整除时前面的段多 1 位
+        bands = min(64, max(1, max_distance + 1))
+        widths = [64 // bands + (1 if i < 64 % bands else 0) for i in range(bands)]
+        self._band_spans = [(sum(widths[:i]), width) for i, width in enumerate(widths)]
+        self._bands: List[Dict[int, List[Tuple[int, str]]]] = [{} for _ in range(bands)]
+        self._lock = threading.Lock()
+        self.stats = {"url_aliases": 0, "exact": 0, "near": 0}
+
+    def _band_keys(self, fingerprint: int):
+        return [(fingerprint >> start) & ((1 << width) - 1) for start, width in self._band_spans]
+
+    def _add(self, url: str, content_hash: Optional[str], fingerprint: Optional[int]):
+        if content_hash:
+            self._exact.setdefault(content_hash, url)
+        if fingerprint is not None:
+            for band, key in zip(self._bands, self._band_keys(fingerprint)):
+                band.setdefault(key, []).append((fingerprint, url))
+
+    def add(self, url: str, content_hash: Optional[str], fingerprint: Optional[int]):
+        """登记已处理的规范页面（恢复运行时从已有结果中重建）"""
+        with self._lock:
+            self._add(url, content_hash, fingerprint)
+
+    def fingerprint(self, text: str) -> Optional[int]:
+        if len(_WORDS.findall(text)) < self.min_words:
+            return None
+        return simhash(text)
+
+    def claim(self, url: str, content_hash: Optional[str], fingerprint: Optional[int]) -> Optional[Tuple[str, str]]:
+        """
+        检查页面是否重复；不重复时登记为规范页面（检查与登记是原子的，并发分支不会互相漏判）。
+        Returns: (规范页面 URL, 重复类型 exact / near)，不重复时返回 None
+        """
+        with self._lock:
+            canonical = self._exact.get(content_hash) if content_hash else None
+            if canonical and canonical != url:
+                self.stats["exact"] += 1
+                return canonical, "exact"
+            if fingerprint is not None and self.max_distance >= 0:
+                for band, key in zip(self._bands, self._band_keys(fingerprint)):
+                    for other, other_url in band.get(key, ()):
+                        if other_url != url and (fingerprint ^ other).bit_count() <= self.max_distance:
+                            self.stats["near"] += 1
+                            return other_url, "near"
+            self._add(url, content_hash, fingerprint)
+            return None
+
+    def group_urls(self, urls: List[str]) -> Tuple[List[str], Dict[str, str]]:
+        """
+        按规范化 URL 分组。Returns: (每组保留的第一个 URL, 别名 URL -> 保留的 URL)
+        """
+        first: Dict[str, str] = {}
+        kept, aliases = [], {}
+        for url in urls:
+            key = canonicalize_url(url)
+            if key in first:
+                aliases[url] = first[key]
+            else:
+                first[key] = url
+                kept.append(url)
+        with self._lock:
+            self.stats["url_aliases"] += len(aliases)
+        return kept, aliases
+
+    def saved_calls(self) -> int:
+        return sum(self.stats.values())
+
+_detectors: Dict[Tuple[str, int], DuplicateDetector] = {}
+_detectors_lock = threading.Lock()
+
+def get_detector(project_name: str, max_distance: int = 3) -> DuplicateDetector:
+    """每个项目、每个距离阈值共享一个去重器（线程安全）"""
+    key = (project_name, max_distance)
+    with _detectors_lock:
+        if key not in _detectors:
+            _detectors[key] = DuplicateDetector(max_distance=max_distance)
+        return _detectors[key]
@@ -1,10 +1,18 @@
-from typing import List, Dict, Optional
+from typing import Optional, Tuple, Union
+import atexit
 import concurrent.futures
+import multiprocessing
+import os
+import threading
 import requests
 import trafilatura
+from requests.adapters import HTTPAdapter
 from loguru import logger
 from pydantic import BaseModel
-from bs4 import BeautifulSoup
+from trafilatura.utils import load_html
+from src.utils.config import settings, PipelineSettings
+from src.utils.http_cache import HttpCache, http_cache
+from src.core.async_fetcher import AsyncFetcher
 
 class PageContent(BaseModel):
     url: str
@@ -12,98 +20,154 @@ class PageContent(BaseModel):
     content: Optional[str] = None
     error: Optional[str] = None
 
+def _node_text(tree, xpath: str) -> Optional[str]:
+    nodes = tree.xpath(xpath)
+    if nodes:
+        text = nodes[0].text_content().strip()
+        if text:
+            return text
+    return None
+
+def parse_page(url: str, html: Union[str, bytes]) -> PageContent:
+    """
+    从 HTML 中提取正文与标题。
+    页面只解析一次：同一棵 lxml 树既交给 trafilatura 提取正文，也用于读取 <title> / <h1>。
+    """
+    tree = load_html(html)
+    if tree is None:
+        return PageContent(url=url, error="Invalid HTML")
+    
+    # 标题：<title>，其次第一个 <h1>
+    title = _node_text(tree, '//title') or _node_text(tree, '//h1')
+    
+    # 使用 trafilatura 提取正文
+    document = trafilatura.bare_extraction(tree, include_comments=False, include_tables=True)
+    
+    text = None
+    if document:
+        # trafilatura 2.x 返回 Document 对象，旧版本返回 dict
+        text = document.get('text') if isinstance(document, dict) else getattr(document, 'text', None)
+    
+    if not text:
+        return PageContent(url=url, title=title, error="No content extracted")
+        
+    return PageContent(url=url, title=title, content=text)
+
+def parse_raw_page(url: str, content: bytes, encoding: Optional[str] = None) -> PageContent:
+    """
+    从原始字节解析页面。为模块级函数，可直接提交给进程池。
+    编码未知时交由 trafilatura 自动识别。
+    """
+    html = content.decode(encoding, errors="replace") if encoding else content
+    return parse_page(url, html)
+
 class Extractor:
     """
     负责从 URL 提取正文内容。
-    使用 requests 下载 + trafilatura 提取。
+    下载由 requests 线程（thread）或共享的 asyncio 事件循环（async）完成，
+    trafilatura 解析在调用线程（thread）或共享进程池（process）中完成。
     """
     
-    def __init__(self, max_workers: int = 5, timeout: int = 10, user_agent: str = None):
+    def __init__(self, max_workers: int = 5, timeout: int = 10, user_agent: str = None,
+                 cache: Optional[HttpCache] = None, parse_mode: str = "thread", parse_workers: int = 0,
+                 fetch_backend: str = "thread", async_fetcher: Optional[AsyncFetcher] = None):
         self.max_workers = max_workers
+        # 条件请求缓存，未变化的页面由 304 + 本地副本提供
+        self.cache = cache
+        # thread: 在调用线程中解析
+        # process: 解析交给共享进程池，绕开 GIL，吞吐随 CPU 核数扩展
+        if parse_mode not in ("thread", "process"):
+            raise ValueError(f"Unknown parse_mode: {parse_mode}")
+        self.parse_mode = parse_mode
+        self.parse_workers = parse_workers or os.cpu_count() or 1
+        self._parse_pool: Optional[concurrent.futures.ProcessPoolExecutor] = None
+        self._parse_pool_lock = threading.Lock()
         self.timeout = timeout
         self.user_agent = user_agent or 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.114 Safari/537.36'
+        # thread: requests 会话；async: 所有调用方共享一个 asyncio + httpx 事件循环，按主机限流并复用连接
+        if fetch_backend not in ("thread", "async"):
+            raise ValueError(f"Unknown fetch_backend: {fetch_backend}")
+        self.fetch_backend = fetch_backend
+        self.async_fetcher = async_fetcher or AsyncFetcher(timeout=timeout, cache=cache)
+        if not self.async_fetcher.user_agent:
+            self.async_fetcher.user_agent = self.user_agent
+        # 线程模式复用 keep-alive 连接，连接池大小与并发调用数一致
+        self.session = requests.Session()
+        self.session.headers.update({'User-Agent': self.user_agent})
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
 
-    def _fetch_single(self, url: str) -> PageContent:
+    def _download(self, url: str) -> Tuple[bytes, Optional[str]]:
         """
-        抓取单个 URL 内容。
+        下载页面原始内容。Returns: (正文字节, 编码)
         """
-        headers = {'User-Agent': self.user_agent}
-        try:
-            logger.debug(f"Fetching content: {url}")
-            response = requests.get(url, headers=headers, timeout=self.timeout)
+        if self.fetch_backend == "async":
+            return self.async_fetcher.fetch(url)
+        logger.debug(f"Fetching content: {url}")
+        if self.cache:
+            response = self.cache.fetch(self.session, url, timeout=self.timeout)
+        else:
+            response = self.session.get(url, timeout=self.timeout)
             response.raise_for_status()
-            
-            # 使用 trafilatura 提取
-            html = response.text
-            content = trafilatura.extract(html, include_comments=False, include_tables=True)
-            
-            # 尝试提取更多元数据
-            metadata = trafilatura.bare_extraction(html)
-            
-            meta_dict = {}
-            if metadata:
-                # trafilatura 2.x 返回 Document 对象，需要转换或属性访问
-                if hasattr(metadata, 'as_dict'):
-                    meta_dict = metadata.as_dict()
-                elif isinstance(metadata, dict):
-                    meta_dict = metadata
-                else:
-                    # Fallback for unknown object type
-                    if hasattr(metadata, 'title'):
-                        meta_dict['title'] = metadata.title
-                    if hasattr(metadata, 'text'):
-                        meta_dict['text'] = metadata.text
-            
-            title = meta_dict.get('title')
-            text = meta_dict.get('text') or content
-            
-            # Fallback for title extraction
-            if not title:
-                try:
-                    soup = BeautifulSoup(html, 'lxml')
-                    if soup.title and soup.title.string:
-                        title = soup.title.string.strip()
-                    if not title:
-                        h1 = soup.find('h1')
-                        if h1:
-                            title = h1.get_text().strip()
-                except Exception:
-                    pass
-            
-            if not text:
-                return PageContent(url=url, title=title, error="No content extracted")
-                
-            return PageContent(url=url, title=title, content=text)
-            
-        except Exception as e:
-            logger.error(f"Error extracting {url}: {e}")
-            return PageContent(url=url, error=str(e))
+        return response.content, response.encoding
 
-    def extract_batch(self, urls: List[str]) -> Dict[str, dict]:
+    def _parse_executor(self) -> concurrent.futures.ProcessPoolExecutor:
+        with self._parse_pool_lock:
+            if self._parse_pool is None:
+                # spawn：避免在已有线程的进程中 fork
+                self._parse_pool = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self.parse_workers, mp_context=multiprocessing.get_context("spawn"))
+            return self._parse_pool
+
+    def _parse(self, url: str, content: bytes, encoding: Optional[str]) -> PageContent:
+        if self.parse_mode == "process":
+            # 只传原始字节与紧凑的 PageContent，跨进程开销很小
+            return self._parse_executor().submit(parse_raw_page, url, content, encoding).result()
+        return parse_raw_page(url, content, encoding)
+
+    def fetch(self, url: str) -> PageContent:
         """
-        批量抓取内容。
-        Returns: Dict[url, PageContent.dict()]
+        抓取并解析单个 URL（提取图中每个 URL 分支调用，可多线程并发调用）。
+        下载异常直接抛出，由调用方决定是否重试；解析失败记录在 error 中。
         """
-        logger.info(f"Starting extraction for {len(urls)} URLs with {self.max_workers} workers...")
-        results = {}
-        
-        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            future_to_url = {executor.submit(self._fetch_single, url): url for url in urls}
-            
-            for future in concurrent.futures.as_completed(future_to_url):
-                url = future_to_url[future]
-                try:
-                    data = future.result()
-                    results[url] = data.model_dump()
-                    if data.error:
-                        logger.warning(f"Failed to extract {url}: {data.error}")
-                    else:
-                        logger.success(f"Extracted {len(data.content)} chars from {url}")
-                except Exception as e:
-                    logger.error(f"Exception for {url}: {e}")
-                    results[url] = {"url": url, "error": str(e)}
-                    
-        return results
+        content, encoding = self._download(url)
+        try:
+            page = self._parse(url, content, encoding)
+        except Exception as e:
+            logger.error(f"Error extracting {url}: {e}")
+            page = PageContent(url=url, error=str(e))
+        return self._report(page)
+
+    def _report(self, page: PageContent) -> PageContent:
+        if page.error:
+            logger.warning(f"Failed to extract {page.url}: {page.error}")
+        else:
+            logger.success(f"Extracted {len(page.content)} chars from {page.url}")
+        return page
+
+    def close(self):
+        """关闭解析进程池与异步抓取的事件循环（进程退出时自动调用）"""
+        with self._parse_pool_lock:
+            if self._parse_pool is not None:
+                self._parse_pool.shutdown(cancel_futures=True)
+                self._parse_pool = None
+        self.async_fetcher.close()
 
 # 单例
-extractor = Extractor()
+_pipeline_settings = settings.pipeline if settings else PipelineSettings()
+extractor = Extractor(
+    # 提取图中同时运行的分支数即并发下载数
+    max_workers=max(1, _pipeline_settings.max_concurrency),
+    cache=http_cache,
+    parse_mode=_pipeline_settings.extract_mode,
+    parse_workers=_pipeline_settings.parse_workers,
+    fetch_backend=_pipeline_settings.fetch_backend,
+    async_fetcher=AsyncFetcher(
+        concurrency=_pipeline_settings.async_concurrency,
+        per_host=_pipeline_settings.per_host_limit,
+        politeness_delay=_pipeline_settings.politeness_delay,
+        cache=http_cache
+    )
+)
+atexit.register(extractor.close)
@@ -0,0 +1,304 @@
+import atexit
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Dict, Iterator, Optional, Tuple
+from urllib.parse import urlparse
+from loguru import logger
+from src.utils.config import settings, GenerationSettings
+
+class FileFragmentBackend:
+    """
+    每个 URL 一个 JSON 文件（文件名由 URL 路径推导）。
+    片段引用即文件路径。不同 URL 可能映射到同一文件名而互相覆盖，页面很多时小文件也会拖慢文件系统。
+    """
+
+    def __init__(self, fragments_dir: str):
+        self.fragments_dir = fragments_dir
+
+    def path_for(self, url: str, url_prefix: str = "") -> str:
+        """
+        根据 URL 计算片段文件路径。
+        """
+        # Determine filename based on URL and prefix
+        if url_prefix and url.startswith(url_prefix):
+            name = url[len(url_prefix):].strip("/").replace("/", "_")
+            if not name:
+                name = "index"
+            filename = f"{name}.json"
+        else:
+            # Fallback logic: use path-based name if possible, otherwise hash
+            path = urlparse(url).path.strip("/")
+            if path:
+                filename = f"{path.replace('/', '_')}.json"
+            else:
+                url_hash = hashlib.md5(url.encode()).hexdigest()
+                filename = f"{url_hash}.json"
+
+        return os.path.join(self.fragments_dir, filename)
+
+    def load(self, url: str, url_prefix: str = "") -> Optional[Tuple[str, Dict[str, Any]]]:
+        """Returns: (片段引用, 片段内容)，不存在或属于其他 URL 时返回 None"""
+        filepath = self.path_for(url, url_prefix)
+        if not os.path.exists(filepath):
+            return None
+        with open(filepath, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return (filepath, data) if data.get("url") == url else None
+
+    def save(self, url: str, data: Dict[str, Any], url_prefix: str = "") -> str:
+        from src.core.indexer import get_manifest
+
+        filepath = self.path_for(url, url_prefix)
+        with open(filepath, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+
+        # 同步更新片段清单，下次 build_index 无需重新解析该文件
+        try:
+            get_manifest(self.fragments_dir).record(filepath, data)
+        except Exception as e:
+            logger.warning(f"Failed to update fragment manifest for {filepath}: {e}")
+        return filepath
+
+class JsonlFragmentBackend:
+    """
+    追加写入的 JSONL 片段日志：fragments/fragments.jsonl，每行一个紧凑 JSON。
+    以 URL 为键，同一 URL 再次保存时追加新行，旧行在压缩 (compact) 时清除。
+    内存中维护 URL -> (字节偏移, 长度) 索引用于随机读取，关闭时写入 fragments.idx 旁路文件，
+    下次打开只需扫描旁路文件记录之后新增的部分。整个项目的片段可一次顺序读完。
+    仅支持单进程写入。
+    片段引用为 "<日志路径>#<URL>"，压缩后依然有效。
+    """
+
+    LOG_NAME = "fragments.jsonl"
+    INDEX_NAME = "fragments.idx"
+
+    def __init__(self, fragments_dir: str, fsync: str = "close"):
+        # always: 每次追加后 fsync；close: 每次追加只 flush，关闭时 fsync；never: 只 flush
+        if fsync not in ("always", "close", "never"):
+            raise ValueError(f"Unknown fsync policy: {fsync}")
+        self.fragments_dir = fragments_dir
+        self.fsync = fsync
+        self.log_path = os.path.join(fragments_dir, self.LOG_NAME)
+        self.index_path = os.path.join(fragments_dir, self.INDEX_NAME)
+        self._lock = threading.RLock()
+        self._offsets: Dict[str, Tuple[int, int]] = {}
+        self._writer = None
+        self._reader = None
+        self._size = 0
+        self._dirty = False
+        self._open()
+
+    def ref(self, url: str) -> str:
+        return f"{self.log_path}#{url}"
+
+    def _open(self):
+        os.makedirs(self.fragments_dir, exist_ok=True)
+        with open(self.log_path, "ab"):
+            pass
+        size = os.path.getsize(self.log_path)
+        start = 0
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+            if saved.get("size", 0) <= size:
+                self._offsets = {url: tuple(pos) for url, pos in saved["offsets"].items()}
+                start = saved["size"]
+        except (OSError, ValueError, KeyError):
+            pass
+        valid_end = self._scan(start)
+        if valid_end < size:
+            # 上次写入中途崩溃留下的不完整行，截断后再追加
+            logger.warning(f"Truncating {size - valid_end} bytes of incomplete fragment data in {self.log_path}")
+            with open(self.log_path, "r+b") as f:
+                f.truncate(valid_end)
+            self._dirty = True
+        self._size = valid_end
+        if start < valid_end:
+            self._dirty = True
+
+    def _scan(self, start: int) -> int:
+        """
+        从 start 开始扫描日志、更新偏移索引，返回最后一个完整行的结束位置。
+        中间损坏的行（有换行但无法解析）跳过并保留在文件中，压缩时清除；
+        只有末尾缺少换行的不完整行不计入。
+        """
+        offset = start
+        skipped = 0
+        with open(self.log_path, "rb") as f:
+            f.seek(start)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    self._offsets[json.loads(line)["url"]] = (offset, len(line))
+                except (ValueError, KeyError, TypeError):
+                    skipped += 1
+                offset += len(line)
+        if skipped:
+            logger.warning(f"Skipped {skipped} corrupt lines in {self.log_path}; run compaction to remove them")
+        return offset
+
+    def _files(self):
+        if self._writer is None:
+            self._writer = open(self.log_path, "ab")
+            self._reader = open(self.log_path, "rb")
+        return self._writer, self._reader
+
+    def __contains__(self, url: str) -> bool:
+        return url in self._offsets
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def read(self, url: str) -> Optional[Tuple[Dict[str, Any], int]]:
+        """按偏移索引随机读取一行。Returns: (片段内容, 字节数)，不存在时返回 None"""
+        with self._lock:
+            position = self._offsets.get(url)
+            if position is None:
+                return None
+            _, reader = self._files()
+            reader.seek(position[0])
+            line = reader.read(position[1])
+        return json.loads(line), len(line)
+
+    def load(self, url: str, url_prefix: str = "") -> Optional[Tuple[str, Dict[str, Any]]]:
+        """Returns: (片段引用, 片段内容)，不存在时返回 None"""
+        loaded = self.read(url)
+        return (self.ref(url), loaded[0]) if loaded else None
+
+    def save(self, url: str, data: Dict[str, Any], url_prefix: str = "") -> str:
+        line = (json.dumps(data, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+        with self._lock:
+            writer, _ = self._files()
+            writer.write(line)
+            writer.flush()
+            if self.fsync == "always":
+                os.fsync(writer.fileno())
+            self._offsets[url] = (self._size, len(line))
+            self._size += len(line)
+            self._dirty = True
+        return self.ref(url)
+
+    def iter_records(self) -> Iterator[Tuple[str, Dict[str, Any], int]]:
+        """
+        一次顺序读取整个日志，按文件顺序产出每个 URL 的最新片段。Returns: (片段引用, 片段内容, 字节数)
+        """
+        with self._lock:
+            live = {offset: url for url, (offset, _) in self._offsets.items()}
+            end = self._size
+            if self._writer is not None:
+                self._writer.flush()
+        offset = 0
+        with open(self.log_path, "rb", buffering=1024 * 1024) as f:
+            for line in f:
+                if offset >= end:
+                    break
+                url = live.get(offset)
+                offset += len(line)
+                if url is not None:
+                    yield self.ref(url), json.loads(line), len(line)
+
+    def _save_index(self):
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"size": self._size, "offsets": self._offsets}, f, separators=(",", ":"))
+        os.replace(tmp_path, self.index_path)
+        self._dirty = False
+
+    def close(self):
+        with self._lock:
+            if self._writer is not None:
+                self._writer.flush()
+                if self.fsync != "never":
+                    os.fsync(self._writer.fileno())
+                self._writer.close()
+                self._reader.close()
+                self._writer = self._reader = None
+            if self._dirty:
+                self._save_index()
+
+    def compact(self) -> Tuple[int, int]:
+        """
+        重写日志，只保留每个 URL 的最新片段。Returns: (压缩前字节数, 压缩后字节数)
+        """
+        with self._lock:
+            self.close()
+            before = self._size
+            tmp_path = f"{self.log_path}.tmp"
+            offsets: Dict[str, Tuple[int, int]] = {}
+            size = 0
+            with open(self.log_path, "rb") as src, open(tmp_path, "wb", buffering=1024 * 1024) as dst:
+                for url, (offset, length) in sorted(self._offsets.items(), key=lambda item: item[1][0]):
+                    src.seek(offset)
+                    dst.write(src.read(length))
+                    offsets[url] = (size, length)
+                    size += length
+                dst.flush()
+                os.fsync(dst.fileno())
+            os.replace(tmp_path, self.log_path)
+            self._offsets = offsets
+            self._size = size
+            self._save_index()
+        return before, size
+
+    def import_files(self) -> int:
+        """把目录中已有的逐页 JSON 片段追加进日志（日志中已有的 URL 跳过）。Returns: 导入数量"""
+        imported = 0
+        with os.scandir(self.fragments_dir) as it:
+            for entry in it:
+                if not entry.name.endswith(".json"):
+                    continue
+                try:
+                    with open(entry.path, "r", encoding="utf-8") as f:
+                        data = json.load(f)
+                except Exception as e:
+                    logger.warning(f"Failed to read fragment {entry.name}: {e}")
+                    continue
+                url = data.get("url")
+                if url and url not in self:
+                    self.save(url, data)
+                    imported += 1
+        return imported
+
+def read_fragment(ref: str) -> Tuple[Dict[str, Any], int]:
+    """
+    按片段引用读取内容（文件路径或 JSONL 引用）。Returns: (片段内容, 字节数)
+    """
+    log_path, sep, url = ref.partition("#")
+    if sep and os.path.basename(log_path) == JsonlFragmentBackend.LOG_NAME:
+        loaded = get_fragment_backend(os.path.dirname(log_path), backend="jsonl").read(url)
+        if loaded is None:
+            raise KeyError(f"Fragment not found: {ref}")
+        return loaded
+    with open(ref, "r", encoding="utf-8") as f:
+        raw = f.read()
+    return json.loads(raw), len(raw)
+
+_backends: Dict[Tuple[str, str], Any] = {}
+_backends_lock = threading.Lock()
+
+def get_fragment_backend(fragments_dir: str, backend: Optional[str] = None):
+    """
+    每个片段目录共享一个后端实例（线程安全）。backend 默认取 FRAGMENT_BACKEND 配置：files 或 jsonl。
+    """
+    generation = settings.generation if settings else GenerationSettings()
+    kind = backend or generation.fragment_backend
+    key = (os.path.abspath(fragments_dir), kind)
+    with _backends_lock:
+        if key not in _backends:
+            if kind == "files":
+                _backends[key] = FileFragmentBackend(fragments_dir)
+            elif kind == "jsonl":
+                _backends[key] = JsonlFragmentBackend(fragments_dir, fsync=generation.fragment_fsync)
+            else:
+                raise ValueError(f"Unknown fragment backend: {kind}")
+        return _backends[key]
+
+@atexit.register
+def _close_backends():
+    with _backends_lock:
+        for backend in _backends.values():
+            if isinstance(backend, JsonlFragmentBackend):
+                backend.close()
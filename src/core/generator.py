@@ -1,14 +1,22 @@
 import concurrent.futures
 import hashlib
-import json
-import os
-from typing import List, Dict, Optional, Literal
+import re
+import threading
+from typing import List, Dict, Iterator, Optional, Literal, Tuple
 from pydantic import BaseModel, Field
+from langchain_core.exceptions import OutputParserException
+from langchain_core.messages import HumanMessage
+from langchain_core.prompt_values import ChatPromptValue
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_openai import ChatOpenAI
 from langchain_core.output_parsers import PydanticOutputParser, StrOutputParser
 from loguru import logger
 from src.utils.config import settings
+from src.core.llm_client import LLMClient, is_retryable, rate_limiter
+from src.utils.llm_cache import llm_cache
+from src.utils.llm_metrics import llm_metrics
+from src.core.fragment_backend import FileFragmentBackend, get_fragment_backend, read_fragment
+from src.utils.tokens import estimate_tokens, split_by_tokens
 
 # 定义输出结构
 class KnowledgePoint(BaseModel):
@@ -25,6 +33,23 @@ class PageAnalysis(BaseModel):
     )
     knowledge_points: List[KnowledgePoint] = Field(..., description="页面中包含的知识点列表")
 
+class PackedPage(BaseModel):
+    url: str = Field(..., description="页面 URL，必须与输入中的 URL 完全一致")
+    analysis: PageAnalysis
+
+class PackedAnalysis(BaseModel):
+    pages: List[PackedPage] = Field(..., description="每个输入页面对应一项分析结果")
+
+# 合并分析的输出格式说明。字段含义已在系统提示中说明，这里只给出结构，
+# 比 PydanticOutputParser 生成的完整 JSON Schema 少一半以上的 token；解析仍按 PackedAnalysis 校验
+PACK_FORMAT_INSTRUCTIONS = (
+    "只输出一个 JSON 对象，不要包含其他文字，结构如下：\n"
+    '{"pages": [{"url": "输入中的页面 URL，原样返回", "analysis": {"summary": "页面总结", '
+    '"page_type": "Index | Concept | Guide | Reference | Other", '
+    '"knowledge_points": [{"concept": "概念名 (中文译名)", "explanation": "一句话解释", '
+    '"tags": ["标签"], "importance": 1-5 的整数}]}}]}'
+)
+
 class Generator:
     """
     负责调用 LLM 分析内容并生成大纲。
@@ -45,26 +70,65 @@ class Generator:
             model=settings.llm.model,
             openai_api_key=settings.llm.api_key,
             openai_api_base=settings.llm.base_url,
-            temperature=0.1
+            temperature=0.1,
+            # 重试由 LLMClient 统一处理（带抖动退避并遵守限流）
+            max_retries=0
         )
+        self.client = LLMClient(self.llm, rate_limiter=rate_limiter, max_retries=settings.llm.max_retries,
+                                cache=llm_cache, metrics=llm_metrics)
         
         self.parser = PydanticOutputParser(pydantic_object=PageAnalysis)
         
+        analyze_system = ("你是一个专家级的知识整理助手。你的任务是从给定的技术文档内容中，提取核心知识脉络。\n"
+                          "请仔细阅读内容，识别出关键的概念、原理或步骤，并判断页面类型。\n"
+                          "要求：\n"
+                          "1. **输出语言必须为中文**（专有名词除外）。\n"
+                          "2. **专有名词保留原有英文**，并在括号中补充中文翻译（如果有通用译名）。\n"
+                          "3. **解释风格 (利于记忆与检索)**：\n"
+                          "   - 采用 **'定义/原理 + 核心作用/场景'** 的结构。\n"
+                          "   - 语言需简练有力，类似'技术闪卡'，避免废话。\n"
+                          "   - 确保关键信息高密度呈现。\n"
+                          "输出必须严格遵循 JSON 格式。\n"
+                          "{format_instructions}")
         self.analyze_prompt = ChatPromptTemplate.from_messages([
-            ("system", "你是一个专家级的知识整理助手。你的任务是从给定的技术文档内容中，提取核心知识脉络。\n"
-                       "请仔细阅读内容，识别出关键的概念、原理或步骤，并判断页面类型。\n"
-                       "要求：\n"
-                       "1. **输出语言必须为中文**（专有名词除外）。\n"
-                       "2. **专有名词保留原有英文**，并在括号中补充中文翻译（如果有通用译名）。\n"
-                       "3. **解释风格 (利于记忆与检索)**：\n"
-                       "   - 采用 **'定义/原理 + 核心作用/场景'** 的结构。\n"
-                       "   - 语言需简练有力，类似'技术闪卡'，避免废话。\n"
-                       "   - 确保关键信息高密度呈现。\n"
-                       "输出必须严格遵循 JSON 格式。\n"
-                       "{format_instructions}"),
+            ("system", analyze_system),
             ("user", "标题: {title}\n\n内容:\n{content}")
         ])
         
+        # 多个短页面合并为一次调用，结果按 URL 返回
+        self.pack_parser = PydanticOutputParser(pydantic_object=PackedAnalysis)
+        self.pack_prompt = ChatPromptTemplate.from_messages([
+            ("system", analyze_system),
+            ("user", "以下包含多个页面，每个页面以 '=== URL: ... ===' 开头。请分别分析每个页面，"
+                     "并按 URL 返回结果。\n\n{pages}")
+        ])
+        
+        generation = settings.generation
+        self.chunk_tokens = max(500, generation.chunk_tokens)
+        self.chunk_workers = max(1, generation.chunk_workers)
+        
+        # 提示词固定开销（系统提示 + 格式说明），用于统计合并分析节省的 token
+        self.page_overhead_tokens = estimate_tokens(self.analyze_prompt.invoke({
+            "title": "", "content": "", "format_instructions": self.parser.get_format_instructions()}).to_string())
+        self.pack_overhead_tokens = estimate_tokens(self.pack_prompt.invoke({
+            "pages": "", "format_instructions": PACK_FORMAT_INSTRUCTIONS}).to_string())
+        self.pack_stats = {"calls": 0, "pages": 0, "fallback_pages": 0, "tokens_saved": 0}
+        self._stats_lock = threading.Lock()
+        
+        # parser: 提示词中给出 JSON 格式说明并解析文本；structured: 使用模型的结构化输出接口，不再发送格式说明
+        if generation.output_mode not in ("parser", "structured"):
+            raise ValueError(f"Unknown output_mode: {generation.output_mode}")
+        self.output_mode = generation.output_mode
+        self.repair_attempts = max(0, generation.repair_attempts)
+        self.repair_template = ("你上一次的输出未通过格式校验。\n错误：{error}\n\n上一次的输出：\n{output}\n\n"
+                                "请修正上述错误，重新输出完整结果。")
+        # 本次运行的输出校验统计：调用次数、校验失败次数、修复调用次数及其提示词 token、最终失败次数
+        self.output_stats = {"calls": 0, "failures": 0, "repairs": 0, "repair_tokens": 0, "failed": 0}
+        
+        # 提示词与模型版本，写入片段中用于增量运行时判断是否需要重新分析
+        self.model_name = settings.llm.model
+        self.prompt_version = self._prompt_fingerprint()
+        
         self.merge_prompt = ChatPromptTemplate.from_messages([
             ("system", "你是一个专业的技术文档编辑。你的任务是将多个独立的文档分析片段整合为一个逻辑连贯、结构清晰的完整技术指南。\n"
                        "输入是一组相关的知识点和总结。\n"
@@ -76,6 +140,36 @@ class Generator:
                        "输出格式：标准的 Markdown 文档。"),
             ("user", "以下是待整合的文档片段：\n\n{fragments}")
         ])
+        
+        # 树形归约的中间合并与最终合并
+        self.reduce_prompt = ChatPromptTemplate.from_messages([
+            ("system", "你是一个技术文档编辑。你的任务是将多个 Markdown 草稿合并为一个连贯的部分。\n"
+                       "要求：合并重复内容，保留所有具体技术细节，按主题重新组织小节。\n"
+                       "不要添加总标题和序言。输出格式：标准的 Markdown 文档。"),
+            ("user", "以下是待合并的草稿：\n\n{drafts}")
+        ])
+        self.final_prompt = ChatPromptTemplate.from_messages([
+            ("system", "你是一个主编。你的任务是将多个 Markdown 章节整合成一篇完整的文档。\n"
+                       "请统一格式，添加总标题和序言，并确保各章节过渡自然。\n"
+                       "不要删除具体内容，只是进行组织和润色。"),
+            ("user", "以下是各章节草稿：\n\n{drafts}")
+        ])
+        self.integrate_batch_tokens = max(1000, generation.integrate_batch_tokens)
+        self.integrate_context_tokens = max(self.integrate_batch_tokens, generation.integrate_context_tokens)
+        self.integrate_workers = max(1, generation.integrate_workers)
+
+    def _prompt_fingerprint(self) -> str:
+        """
+        单页与合并分析的提示词模板、输出格式说明，加上输出模式与 schema 的短哈希。
+        片段可能来自任一提示词，修改其中之一都使已有片段失效；parser / structured 两种模式的结果互不复用
+        """
+        parts = [f"{self.output_mode}:{self.parser.pydantic_object.__name__}:{self.pack_parser.pydantic_object.__name__}"]
+        for prompt, instructions in ((self.analyze_prompt, self.parser.get_format_instructions()),
+                                     (self.pack_prompt, PACK_FORMAT_INSTRUCTIONS)):
+            parts.extend(f"{type(m).__name__}:{getattr(getattr(m, 'prompt', None), 'template', '')}"
+                         for m in prompt.messages)
+            parts.append(instructions)
+        return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()[:12]
 
     def _format_importance(self, level: int) -> str:
         """
@@ -93,7 +187,7 @@ class Generator:
 
     def analyze_page(self, title: str, content: str) -> Optional[PageAnalysis]:
         """
-        分析单个页面内容。
+        分析单个页面内容，失败时返回 None；429 / 5xx / 连接类错误直接抛出，由调用方决定是否重试。
         """
         # Mock Response
         if self.is_mock_mode:
@@ -111,126 +205,325 @@ class Generator:
                 ]
             )
 
+        # 超长页面按 token 切块，并行分析后合并，不再截断丢弃内容
+        chunks = split_by_tokens(content, self.chunk_tokens)
+        if len(chunks) <= 1:
+            try:
+                logger.info(f"Analyzing page: {title}")
+                return self._analyze_text(title, content)
+            except Exception as e:
+                # 限流 / 服务端错误在客户端重试耗尽后抛给调用方（提取图的分支会整页重试），其余错误返回 None
+                if is_retryable(e):
+                    raise
+                logger.error(f"Error analyzing page {title}: {e}")
+                return None
+
+        logger.info(f"Analyzing page: {title} in {len(chunks)} chunks")
+
+        def analyze_chunk(index: int, chunk: str) -> Optional[PageAnalysis]:
+            try:
+                return self._analyze_text(f"{title} (第 {index + 1}/{len(chunks)} 部分)", chunk)
+            except Exception as e:
+                if is_retryable(e):
+                    raise
+                logger.error(f"Error analyzing chunk {index + 1}/{len(chunks)} of {title}: {e}")
+                return None
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(self.chunk_workers, len(chunks))) as executor:
+            analyses = list(executor.map(analyze_chunk, range(len(chunks)), chunks))
+
+        analyses = [a for a in analyses if a is not None]
+        if not analyses:
+            return None
+        if len(analyses) < len(chunks):
+            logger.warning(f"{len(chunks) - len(analyses)}/{len(chunks)} chunks of {title} failed, merging the rest")
+        return self.merge_analyses(analyses)
+
+    def _analyze_text(self, title: str, content: str) -> PageAnalysis:
+        """单次 LLM 调用分析一段正文（校验失败时有限次修复），失败时抛出异常"""
+        prompt_value = self.analyze_prompt.invoke({
+            "title": title, 
+            "content": content,
+            "format_instructions": self.parser.get_format_instructions() if self.output_mode == "parser" else ""
+        })
+        return self._invoke_validated(prompt_value, self.parser, call_site="analyze_page")
+
+    def _invoke_validated(self, prompt_value, parser: PydanticOutputParser, call_site: str):
+        """
+        调用 LLM 并按 parser 的 schema 校验结果。
+        校验失败时把错误与原始输出反馈给模型重新生成，最多 repair_attempts 次，仍失败则抛出 OutputParserException。
+        """
+        original = prompt_value
+        messages = prompt_value.to_messages()
+        for attempt in range(self.repair_attempts + 1):
+            with self._stats_lock:
+                self.output_stats["calls"] += 1
+                if attempt:
+                    self.output_stats["repairs"] += 1
+                    self.output_stats["repair_tokens"] += estimate_tokens(prompt_value.to_string())
+            try:
+                if self.output_mode == "structured":
+                    return self.client.invoke_structured(prompt_value, parser.pydantic_object, call_site=call_site,
+                                                         cache_prompt=original)
+                response = self.client.invoke(prompt_value, call_site=call_site, validate=parser.parse,
+                                              cache_prompt=original)
+                return parser.parse(response.content)
+            except OutputParserException as e:
+                with self._stats_lock:
+                    self.output_stats["failures"] += 1
+                    if attempt >= self.repair_attempts:
+                        self.output_stats["failed"] += 1
+                if attempt >= self.repair_attempts:
+                    raise
+                logger.warning(f"[{call_site}] Output failed validation, repair {attempt + 1}/{self.repair_attempts}")
+                repair = self.repair_template.format(error=str(e)[:1000], output=e.llm_output or "")
+                prompt_value = ChatPromptValue(messages=messages + [HumanMessage(content=repair)])
+
+    @staticmethod
+    def merge_analyses(analyses: List[PageAnalysis]) -> PageAnalysis:
+        """
+        合并同一页面各分块的分析结果：
+        总结按顺序拼接，页面类型取第一块，知识点按概念名去重（保留最高重要性并合并标签）。
+        """
+        merged: Dict[str, KnowledgePoint] = {}
+        for analysis in analyses:
+            for kp in analysis.knowledge_points:
+                # "Agent (智能体)" 与 "agent" 视为同一概念
+                key = " ".join(re.sub(r"[(（].*?[)）]", "", kp.concept).lower().split()) or kp.concept
+                existing = merged.get(key)
+                if existing is None:
+                    merged[key] = kp.model_copy(deep=True)
+                    continue
+                if kp.importance > existing.importance:
+                    existing.importance = kp.importance
+                    existing.explanation = kp.explanation
+                existing.tags.extend(t for t in kp.tags if t not in existing.tags)
+
+        return PageAnalysis(
+            summary="\n".join(a.summary.strip() for a in analyses if a.summary.strip()),
+            page_type=analyses[0].page_type,
+            knowledge_points=list(merged.values())
+        )
+
+    def analyze_pages(self, pages: List[Tuple[str, str, str]]) -> Dict[str, Optional[PageAnalysis]]:
+        """
+        将多个短页面合并为一次调用分析，系统提示与格式说明只发送一次。pages: [(url, title, content)]
+        Returns: Dict[url, PageAnalysis]。合并调用失败（含解析失败）或遗漏的页面逐个重新分析。
+        """
+        if len(pages) == 1 or self.is_mock_mode:
+            return {url: self.analyze_page(title, content) for url, title, content in pages}
+
+        results: Dict[str, Optional[PageAnalysis]] = {}
+        headers = [f"=== URL: {url} ===\n标题: {title}\n\n" for url, title, _ in pages]
         try:
-            # 截断过长的内容以避免 token 溢出
-            truncated_content = content[:15000]
-            
-            prompt_value = self.analyze_prompt.invoke({
-                "title": title, 
-                "content": truncated_content,
-                "format_instructions": self.parser.get_format_instructions()
+            text = "\n\n".join(header + content for header, (_, _, content) in zip(headers, pages))
+            prompt_value = self.pack_prompt.invoke({
+                "pages": text,
+                "format_instructions": PACK_FORMAT_INSTRUCTIONS if self.output_mode == "parser" else ""
             })
-            
-            logger.info(f"Analyzing page: {title}")
-            response = self.llm.invoke(prompt_value)
-            
-            # 解析结果
-            result = self.parser.parse(response.content)
-            return result
-            
+            logger.info(f"Analyzing {len(pages)} pages in one call: {', '.join(title for _, title, _ in pages)}")
+            packed = self._invoke_validated(prompt_value, self.pack_parser, call_site="analyze_pages")
+            wanted = {url for url, _, _ in pages}
+            for item in packed.pages:
+                if item.url in wanted:
+                    results[item.url] = item.analysis
         except Exception as e:
-            logger.error(f"Error analyzing page {title}: {e}")
-            return None
+            logger.error(f"Error analyzing {len(pages)} packed pages: {e}")
+
+        missing = [(url, title, content) for url, title, content in pages if url not in results]
+        # 逐页分析需要为每页各发送一次提示词开销，合并调用只发送一次（另加每页的分隔标题）
+        saved = (len(results) * self.page_overhead_tokens - self.pack_overhead_tokens
+                 - sum(estimate_tokens(h) for h in headers)) if results else 0
+        with self._stats_lock:
+            self.pack_stats["calls"] += 1
+            self.pack_stats["pages"] += len(results)
+            self.pack_stats["fallback_pages"] += len(missing)
+            self.pack_stats["tokens_saved"] += saved
+        if results:
+            logger.info(f"Packed call analyzed {len(results)}/{len(pages)} pages, ~{saved} prompt tokens "
+                        f"and {len(results) - 1} round trips saved")
+        if missing:
+            logger.warning(f"{len(missing)}/{len(pages)} packed pages missing from the response, analyzing individually")
+            for url, title, content in missing:
+                results[url] = self.analyze_page(title, content)
+        return results
+
+    def log_pack_stats(self):
+        stats = self.pack_stats
+        if stats["calls"]:
+            logger.info(f"Packed analysis: {stats['pages']} pages in {stats['calls']} calls "
+                        f"({stats['fallback_pages']} fell back to single-page calls), "
+                        f"~{stats['tokens_saved']} prompt tokens saved")
+
+    def log_output_stats(self):
+        stats = self.output_stats
+        if stats["calls"]:
+            logger.info(f"Output validation ({self.output_mode}): {stats['failures']}/{stats['calls']} calls failed "
+                        f"({stats['failures'] / stats['calls']:.1%}), {stats['repairs']} repair calls "
+                        f"(~{stats['repair_tokens']} prompt tokens), {stats['failed']} unrecovered")
+
+    @staticmethod
+    def content_hash(title: str, content: str) -> str:
+        """页面标题 + 正文的内容哈希，用于增量运行时判断页面是否变化"""
+        return hashlib.sha256(f"{title}\n{content}".encode("utf-8")).hexdigest()
 
-    def save_analysis(self, analysis: PageAnalysis, url: str, output_dir: str, url_prefix: str = "") -> str:
+    def fragment_path(self, url: str, output_dir: str, url_prefix: str = "") -> str:
         """
-        将分析结果保存到文件。返回文件路径。
+        根据 URL 计算逐页片段文件路径（files 后端）。
         """
-        # Determine filename based on URL and prefix
-        if url_prefix and url.startswith(url_prefix):
-            name = url[len(url_prefix):].strip("/").replace("/", "_")
-            if not name:
-                name = "index"
-            filename = f"{name}.json"
-        else:
-            # Fallback logic: use path-based name if possible, otherwise hash
-            from urllib.parse import urlparse
-            path = urlparse(url).path.strip("/")
-            if path:
-                # Remove common prefix if implicit? No, just use full path safe
-                filename = f"{path.replace('/', '_')}.json"
-            else:
-                url_hash = hashlib.md5(url.encode()).hexdigest()
-                filename = f"{url_hash}.json"
+        return FileFragmentBackend(output_dir).path_for(url, url_prefix)
 
-        filepath = os.path.join(output_dir, filename)
-        
+    def find_reusable_fragment(self, url: str, content_hash: str, output_dir: str, url_prefix: str = "") -> Optional[str]:
+        """
+        增量模式：若已有片段对应同一 URL、同一内容哈希、同一提示词与模型版本，返回其引用，否则返回 None。
+        """
+        try:
+            loaded = get_fragment_backend(output_dir).load(url, url_prefix)
+        except Exception as e:
+            logger.warning(f"Failed to read existing fragment for {url}: {e}")
+            return None
+        if not loaded:
+            return None
+            
+        ref, data = loaded
+        if (data.get("content_hash") == content_hash
+                and data.get("prompt_version") == self.prompt_version
+                and data.get("model") == self.model_name):
+            return ref
+        return None
+
+    def save_analysis(self, analysis: PageAnalysis, url: str, output_dir: str, url_prefix: str = "",
+                      content_hash: Optional[str] = None) -> str:
+        """
+        将分析结果保存到片段存储（由 FRAGMENT_BACKEND 决定）。返回片段引用。
+        """
         data = analysis.model_dump()
         data["url"] = url  # 补充 URL 信息
+        # 增量运行所需的版本信息
+        data["content_hash"] = content_hash
+        data["prompt_version"] = self.prompt_version
+        data["model"] = self.model_name
         
-        with open(filepath, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-            
-        return filepath
+        return get_fragment_backend(output_dir).save(url, data, url_prefix)
+
+    def copy_fragment(self, source_url: str, url: str, output_dir: str, url_prefix: str = "",
+                      content_hash: Optional[str] = None) -> Optional[str]:
+        """
+        重复页面复用规范页面的分析结果：以 url 为键保存一份副本（标注 duplicate_of）。
+        规范页面没有片段时返回 None，否则返回副本的引用。
+        """
+        backend = get_fragment_backend(output_dir)
+        try:
+            source = backend.load(source_url, url_prefix)
+        except Exception as e:
+            # 规范页面片段损坏时由调用方改为分析重复页面自身
+            logger.warning(f"Failed to read canonical fragment for {source_url}: {e}")
+            return None
+        if not source:
+            return None
+        source_ref, data = source
+        # 逐页文件后端中 URL 别名可能映射到同一文件，直接引用规范页面的片段，避免覆盖
+        if isinstance(backend, FileFragmentBackend) and backend.path_for(url, url_prefix) == source_ref:
+            return source_ref
+
+        data = dict(data, url=url, duplicate_of=source_url)
+        if content_hash:
+            data["content_hash"] = content_hash
+        try:
+            existing = backend.load(url, url_prefix)
+        except Exception:
+            existing = None  # 已有副本损坏，直接覆盖
+        if existing and existing[1] == data:
+            return existing[0]
+        return backend.save(url, data, url_prefix)
 
     def integrate_fragments(self, fragment_paths: List[str]) -> str:
-        """imp_sr = slf._format_importance(kp.get('importance', 3))
-                        te_st
+        """
         整合多个分析片段，生成最终大纲。
-        支持分批处理以避免 Context Window 溢出。
+        Map-Reduce：按 token 预算分批并发整合，再逐层两两以上合并草稿（树形归约），
+        直到全部草稿能放入一次上下文，最后统一润色。调用轮数随片段数按 log(N) 增长。
         """
         fragments_content = []
         for path in fragment_paths:
             try:
-                with open(path, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-                    # 格式化为易读的文本供 LLM 阅读
-                    text = f"--- Page: {data.get('url')} (Type: {data.get('page_type')}) ---\n"
-                    text += f"Summary: {data.get('summary')}\n"
-                    text += "Points:\n"
-                    for kp in data.get('knowledge_points', []):
-                        text += f"- {kp['concept']} ({kp['importance']}⭐): {kp['explanation']}\n"
-                    fragments_content.append(text)
+                data, _ = read_fragment(path)
+                # 格式化为易读的文本供 LLM 阅读
+                text = f"--- Page: {data.get('url')} (Type: {data.get('page_type')}) ---\n"
+                text += f"Summary: {data.get('summary')}\n"
+                text += "Points:\n"
+                for kp in data.get('knowledge_points', []):
+                    text += f"- {kp['concept']} ({kp['importance']}⭐): {kp['explanation']}\n"
+                fragments_content.append(text)
             except Exception as e:
                 logger.warning(f"Failed to load fragment {path}: {e}")
 
         if not fragments_content:
             return "No content to integrate."
 
-        # 分批逻辑
-        BATCH_SIZE = 5
-        batches = [fragments_content[i:i + BATCH_SIZE] for i in range(0, len(fragments_content), BATCH_SIZE)]
-        
-        batch_summaries = []
-        
-        # 并行处理每一批（或者串行，取决于 LLM 限流）
-        # 这里为了稳妥选择串行，因为是 Reduce 过程
-        for i, batch in enumerate(batches):
-            logger.info(f"Integrating batch {i+1}/{len(batches)}...")
-            combined_text = "\n\n".join(batch)
-            
-            # 如果只有一批，直接生成 Markdown
-            if len(batches) == 1:
-                response = self.llm.invoke(self.merge_prompt.invoke({"fragments": combined_text}))
-                return response.content
-            
-            # 如果有多批，先生成中间摘要
-            response = self.llm.invoke(self.merge_prompt.invoke({"fragments": combined_text}))
-            batch_summaries.append(response.content)
+        # Map：按 token 预算分批，并发生成各批的中间草稿
+        batches = self._pack_by_tokens(fragments_content, self.integrate_batch_tokens)
+        if len(batches) == 1:
+            response = self.client.invoke(self.merge_prompt.invoke({"fragments": "\n\n".join(batches[0])}),
+                                          call_site="integrate_fragments")
+            return response.content
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.integrate_workers) as executor:
+            logger.info(f"Integrating {len(fragments_content)} fragments in {len(batches)} batches...")
+            drafts = list(executor.map(
+                lambda batch: self._merge_or_keep(self.merge_prompt, {"fragments": "\n\n".join(batch)}),
+                batches))
+
+            # Reduce：草稿总量超出上下文预算时逐层合并
+            level = 0
+            while len(drafts) > 1 and sum(estimate_tokens(d) for d in drafts) > self.integrate_context_tokens:
+                level += 1
+                groups = self._pack_by_tokens(drafts, self.integrate_batch_tokens, min_group=2)
+                logger.info(f"Reduce level {level}: {len(drafts)} drafts -> {len(groups)}")
+                # 落单的草稿直接进入下一层，不单独调用
+                drafts = list(executor.map(
+                    lambda group: group[0] if len(group) == 1 else
+                    self._merge_or_keep(self.reduce_prompt, {"drafts": "\n\n".join(group)}),
+                    groups))
 
         # 全局合并
         logger.info("Performing final merge...")
-        final_input = "\n\n".join(batch_summaries)
-        
-        final_prompt = ChatPromptTemplate.from_messages([
-            ("system", "你是一个主编。你的任务是将多个 Markdown 章节整合成一篇完整的文档。\n"
-                       "请统一格式，添加总标题和序言，并确保各章节过渡自然。\n"
-                       "不要删除具体内容，只是进行组织和润色。"),
-            ("user", "以下是各章节草稿：\n\n{drafts}")
-        ])
-        
+        final_input = "\n\n".join(drafts)
         try:
-             # 如果内容非常多，可能再次溢出。这里做一个简单的长度检查
-            if len(final_input) > 20000:
-                logger.warning("Final content too large for single pass, returning concatenated drafts.")
-                return "# 汇总文档 (未完全润色)\n\n" + final_input
-                
-            response = self.llm.invoke(final_prompt.invoke({"drafts": final_input}))
+            response = self.client.invoke(self.final_prompt.invoke({"drafts": final_input}),
+                                          call_site="integrate_fragments")
             return response.content
         except Exception as e:
             logger.error(f"Final merge failed: {e}")
             return "# 汇总文档 (合并失败)\n\n" + final_input
 
+    @staticmethod
+    def _pack_by_tokens(texts: List[str], budget: int, min_group: int = 1) -> List[List[str]]:
+        """
+        按顺序将文本装入不超过 budget 的批次；单个超出预算的文本独占一批。
+        min_group=2 时每批至少两项（最后一批除外），保证归约每层数量至少减半。
+        """
+        batches: List[List[str]] = []
+        current: List[str] = []
+        current_tokens = 0
+        for text in texts:
+            tokens = estimate_tokens(text)
+            if current and current_tokens + tokens > budget and len(current) >= min_group:
+                batches.append(current)
+                current, current_tokens = [], 0
+            current.append(text)
+            current_tokens += tokens
+        if current:
+            batches.append(current)
+        return batches
+
+    def _merge_or_keep(self, prompt: ChatPromptTemplate, inputs: Dict[str, str]) -> str:
+        """调用一次合并；失败时保留原文进入下一层，不丢内容"""
+        try:
+            return self.client.invoke(prompt.invoke(inputs), call_site="integrate_fragments").content
+        except Exception as e:
+            logger.error(f"Integration batch failed, keeping its input unmerged: {e}")
+            return next(iter(inputs.values()))
+
     def polish_section(self, content: str, chapter_num: int) -> str:
         """对单个章节进行润色和层级调整"""
         prompt = ChatPromptTemplate.from_messages([
@@ -243,7 +536,8 @@ class Generator:
                        "5. 确保 Markdown 格式规范。"),
             ("user", "原始内容：\n\n{content}")
         ])
-        response = self.llm.invoke(prompt.invoke({"content": content, "chapter_num": chapter_num}))
+        response = self.client.invoke(prompt.invoke({"content": content, "chapter_num": chapter_num}),
+                                      call_site="polish_section")
         return response.content
 
     def generate_toc_and_intro(self, chapters: List[str]) -> str:
@@ -257,22 +551,31 @@ class Generator:
                        "请直接输出 Markdown 格式。"),
             ("user", "各章摘要片段：\n\n{summaries}")
         ])
-        response = self.llm.invoke(prompt.invoke({"summaries": combined_summaries}))
+        response = self.client.invoke(prompt.invoke({"summaries": combined_summaries}),
+                                      call_site="generate_toc_and_intro")
         return response.content
 
     def generate_from_structure(self, toc: List[Dict], fragments_dir: str) -> str:
         """
         基于给定的目录结构和本地片段生成完整文档。
         """
-        from src.core.indexer import FragmentIndexer
+        return "".join(self.iter_structure(toc, fragments_dir))
+
+    def iter_structure(self, toc: List[Dict], fragments_dir: str) -> Iterator[str]:
+        """
+        按目录顺序逐节产出 Markdown 片段，调用方可边遍历边写入文件，
+        内存中只保留当前小节的内容。
+        """
+        from src.core.indexer import FragmentIndexer, FragmentStore
+        from src.utils.config import GenerationSettings
         
-        indexer = FragmentIndexer(fragments_dir)
+        generation = settings.generation if settings else GenerationSettings()
+        store = FragmentStore(max_bytes=generation.fragment_cache_mb * 1024 * 1024)
+        indexer = FragmentIndexer(fragments_dir, store=store)
         indexer.build_index()
         
-        content = ""
-        
         def process_node(node, level=1):
-            text = ""
+            parts = []
             title = node["title"]
             title_cn = node.get("title_cn")
             
@@ -294,37 +597,37 @@ class Generator:
                         break
             
             # Generate Header
-            text += f"{'#' * level} {display_title}\n\n"
+            parts.append(f"{'#' * level} {display_title}\n\n")
             
             if fragment:
                 # Load content
                 try:
-                    with open(fragment['path'], 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                        text += f"{data.get('summary', '')}\n\n"
-                        if data.get('knowledge_points'):
-                            text += "#### Core Concepts\n"
-                            for kp in data['knowledge_points']:
-                                imp_str = self._format_importance(kp.get('importance', 3))
-                                text += f"- **{kp['concept']}** {imp_str}: {kp['explanation']}\n"
-                        text += "\n"
+                    data = store.get(fragment['path'])
+                    parts.append(f"{data.get('summary', '')}\n\n")
+                    if data.get('knowledge_points'):
+                        parts.append("#### Core Concepts\n")
+                        for kp in data['knowledge_points']:
+                            imp_str = self._format_importance(kp.get('importance', 3))
+                            parts.append(f"- **{kp['concept']}** {imp_str}: {kp['explanation']}\n")
+                    parts.append("\n")
                 except Exception as e:
                     logger.warning(f"Error reading fragment {fragment['path']}: {e}")
             else:
                  if not node.get("children"):
-                    text += "*(Content not found)*\n\n"
+                    parts.append("*(Content not found)*\n\n")
+
+            # 先产出本节，再递归子节点
+            yield "".join(parts)
 
             # Children
             if "children" in node:
                 for child in node["children"]:
-                    text += process_node(child, level + 1)
-            
-            return text
+                    yield from process_node(child, level + 1)
 
         for node in toc:
-            content += process_node(node, level=2)
-            
-        return content
+            yield from process_node(node, level=2)
+        
+        logger.info(f"Fragment store: {store.loads} loaded from disk, {store.hits} served from memory.")
 
 # 单例
 try:
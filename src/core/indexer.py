@@ -1,57 +1,300 @@
 import os
 import json
 import logging
-from typing import Dict, Any
+import sqlite3
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional
+from src.core.fragment_backend import JsonlFragmentBackend, get_fragment_backend, read_fragment
 
 logger = logging.getLogger(__name__)
 
-class FragmentIndexer:
+# 用作前缀区间上界的最大码位
+_MAX_CHAR = "\U0010ffff"
+
+def _trigrams(text: str):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+class _SubstringIndex:
+    """
+    三元组 (trigram) 倒排索引：返回包含查询子串的最小序号。
+    候选来自查询中最稀有的三元组的倒排表（按序号升序），逐个验证，第一个命中即为结果。
+    """
+
+    def __init__(self, texts: List[str]):
+        self.texts = texts
+        self.postings: Dict[str, List[int]] = {}
+        for order, text in enumerate(texts):
+            for gram in _trigrams(text):
+                self.postings.setdefault(gram, []).append(order)
+
+    def first_containing(self, query: str) -> Optional[int]:
+        if len(query) < 3:
+            # 过短的查询无法使用三元组，线性扫描
+            return next((i for i, text in enumerate(self.texts) if query in text), None)
+        candidates = None
+        for gram in _trigrams(query):
+            posting = self.postings.get(gram)
+            if not posting:
+                return None
+            if candidates is None or len(posting) < len(candidates):
+                candidates = posting
+        return next((i for i in candidates if query in self.texts[i]), None)
+
+class _SuffixIndex:
+    """
+    后缀索引：按反转字符串排序，后缀查询变为前缀区间查询 (bisect)，
+    再用稀疏表 (sparse table) 在 O(1) 时间内取区间内的最小序号。
+    """
+
+    def __init__(self, texts: List[str]):
+        pairs = sorted((text[::-1], order) for order, text in enumerate(texts))
+        self.keys = [key for key, _ in pairs]
+        table = [[order for _, order in pairs]]
+        width = 1
+        while width * 2 <= len(pairs):
+            prev = table[-1]
+            table.append([min(prev[i], prev[i + width]) for i in range(len(prev) - width)])
+            width *= 2
+        self.table = table
+
+    def first_ending_with(self, suffix: str) -> Optional[int]:
+        prefix = suffix[::-1]
+        lo = bisect_left(self.keys, prefix)
+        hi = bisect_left(self.keys, prefix + _MAX_CHAR)
+        if lo >= hi:
+            return None
+        level = (hi - lo).bit_length() - 1
+        row = self.table[level]
+        return min(row[lo], row[hi - (1 << level)])
+
+class FragmentManifest:
+    """
+    片段清单：保存在 fragments/ 旁的 SQLite 文件，记录每个片段文件的 mtime / size 及索引所需字段。
+    build_index 只需 stat 目录中的文件，仅对新增或已修改的文件重新解析 JSON。
+    """
+
+    FILENAME = "fragment_manifest.sqlite"
+
     def __init__(self, fragments_dir: str):
         self.fragments_dir = fragments_dir
+        self.path = os.path.join(os.path.dirname(os.path.abspath(fragments_dir)), self.FILENAME)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS fragments ("
+            "filename TEXT PRIMARY KEY, mtime_ns INTEGER NOT NULL, size INTEGER NOT NULL, "
+            "url TEXT, title TEXT, summary TEXT, page_type TEXT)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def entry_from_data(data: Dict[str, Any]) -> Dict[str, Any]:
+        """从片段 JSON 中取出索引字段"""
+        return {
+            "url": data.get("url"),
+            "title": data.get("title", "Unknown Title"),
+            "summary": data.get("summary", ""),
+            "page_type": data.get("page_type", "Other")
+        }
+
+    def load(self) -> Dict[str, tuple]:
+        """Returns: Dict[filename, (mtime_ns, size, entry)]"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT filename, mtime_ns, size, url, title, summary, page_type FROM fragments").fetchall()
+        return {
+            row[0]: (row[1], row[2], {"url": row[3], "title": row[4], "summary": row[5], "page_type": row[6]})
+            for row in rows
+        }
+
+    def upsert(self, filename: str, stat: os.stat_result, entry: Dict[str, Any], commit: bool = True):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO fragments (filename, mtime_ns, size, url, title, summary, page_type) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (filename, stat.st_mtime_ns, stat.st_size, entry["url"], entry["title"],
+                 entry["summary"], entry["page_type"])
+            )
+            if commit:
+                self._conn.commit()
+
+    def record(self, filepath: str, data: Dict[str, Any]):
+        """片段写入后调用，保持清单与文件同步"""
+        self.upsert(os.path.basename(filepath), os.stat(filepath), self.entry_from_data(data))
+
+    def remove(self, filenames: List[str]):
+        with self._lock:
+            self._conn.executemany("DELETE FROM fragments WHERE filename = ?", [(f,) for f in filenames])
+
+    def commit(self):
+        with self._lock:
+            self._conn.commit()
+
+_manifests: Dict[str, FragmentManifest] = {}
+_manifests_lock = threading.Lock()
+
+def get_manifest(fragments_dir: str) -> FragmentManifest:
+    """每个片段目录共享一个清单实例（线程安全）"""
+    key = os.path.abspath(fragments_dir)
+    with _manifests_lock:
+        if key not in _manifests:
+            _manifests[key] = FragmentManifest(fragments_dir)
+        return _manifests[key]
+
+class FragmentStore:
+    """
+    片段内存缓存：按片段引用（文件路径或 JSONL 引用）缓存已解码的片段 JSON，以序列化大小估算占用，
+    超出上限时按 LRU 淘汰。同一次生成中，每个片段最多读取、解析一次（除非已被淘汰）。
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._items: "OrderedDict[str, tuple]" = OrderedDict()  # path -> (data, size)
+        self._bytes = 0
+        self.hits = 0
+        self.loads = 0
+
+    def put(self, path: str, data: Dict[str, Any], size: int):
+        if path in self._items:
+            self._bytes -= self._items.pop(path)[1]
+        if size > self.max_bytes:
+            return
+        self._items[path] = (data, size)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            _, (_, evicted) = self._items.popitem(last=False)
+            self._bytes -= evicted
+
+    def get(self, path: str) -> Dict[str, Any]:
+        """返回片段内容，未缓存时从磁盘加载"""
+        item = self._items.get(path)
+        if item is not None:
+            self._items.move_to_end(path)
+            self.hits += 1
+            return item[0]
+        data, size = read_fragment(path)
+        self.loads += 1
+        self.put(path, data, size)
+        return data
+
+class FragmentIndexer:
+    def __init__(self, fragments_dir: str, store: Optional[FragmentStore] = None):
+        self.fragments_dir = fragments_dir
+        # 可选：build_index 中解析过的片段直接放入缓存，供后续读取
+        self.store = store
         self.index: Dict[str, Dict[str, Any]] = {} # url -> {path, title, summary, ...}
+        self._entries: Optional[List[Dict[str, Any]]] = None
+        self._cache: Dict[str, Optional[Dict[str, Any]]] = {}
 
     def build_index(self):
         logger.info(f"Building index from {self.fragments_dir}...")
-        for filename in os.listdir(self.fragments_dir):
-            if not filename.endswith(".json"):
-                continue
-            
-            filepath = os.path.join(self.fragments_dir, filename)
-            try:
-                with open(filepath, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-                    url = data.get("url")
-                    if url:
-                        # Normalize URL: remove trailing slash
-                        url = url.rstrip("/")
-                        self.index[url] = {
-                            "path": filepath,
-                            "title": data.get("title", "Unknown Title"),
-                            "summary": data.get("summary", ""),
-                            "page_type": data.get("page_type", "Other")
-                        }
-            except Exception as e:
-                logger.warning(f"Failed to read fragment {filename}: {e}")
-        logger.info(f"Indexed {len(self.index)} fragments.")
+        backend = get_fragment_backend(self.fragments_dir)
+        if isinstance(backend, JsonlFragmentBackend):
+            return self._build_from_log(backend)
+        manifest = get_manifest(self.fragments_dir)
+        known = manifest.load()
+        seen = set()
+        reparsed = 0
+
+        with os.scandir(self.fragments_dir) as it:
+            for dir_entry in it:
+                filename = dir_entry.name
+                if not filename.endswith(".json"):
+                    continue
+                seen.add(filename)
+                filepath = os.path.join(self.fragments_dir, filename)
+
+                try:
+                    stat = dir_entry.stat()
+                    cached = known.get(filename)
+                    if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+                        entry = cached[2]
+                    else:
+                        # 新增或已修改的文件：重新解析并更新清单
+                        with open(filepath, "r", encoding="utf-8") as f:
+                            data = json.load(f)
+                        entry = FragmentManifest.entry_from_data(data)
+                        manifest.upsert(filename, stat, entry, commit=False)
+                        if self.store is not None:
+                            self.store.put(filepath, data, stat.st_size)
+                        reparsed += 1
+                except Exception as e:
+                    logger.warning(f"Failed to read fragment {filename}: {e}")
+                    continue
+
+                url = entry.get("url")
+                if url:
+                    # Normalize URL: remove trailing slash
+                    url = url.rstrip("/")
+                    self.index[url] = {
+                        "path": filepath,
+                        "title": entry["title"],
+                        "summary": entry["summary"],
+                        "page_type": entry["page_type"]
+                    }
+
+        removed = [f for f in known if f not in seen]
+        if removed:
+            manifest.remove(removed)
+        manifest.commit()
+
+        self._build_lookup()
+        logger.info(f"Indexed {len(self.index)} fragments ({reparsed} re-read from disk).")
+        return self.index
+
+    def _build_from_log(self, backend: JsonlFragmentBackend):
+        """JSONL 后端：一次顺序读取整个日志建立索引"""
+        for ref, data, size in backend.iter_records():
+            if self.store is not None:
+                self.store.put(ref, data, size)
+            entry = FragmentManifest.entry_from_data(data)
+            url = entry.get("url")
+            if url:
+                self.index[url.rstrip("/")] = {"path": ref, "title": entry["title"],
+                                               "summary": entry["summary"], "page_type": entry["page_type"]}
+        self._build_lookup()
+        logger.info(f"Indexed {len(self.index)} fragments from {backend.log_path}.")
         return self.index
 
+    def _build_lookup(self):
+        """
+        构建查询结构。序号即 self.index 中的插入顺序，多个片段匹配时返回序号最小者，
+        与依次线性扫描的结果一致。
+        """
+        urls = list(self.index)
+        self._entries = [self.index[u] for u in urls]
+        self._suffixes = _SuffixIndex(urls)
+        # 三元组索引构建较重，首次子串查询时才创建
+        self._url_substrings: Optional[_SubstringIndex] = None
+        self._title_substrings: Optional[_SubstringIndex] = None
+        self._cache = {}
+
     def find_fragment(self, keyword_or_suffix: str) -> Dict[str, Any]:
         """Find a fragment by URL suffix or title keyword."""
         keyword_or_suffix = keyword_or_suffix.lower()
-        
+
+        if self._entries is None or len(self._entries) != len(self.index):
+            self._build_lookup()
+        if keyword_or_suffix in self._cache:
+            return self._cache[keyword_or_suffix]
+
         # 1. Exact suffix match on URL
-        for url, data in self.index.items():
-            if url.endswith(keyword_or_suffix):
-                return data
-            
+        order = self._suffixes.first_ending_with(keyword_or_suffix)
+
         # 2. Partial match on URL
-        for url, data in self.index.items():
-            if keyword_or_suffix in url:
-                return data
-                
+        if order is None:
+            if self._url_substrings is None:
+                self._url_substrings = _SubstringIndex(list(self.index))
+            order = self._url_substrings.first_containing(keyword_or_suffix)
+
         # 3. Partial match on Title
-        for url, data in self.index.items():
-            if keyword_or_suffix in data.get("title", "").lower():
-                return data
-                
-        return None
+        if order is None:
+            if self._title_substrings is None:
+                self._title_substrings = _SubstringIndex([(e.get("title") or "").lower() for e in self._entries])
+            order = self._title_substrings.first_containing(keyword_or_suffix)
+
+        result = self._entries[order] if order is not None else None
+        self._cache[keyword_or_suffix] = result
+        return result
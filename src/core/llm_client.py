@@ -0,0 +1,239 @@
+import json
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Optional, Tuple, Type
+from langchain_core.exceptions import OutputParserException
+from langchain_core.messages import AIMessage
+from pydantic import BaseModel
+from loguru import logger
+from src.utils.config import settings
+from src.utils.tokens import estimate_tokens
+from src.utils.llm_cache import LLMResponseCache
+from src.utils.llm_metrics import LLMMetrics
+
+class RateLimiter:
+    """
+    滑动窗口限流器：同时约束每分钟请求数 (RPM) 与每分钟 token 数 (TPM)。
+    请求前按估算的 prompt token 预占配额，响应返回后用 settle 改为实际用量（prompt + completion）。
+    预算为 0 表示不限制。线程安全，可在多个 LLM 调用方之间共享。
+    """
+
+    def __init__(self, requests_per_minute: int = 0, tokens_per_minute: int = 0, window: float = 60.0):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.window = window
+        self._events = deque()  # [timestamp, tokens]
+        self._tokens_in_window = 0
+        self._lock = threading.Lock()
+
+    def _purge(self, now: float):
+        while self._events and now - self._events[0][0] >= self.window:
+            _, tokens = self._events.popleft()
+            self._tokens_in_window -= tokens
+
+    def acquire(self, tokens: int = 0) -> list:
+        """
+        阻塞直到 RPM 与 TPM 预算都允许本次请求。
+        单次请求超过 TPM 预算时，等到窗口清空后放行，避免永久阻塞。
+        Returns: 本次请求在窗口中的记录，传给 settle 以更新实际用量
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._purge(now)
+                rpm_ok = not self.requests_per_minute or len(self._events) < self.requests_per_minute
+                tpm_ok = (not self.tokens_per_minute
+                          or not self._events
+                          or self._tokens_in_window + tokens <= self.tokens_per_minute)
+                if rpm_ok and tpm_ok:
+                    event = [now, tokens]
+                    self._events.append(event)
+                    self._tokens_in_window += tokens
+                    return event
+                wait = self._events[0][0] + self.window - now
+            time.sleep(max(wait, 0.05))
+
+    def settle(self, event: list, tokens: int):
+        """把 acquire 预占的 token 数改为实际用量；记录已移出窗口时不再计入"""
+        with self._lock:
+            now = time.monotonic()
+            self._purge(now)
+            if now - event[0] < self.window:
+                self._tokens_in_window += tokens - event[1]
+            event[1] = tokens
+
+def _status_code(exc: Exception) -> Optional[int]:
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status
+
+def is_retryable(exc: Exception) -> bool:
+    """429 / 5xx 以及连接、超时类错误可重试"""
+    status = _status_code(exc)
+    if status is not None:
+        return status == 429 or status >= 500
+    return type(exc).__name__ in ("APIConnectionError", "APITimeoutError", "ConnectError",
+                                  "ReadTimeout", "ConnectTimeout", "RemoteProtocolError")
+
+def _retry_after(exc: Exception) -> Optional[float]:
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+def _raw_output(message) -> str:
+    """结构化输出的原始内容：工具调用参数，没有时取文本"""
+    tool_calls = getattr(message, "tool_calls", None)
+    if tool_calls:
+        return json.dumps(tool_calls[0].get("args"), ensure_ascii=False)
+    return str(getattr(message, "content", "") or "")
+
+def _usage(message) -> Optional[Tuple[int, int]]:
+    """响应中的 (prompt tokens, completion tokens)，模型未返回用量时为 None"""
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        return usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+    metadata = getattr(message, "response_metadata", None) or {}
+    usage = metadata.get("token_usage") or metadata.get("usage")
+    if usage:
+        return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+    return None
+
+class LLMClient:
+    """
+    LLM 调用封装：响应缓存 + 限流 + 带抖动的指数退避重试 + 按调用位置统计用量。
+    Generator 与 Visualizer 的所有 LLM 调用都经由此处。
+    """
+
+    def __init__(self, llm, rate_limiter: Optional[RateLimiter] = None, max_retries: int = 5,
+                 backoff_base: float = 1.0, backoff_max: float = 60.0, cache: Optional[LLMResponseCache] = None,
+                 metrics: Optional[LLMMetrics] = None):
+        self.llm = llm
+        self.rate_limiter = rate_limiter
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.cache = cache
+        self.metrics = metrics
+        self.model = getattr(llm, "model_name", None) or getattr(llm, "model", None)
+        self.temperature = getattr(llm, "temperature", None)
+        self._structured: Dict[Type[BaseModel], Any] = {}
+
+    def invoke(self, prompt_value, call_site: str = "llm", validate: Optional[Callable[[str], Any]] = None,
+               cache_prompt=None):
+        """
+        调用 LLM。call_site 用于日志中区分调用位置。
+        命中缓存时不占用限流配额，直接返回缓存的 AIMessage。
+        validate: 可选的校验函数（如输出解析器），校验失败的响应不写入缓存，已缓存的也不再使用。
+        cache_prompt: 用于计算缓存键的提示词，默认为 prompt_value。修复调用传入原始提示词，重跑时直接命中修复后的结果。
+        """
+        cache_key = None
+        if self.cache:
+            cache_key = self.cache.make_key(self.model, self.temperature, cache_prompt or prompt_value)
+            cached = self.cache.get(cache_key)
+            if cached is not None and self._valid(cached["content"], validate):
+                logger.debug(f"[{call_site}] LLM cache hit")
+                if self.metrics:
+                    self.metrics.record_cache_hit(call_site)
+                return AIMessage(content=cached["content"], response_metadata=cached["metadata"])
+
+        response = self._invoke_with_retry(prompt_value, call_site)
+        if cache_key and isinstance(response.content, str) and self._valid(response.content, validate):
+            self.cache.put(cache_key, self.model, response.content, getattr(response, "response_metadata", None))
+        return response
+
+    def invoke_structured(self, prompt_value, schema: Type[BaseModel], call_site: str = "llm",
+                          cache_prompt=None) -> BaseModel:
+        """
+        通过模型的结构化输出（function calling）接口调用，直接返回 schema 实例。
+        输出无法通过 schema 校验时抛出 OutputParserException（llm_output 为原始输出），由调用方决定是否修复重试。
+        缓存中保存校验通过的 JSON；cache_prompt 同 invoke。
+        """
+        cache_key = None
+        if self.cache:
+            cache_key = self.cache.make_key(self.model, self.temperature, cache_prompt or prompt_value,
+                                            variant=f"structured:{schema.__name__}")
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                try:
+                    parsed = schema.model_validate_json(cached["content"])
+                    logger.debug(f"[{call_site}] LLM cache hit")
+                    if self.metrics:
+                        self.metrics.record_cache_hit(call_site)
+                    return parsed
+                except Exception:
+                    pass
+
+        runnable = self._structured.get(schema)
+        if runnable is None:
+            runnable = self.llm.with_structured_output(schema, method="function_calling", include_raw=True)
+            self._structured[schema] = runnable
+        result = self._invoke_with_retry(prompt_value, call_site, runnable=runnable)
+        parsed, raw = result.get("parsed"), result.get("raw")
+        if parsed is None:
+            raise OutputParserException(f"Structured output failed validation: {result.get('parsing_error')}",
+                                        llm_output=_raw_output(raw))
+        if cache_key:
+            self.cache.put(cache_key, self.model, parsed.model_dump_json(), getattr(raw, "response_metadata", None))
+        return parsed
+
+    @staticmethod
+    def _valid(content: str, validate: Optional[Callable[[str], Any]]) -> bool:
+        if validate is None:
+            return True
+        try:
+            validate(content)
+            return True
+        except Exception:
+            return False
+
+    def _invoke_with_retry(self, prompt_value, call_site: str, runnable=None):
+        runnable = runnable or self.llm
+        prompt_tokens = estimate_tokens(prompt_value.to_string()) if hasattr(prompt_value, "to_string") else 0
+        attempt = 0
+        started = time.monotonic()
+        while True:
+            event = self.rate_limiter.acquire(prompt_tokens) if self.rate_limiter else None
+            try:
+                result = runnable.invoke(prompt_value)
+                usage, estimated = self._usage(prompt_tokens, result)
+                if event is not None:
+                    self.rate_limiter.settle(event, sum(usage))
+                if self.metrics:
+                    self.metrics.record_call(call_site, time.monotonic() - started, usage[0], usage[1],
+                                             retries=attempt, estimated=estimated)
+                return result
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    if self.metrics:
+                        self.metrics.record_error(call_site, time.monotonic() - started, retries=attempt)
+                    raise
+                # Full jitter: 在 [0, base * 2^attempt] 之间随机等待，服务端给出 Retry-After 时取较大值
+                delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+                delay = max(delay, _retry_after(e) or 0)
+                attempt += 1
+                logger.warning(f"[{call_site}] LLM call failed ({e}), retry {attempt}/{self.max_retries} in {delay:.1f}s")
+                time.sleep(delay)
+
+    @staticmethod
+    def _usage(prompt_tokens: int, result) -> Tuple[Tuple[int, int], bool]:
+        """Returns: ((prompt tokens, completion tokens), 是否为估算值)"""
+        # 结构化输出 (include_raw) 的用量在原始消息上
+        message = result.get("raw") if isinstance(result, dict) else result
+        usage = _usage(message)
+        if usage is None:
+            # 模型未返回用量：prompt 沿用限流时的估算，completion 按输出文本估算
+            return (prompt_tokens, estimate_tokens(_raw_output(message))), True
+        return usage, False
+
+# 共享限流器：同一进程内所有 LLM 调用共用一份配额
+rate_limiter = RateLimiter(
+    requests_per_minute=settings.llm.requests_per_minute,
+    tokens_per_minute=settings.llm.tokens_per_minute
+) if settings else RateLimiter()
@@ -0,0 +1,283 @@
+import concurrent.futures
+import threading
+import time
+from typing import List, Dict, Tuple, Optional
+from loguru import logger
+from src.core.extractor import Extractor, PageContent
+from src.utils.tokens import estimate_tokens
+from src.utils.blob_store import BlobStore
+from src.core.dedup import DuplicateDetector
+
+class ThroughputMeter:
+    """
+    统计分析吞吐量（页/分钟），每完成 log_every 个页面输出一次。
+    """
+
+    def __init__(self, total: int, log_every: int = 10):
+        self.total = total
+        self.log_every = log_every
+        self.completed = 0
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def pages_per_minute(self) -> float:
+        elapsed = time.monotonic() - self.started
+        return self.completed * 60.0 / elapsed if elapsed > 0 else 0.0
+
+    def tick(self):
+        with self._lock:
+            self.completed += 1
+            if self.completed % self.log_every == 0:
+                logger.info(f"Progress: {self.completed}/{self.total} pages, "
+                            f"throughput {self.pages_per_minute():.1f} pages/min")
+
+class SectionPacker:
+    """
+    将同一小节（URL 父路径相同）的短页面攒成一组，总 token 达到预算或页面数达到 max_pages 后
+    整组交给一次 LLM 调用。待合并页面总数超过 max_pending 时先提交最早的一组，控制内存占用。
+    """
+
+    def __init__(self, budget: int, max_pending: int = 16, max_pages: int = 0):
+        self.budget = budget
+        self.max_pending = max(1, max_pending)
+        # 每组页面数上限，0 表示不限制
+        self.max_pages = max_pages
+        self._groups: Dict[str, Tuple[List, int]] = {}  # section -> (items, tokens)
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def section(url: str) -> str:
+        return url.rstrip("/").rsplit("/", 1)[0]
+
+    def _pop(self, key: str) -> List:
+        items, _ = self._groups.pop(key)
+        self._pending -= len(items)
+        return items
+
+    def add(self, url: str, item, tokens: int) -> List[List]:
+        """加入一个页面，返回已满、应立即分析的分组"""
+        ready = []
+        key = self.section(url)
+        with self._lock:
+            if key in self._groups and self._groups[key][1] + tokens > self.budget:
+                ready.append(self._pop(key))
+            items, total = self._groups.get(key, ([], 0))
+            items.append(item)
+            self._groups[key] = (items, total + tokens)
+            self._pending += 1
+            if total + tokens >= self.budget or (self.max_pages and len(items) >= self.max_pages):
+                ready.append(self._pop(key))
+            while self._pending > self.max_pending:
+                ready.append(self._pop(next(iter(self._groups))))
+        return ready
+
+    def drain(self) -> List[List]:
+        """取出所有未满的分组"""
+        with self._lock:
+            return [self._pop(key) for key in list(self._groups)]
+
+class AnalysisPipeline:
+    """
+    单个页面抓取之后的处理：检查、增量复用、去重、LLM 分析与保存片段。
+    提取图的每个 URL 分支调用 process_page，所有分支结束后由 join 调用
+    process_deferred（合并分析短页面）与 resolve_duplicates（重复页面复用片段）。
+    """
+
+    def __init__(self, extractor: Extractor, generator, output_dir: str, url_prefix: str = "",
+                 analyze_workers: int = 4, incremental: bool = True, pack_tokens: int = 0, pack_max_pages: int = 0,
+                 blob_store: Optional[BlobStore] = None, dedup: Optional[DuplicateDetector] = None):
+        self.extractor = extractor
+        self.generator = generator
+        self.output_dir = output_dir
+        self.url_prefix = url_prefix
+        # 同时进行的 LLM 分析数（与抓取并发 EXTRACT_MAX_CONCURRENCY 分开调节）。
+        # 分支在拿到名额前阻塞并占住图的并发槽位，已抓取、待分析的页面最多 max_concurrency 个，形成背压
+        self.analyze_workers = max(1, analyze_workers)
+        self._analyze_slots = threading.BoundedSemaphore(self.analyze_workers)
+        # 增量模式：内容、提示词与模型均未变化的页面直接复用已有片段
+        self.incremental = incremental
+        # 同一小节的短页面合并分析的 token 预算，0 表示逐页分析
+        self.pack_tokens = pack_tokens
+        self.pack_max_pages = pack_max_pages
+        # 页面正文按内容哈希落盘，结果记录中只保留哈希与大小
+        self.blob_store = blob_store
+        # 分析前去重：与已处理页面内容相同或近似的页面不调用 LLM，复用规范页面的片段
+        self.dedup = dedup
+        # 本次运行的吞吐量统计，由分发节点按待处理 URL 数创建
+        self.meter: Optional[ThroughputMeter] = None
+
+    def _check(self, page: PageContent) -> Tuple[dict, Optional[str], Optional[str]]:
+        """
+        分析前的检查：抽取失败、空内容、增量复用、重复页面。
+        Returns: (页面记录, 已完成时的片段路径, 需要分析时的内容哈希)。
+        页面记录只包含 URL、状态、正文哈希与大小，不包含正文，
+        避免正文随结果进入图状态与每一个检查点。
+        """
+        record = {"url": page.url, "error": page.error, "size": len((page.content or "").encode("utf-8"))}
+
+        # 只有当 error 存在且不为 None 时才跳过
+        if page.error:
+            logger.warning(f"Skipping {page.url} due to extraction error: {page.error}")
+            return record, None, None
+
+        title = page.title or "Unknown Title"
+        content = page.content or ""
+
+        if not content:
+            logger.warning(f"Skipping {page.url} due to empty content")
+            return record, None, None
+
+        if self.blob_store:
+            record["blob"], _ = self.blob_store.put_text(content)
+
+        body_hash = fingerprint = None
+        if self.dedup:
+            body_hash = record.get("blob") or BlobStore.key_for(content.encode("utf-8"))
+            fingerprint = self.dedup.fingerprint(content)
+            if fingerprint is not None:
+                record["simhash"] = f"{fingerprint:016x}"
+
+        content_hash = self.generator.content_hash(title, content)
+        if self.incremental:
+            existing = self.generator.find_reusable_fragment(page.url, content_hash, self.output_dir,
+                                                             url_prefix=self.url_prefix)
+            if existing:
+                logger.info(f"Unchanged since last run, reusing {existing}")
+                record["status"] = "unchanged"
+                if self.dedup:
+                    self.dedup.add(page.url, body_hash, fingerprint)
+                return record, existing, None
+
+        if self.dedup:
+            duplicate = self.dedup.claim(page.url, body_hash, fingerprint)
+            if duplicate:
+                canonical, kind = duplicate
+                logger.info(f"{page.url} is a{'n exact' if kind == 'exact' else ' near'} duplicate of {canonical}, "
+                            f"skipping analysis")
+                # 规范页面可能仍在其他分支中分析，片段在所有分支结束后由 resolve_duplicates 复制
+                record.update(status="duplicate", duplicate_of=canonical, title=title, content_hash=content_hash)
+                return record, None, None
+
+        return record, None, content_hash
+
+    def _save(self, page: PageContent, record: dict, content_hash: str, analysis) -> Tuple[dict, Optional[str]]:
+        if not analysis:
+            logger.warning(f"Analysis failed for {page.url}")
+            record["error"] = "Analysis failed"
+            return record, None
+
+        filepath = self.generator.save_analysis(analysis, page.url, self.output_dir, url_prefix=self.url_prefix,
+                                                content_hash=content_hash)
+        record["status"] = "analyzed"
+        logger.success(f"Analysis saved to {filepath}")
+        return record, filepath
+
+    def process_page(self, page: PageContent) -> Tuple[dict, Optional[str]]:
+        """
+        分析并保存单个页面（提取图中每个 URL 分支调用）。返回 (页面记录, 片段文件路径)。
+        LLM 分析的并发数受 analyze_workers 限制。
+        开启合并分析时，短页面不在此处调用 LLM，而是标记为 deferred，
+        由 process_deferred 在所有分支结束后按小节合并分析。
+        """
+        record, filepath, content_hash = self._check(page)
+        if content_hash is None:
+            return record, filepath
+
+        if self.pack_tokens > 0 and self.blob_store and estimate_tokens(page.content) < self.pack_tokens:
+            record.update(status="deferred", title=page.title or "Unknown Title", content_hash=content_hash)
+            return record, None
+
+        with self._analyze_slots:
+            logger.info(f"Analyzing content for {page.url}...")
+            analysis = self.generator.analyze_page(page.title or "Unknown Title", page.content)
+        return self._save(page, record, content_hash, analysis)
+
+    def process_deferred(self, records: List[dict]) -> Tuple[Dict[str, dict], List[str]]:
+        """
+        合并分析 process_page 推迟的短页面，正文从 BlobStore 读回。
+        Returns: (Dict[url, 页面记录], 片段文件路径列表)
+        """
+        results: Dict[str, dict] = {}
+        fragment_files: List[str] = []
+        packer = SectionPacker(self.pack_tokens, max_pending=len(records) or 1, max_pages=self.pack_max_pages)
+        groups = []
+        for deferred in records:
+            record = {k: v for k, v in deferred.items() if k not in ("status", "title", "content_hash")}
+            content = self.blob_store.get_text(record.get("blob", ""))
+            if content is None:
+                results[record["url"]] = {**record, "error": "Page body missing from blob store"}
+                continue
+            page = PageContent(url=record["url"], title=deferred.get("title"), content=content)
+            groups.extend(packer.add(page.url, (page, record, deferred["content_hash"]), estimate_tokens(content)))
+        groups.extend(packer.drain())
+
+        def process(group):
+            try:
+                return self._process_group(group)
+            except Exception as e:
+                logger.error(f"Error processing packed pages: {e}")
+                return [(page, {**record, "error": str(e)}, None) for page, record, _ in group]
+
+        if groups:
+            logger.info(f"Analyzing {len(records)} short pages in {len(groups)} packed calls...")
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.analyze_workers,
+                                                   thread_name_prefix="analyze") as executor:
+            for done in executor.map(process, groups):
+                for page, record, filepath in done:
+                    results[page.url] = record
+                    if filepath:
+                        fragment_files.append(filepath)
+        return results, fragment_files
+
+    def _process_group(self, group: List[Tuple[PageContent, dict, str]]) -> List[Tuple[PageContent, dict, Optional[str]]]:
+        """
+        一次调用分析同一小节的多个短页面，逐个保存。
+        """
+        analyses = self.generator.analyze_pages(
+            [(page.url, page.title or "Unknown Title", page.content) for page, _, _ in group])
+        done = []
+        for page, record, content_hash in group:
+            record, filepath = self._save(page, record, content_hash, analyses.get(page.url))
+            done.append((page, record, filepath))
+        return done
+
+    def _resolve_duplicate(self, duplicate: dict, record: dict) -> Tuple[dict, Optional[str]]:
+        url, canonical = record["url"], record["duplicate_of"]
+        filepath = self.generator.copy_fragment(canonical, url, self.output_dir, url_prefix=self.url_prefix,
+                                                content_hash=duplicate.get("content_hash"))
+        if filepath:
+            record["error"] = None
+            return record, filepath
+
+        content = self.blob_store.get_text(record.get("blob", "")) if self.blob_store else None
+        if content is None:
+            record["error"] = f"No fragment available from {canonical}"
+            return record, None
+        logger.info(f"Canonical page {canonical} has no usable fragment, analyzing {url} instead...")
+        page = PageContent(url=url, title=duplicate.get("title"), content=content)
+        analysis = self.generator.analyze_page(page.title or "Unknown Title", content)
+        record = {k: v for k, v in record.items() if k not in ("status", "duplicate_of")}
+        return self._save(page, record, duplicate.get("content_hash"), analysis)
+
+    def resolve_duplicates(self, records: List[dict]) -> Tuple[Dict[str, dict], List[str]]:
+        """
+        为重复页面复制规范页面的片段（在所有页面分析完成之后调用）。
+        规范页面没有可用片段时（分析失败或片段损坏），改为分析重复页面自身的正文。
+        单个页面出错只记录在该页面的结果中。
+        Returns: (Dict[url, 页面记录], 片段文件路径列表)
+        """
+        results: Dict[str, dict] = {}
+        fragment_files: List[str] = []
+        for duplicate in records:
+            record = {k: v for k, v in duplicate.items() if k not in ("title", "content_hash")}
+            url = record["url"]
+            try:
+                record, filepath = self._resolve_duplicate(duplicate, record)
+            except Exception as e:
+                logger.error(f"Error resolving duplicate {url}: {e}")
+                record, filepath = {**record, "error": str(e) or type(e).__name__}, None
+            results[url] = record
+            if filepath:
+                fragment_files.append(filepath)
+        return results, fragment_files
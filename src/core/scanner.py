@@ -1,60 +1,179 @@
-from typing import List, Set
+from datetime import datetime, timezone
+from typing import List, Set, Dict, Optional, Tuple
+import concurrent.futures
+import gzip
+import io
+import json
+import os
 import requests
-from bs4 import BeautifulSoup
+from lxml import etree
+from requests.adapters import HTTPAdapter
 from loguru import logger
+from pydantic import BaseModel
+from src.utils.http_cache import HttpCache, http_cache
+
+class SitemapEntry(BaseModel):
+    loc: str
+    lastmod: Optional[str] = None
+    changefreq: Optional[str] = None
+    priority: Optional[float] = None
+
+def _parse_lastmod(value: str) -> Optional[datetime]:
+    """解析 W3C Datetime 格式的 lastmod，无时区时按 UTC 处理"""
+    try:
+        dt = datetime.fromisoformat(value.strip())
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt
+
+_GZIP_MAGIC = b"\x1f\x8b"
+
+def _localname(tag) -> str:
+    return etree.QName(tag).localname if isinstance(tag, str) else ""
+
+def _child_text(elem, name: str) -> Optional[str]:
+    for child in elem:
+        if _localname(child.tag) == name and child.text:
+            return child.text.strip()
+    return None
+
+def parse_sitemap(content: bytes) -> Tuple[List[str], Dict[str, SitemapEntry]]:
+    """
+    增量解析 sitemap / sitemap index (iterparse)，处理完的元素立即释放，内存占用与文件大小无关。
+    自动识别 gzip 压缩 (.xml.gz)。
+
+    Returns:
+        (子 sitemap 地址列表, Dict[url, SitemapEntry])
+    """
+    stream = io.BytesIO(content)
+    if content[:2] == _GZIP_MAGIC:
+        stream = gzip.GzipFile(fileobj=stream)
+
+    sitemaps = []
+    entries = {}
+    for _, elem in etree.iterparse(stream, events=("end",), recover=True, huge_tree=True,
+                                   resolve_entities=False, no_network=True):
+        name = _localname(elem.tag)
+        if name == "sitemap":
+            # 1. sitemap index 中的子 sitemap
+            loc = _child_text(elem, "loc")
+            if loc:
+                sitemaps.append(loc)
+        elif name == "url":
+            # 2. 标准 sitemap 条目 <url><loc>...</loc></url>
+            loc = _child_text(elem, "loc")
+            if loc:
+                priority = _child_text(elem, "priority")
+                try:
+                    priority = float(priority) if priority else None
+                except ValueError:
+                    priority = None
+                entries[loc] = SitemapEntry(
+                    loc=loc,
+                    lastmod=_child_text(elem, "lastmod"),
+                    changefreq=_child_text(elem, "changefreq"),
+                    priority=priority
+                )
+        else:
+            continue
+        # 释放已处理的元素及其前面的兄弟节点
+        elem.clear()
+        parent = elem.getparent()
+        if parent is not None:
+            while elem.getprevious() is not None:
+                del parent[0]
+    return sitemaps, entries
 
 class Scanner:
     """
     负责扫描网站结构，识别目标 URL 列表。
-    使用 requests + BeautifulSoup 手动解析以提供更好的控制。
+    使用 requests 连接池并发抓取 sitemap index 的子 sitemap，并用 lxml iterparse 流式解析。
     """
-    
-    def __init__(self, timeout: int = 10, user_agent: str = None):
+
+    def __init__(self, timeout: int = 10, user_agent: str = None, cache: Optional[HttpCache] = None,
+                 max_workers: int = 8):
         self.timeout = timeout
+        self.cache = cache
+        self.max_workers = max_workers
         self.user_agent = user_agent or 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.114 Safari/537.36'
         self.session = requests.Session()
         self.session.headers.update({'User-Agent': self.user_agent})
+        # 连接池大小与并发数一致，保证 keep-alive 连接可复用
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
 
-    def _fetch_urls_recursive(self, url: str) -> Set[str]:
+    def _fetch_sitemap(self, url: str) -> Tuple[List[str], Dict[str, SitemapEntry]]:
         """
-        递归获取 sitemap 中的 URL。
+        抓取并解析单个 sitemap 文档。
         """
-        urls = set()
         try:
             logger.debug(f"Fetching sitemap: {url}")
-            response = self.session.get(url, timeout=self.timeout)
-            response.raise_for_status()
-            
-            # 使用 xml 解析器
-            soup = BeautifulSoup(response.content, 'xml')
-            
-            # 1. 检查是否是 sitemap index (包含其他 sitemap)
-            sitemaps = soup.find_all('sitemap')
+            if self.cache:
+                response = self.cache.fetch(self.session, url, timeout=self.timeout)
+            else:
+                response = self.session.get(url, timeout=self.timeout)
+                response.raise_for_status()
+            sitemaps, entries = parse_sitemap(response.content)
             if sitemaps:
                 logger.debug(f"Found sitemap index with {len(sitemaps)} sub-sitemaps at {url}")
-                for sm in sitemaps:
-                    loc = sm.find('loc')
-                    if loc and loc.text:
-                        # 递归抓取
-                        urls.update(self._fetch_urls_recursive(loc.text.strip()))
-            
-            # 2. 检查是否是标准 sitemap (包含 url)
-            # 注意：有些 sitemap index 也可能混有 url，虽然不规范，但最好都检查
-            url_tags = soup.find_all('url') # 标准是 <url><loc>...</loc></url>
-            for url_tag in url_tags:
-                loc = url_tag.find('loc')
-                if loc and loc.text:
-                    urls.add(loc.text.strip())
-            
-            # 兼容性处理：直接查找 loc 标签（如果结构不标准）
-            # 但要小心不要重复添加 sitemap index 的 loc
-            # 上面的逻辑应该覆盖了大部分标准情况。
-            
-            return urls
-            
+            return sitemaps, entries
         except Exception as e:
             logger.error(f"Error fetching sitemap {url}: {e}")
-            return set()
+            return [], {}
+
+    def _fetch_entries_recursive(self, url: str) -> Dict[str, SitemapEntry]:
+        """
+        遍历 sitemap（及其嵌套的 sitemap index），获取所有条目（loc、lastmod、changefreq、priority）。
+        同一层的子 sitemap 并发抓取，已访问的地址不会重复抓取。
+        """
+        entries = {}
+        visited = {url}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pending = {executor.submit(self._fetch_sitemap, url)}
+            while pending:
+                done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    sitemaps, found = future.result()
+                    entries.update(found)
+                    for child in sitemaps:
+                        if child not in visited:
+                            visited.add(child)
+                            pending.add(executor.submit(self._fetch_sitemap, child))
+        return entries
+
+    def _fetch_urls_recursive(self, url: str) -> Set[str]:
+        """
+        递归获取 sitemap 中的 URL。
+        """
+        return set(self._fetch_entries_recursive(url))
+
+    def scan_entries(self, sitemap_url: str, prefix: str = "") -> List[SitemapEntry]:
+        """
+        扫描 sitemap 并根据前缀过滤，保留每个 URL 的 lastmod / changefreq / priority。
+
+        Returns:
+            List[SitemapEntry]: 过滤后的条目列表（按 URL 排序）
+        """
+        logger.info(f"Scanning sitemap: {sitemap_url} with prefix: '{prefix}'")
+
+        entries = self._fetch_entries_recursive(sitemap_url)
+
+        if not entries:
+            logger.warning(f"No URLs found in sitemap: {sitemap_url}")
+            return []
+
+        logger.info(f"Total unique URLs found: {len(entries)}")
+
+        sorted_entries = [entries[u] for u in sorted(entries)]
+
+        if prefix:
+            sorted_entries = [e for e in sorted_entries if e.loc.startswith(prefix)]
+            logger.info(f"URLs after prefix filtering: {len(sorted_entries)}")
+
+        return sorted_entries
 
     def scan(self, sitemap_url: str, prefix: str = "") -> List[str]:
         """
@@ -67,24 +186,56 @@ class Scanner:
         Returns:
             List[str]: 过滤后的 URL 列表（已排序）
         """
-        logger.info(f"Scanning sitemap: {sitemap_url} with prefix: '{prefix}'")
-        
-        all_urls = self._fetch_urls_recursive(sitemap_url)
-        
-        if not all_urls:
-            logger.warning(f"No URLs found in sitemap: {sitemap_url}")
-            return []
-            
-        logger.info(f"Total unique URLs found: {len(all_urls)}")
-        
-        sorted_urls = sorted(list(all_urls))
-        
-        if prefix:
-            filtered_urls = [u for u in sorted_urls if u.startswith(prefix)]
-            logger.info(f"URLs after prefix filtering: {len(filtered_urls)}")
-            return filtered_urls
-        
-        return sorted_urls
+        return [e.loc for e in self.scan_entries(sitemap_url, prefix)]
+
+    def load_snapshot(self, path: str) -> Dict[str, Optional[str]]:
+        """
+        读取上次运行保存的 sitemap 快照。Returns: Dict[url, lastmod]
+        """
+        if not os.path.exists(path):
+            return {}
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            logger.warning(f"Failed to load sitemap snapshot {path}: {e}")
+            return {}
+
+    def save_snapshot(self, path: str, lastmods: Dict[str, Optional[str]]):
+        """
+        将已成功处理的 URL 的 lastmod 合并写入快照。
+        只记录处理成功的 URL，失败的页面下次仍会被视为已变化。
+        """
+        snapshot = self.load_snapshot(path)
+        snapshot.update(lastmods)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, ensure_ascii=False, indent=2, sort_keys=True)
+        os.replace(tmp_path, path)
+
+    def filter_changed(self, entries: List[SitemapEntry], snapshot: Dict[str, Optional[str]]) -> List[str]:
+        """
+        返回自上次运行以来发生变化的 URL：
+        新出现的 URL、缺少 lastmod 的 URL（无法判断，按已变化处理）以及 lastmod 比快照更新的 URL。
+        """
+        changed = []
+        for entry in entries:
+            if entry.loc not in snapshot or not entry.lastmod:
+                changed.append(entry.loc)
+                continue
+            previous = snapshot[entry.loc]
+            if not previous:
+                changed.append(entry.loc)
+                continue
+            current_dt, previous_dt = _parse_lastmod(entry.lastmod), _parse_lastmod(previous)
+            if current_dt and previous_dt:
+                if current_dt > previous_dt:
+                    changed.append(entry.loc)
+            elif entry.lastmod != previous:
+                changed.append(entry.loc)
+        logger.info(f"Changed since last run: {len(changed)}/{len(entries)} URLs")
+        return changed
 
 # 单例实例
-scanner = Scanner()
+scanner = Scanner(cache=http_cache)
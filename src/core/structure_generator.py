@@ -1,8 +1,19 @@
 import os
 import json
+import stat
+import tempfile
 from loguru import logger
 from src.core.generator import generator
 
+def _output_mode(output_file: str) -> int:
+    try:
+        return stat.S_IMODE(os.stat(output_file).st_mode)
+    except FileNotFoundError:
+        # umask 只能在设置时读出，立即恢复
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
 def generate_book(project_name: str, fragments_dir: str, output_file: str):
     """
     基于 TOC 和片段生成最终书籍
@@ -33,21 +44,26 @@ def generate_book(project_name: str, fragments_dir: str, output_file: str):
 
     logger.info(f"Generating structured document for {project_name} using Generator core logic...")
     
+    # Ensure output directory exists
+    output_dir = os.path.dirname(output_file) or "."
+    os.makedirs(output_dir, exist_ok=True)
+    
+    # 边遍历目录边写入临时文件，完成后原子替换，失败时不会留下半成品
+    fd, tmp_path = tempfile.mkstemp(dir=output_dir, prefix=".structured-", suffix=".md.tmp")
     try:
-        content = generator.generate_from_structure(toc, fragments_dir)
-        
-        # Add Title and Intro
-        final_content = f"# {project_name.capitalize()} Official Guide (Structured)\n\n"
-        final_content += "> Document generated via Content Extraction Pipeline based on official TOC.\n\n"
-        final_content += content
-        
-        # Ensure output directory exists
-        os.makedirs(os.path.dirname(output_file), exist_ok=True)
-        
-        with open(output_file, "w", encoding="utf-8") as f:
-            f.write(final_content)
+        with os.fdopen(fd, "w", encoding="utf-8", buffering=1024 * 1024) as f:
+            # Add Title and Intro
+            f.write(f"# {project_name.capitalize()} Official Guide (Structured)\n\n")
+            f.write("> Document generated via Content Extraction Pipeline based on official TOC.\n\n")
+            for chunk in generator.iter_structure(toc, fragments_dir):
+                f.write(chunk)
+        # mkstemp 创建的文件权限为 0600：沿用已有文件的权限，新文件按当前 umask 设置
+        os.chmod(tmp_path, _output_mode(output_file))
+        os.replace(tmp_path, output_file)
             
         logger.success(f"Done! Written to {output_file}")
         
     except Exception as e:
         logger.error(f"Error during generation: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
@@ -1,10 +1,16 @@
+import concurrent.futures
+import hashlib
+import json
 import os
 import re
 from typing import List, Dict, Optional
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 from loguru import logger
-from src.utils.config import settings
+from src.utils.config import settings, GenerationSettings
+from src.core.llm_client import LLMClient, rate_limiter
+from src.utils.llm_cache import llm_cache
+from src.utils.llm_metrics import llm_metrics
 
 class Visualizer:
     """
@@ -20,39 +26,73 @@ class Visualizer:
             model=settings.llm.model,
             openai_api_key=settings.llm.api_key,
             openai_api_base=settings.llm.base_url,
-            temperature=0.1
+            temperature=0.1,
+            max_retries=0
         )
+        self.client = LLMClient(self.llm, rate_limiter=rate_limiter, max_retries=settings.llm.max_retries,
+                                cache=llm_cache, metrics=llm_metrics)
+        self.max_workers = max(1, (settings.generation if settings else GenerationSettings()).visualize_workers)
 
-    def generate_chapter_diagrams(self, content: str) -> str:
+    @staticmethod
+    def section_hash(header: str, body: str) -> str:
+        return hashlib.sha256(f"{header}\n{body}".encode("utf-8")).hexdigest()
+
+    def generate_chapter_diagrams(self, content: str, diagram_cache: Optional[Dict[str, str]] = None) -> str:
         """
         处理文档中间部分，为章节插入图表。
+        各章节并发生成，按原顺序拼回。
+        diagram_cache: 章节哈希 -> 图表（空字符串表示不适合出图），命中的章节不再调用 LLM；
+        本次生成的结果会写回其中。
         """
         logger.info("Analyzing chapters for diagram opportunities...")
         
         # Split by H2 headers
         sections = re.split(r'(^## .+)', content, flags=re.MULTILINE)
         
-        new_content = [sections[0]] # Preamble
-        
         # Process pairs (Header, Content)
-        for i in range(1, len(sections), 2):
-            header = sections[i]
-            body = sections[i+1] if i+1 < len(sections) else ""
+        pairs = [(sections[i], sections[i+1] if i+1 < len(sections) else "") for i in range(1, len(sections), 2)]
+        
+        # 放宽限制：只要内容长度足够，都尝试生成图表，让 LLM 决定是否必要
+        # 但为了避免无意义图表，仍然要求一定长度
+        pending = {}
+        for header, body in pairs:
+            if len(body.strip()) > 300:
+                key = self.section_hash(header, body)
+                if diagram_cache is None or key not in diagram_cache:
+                    pending[key] = (header, body)
+        
+        candidates = sum(1 for _, body in pairs if len(body.strip()) > 300)
+        logger.info(f"{len(pending)}/{candidates} sections need diagrams "
+                    f"({candidates - len(pending)} unchanged since last run)")
+        
+        def create(item):
+            header, body = item
+            logger.info(f"Generating diagram for section: {header.strip()}")
+            return self._create_diagram_for_text(header, body)
+        
+        diagrams = dict(diagram_cache or {})
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for key, diagram in zip(pending, executor.map(create, pending.values())):
+                diagrams[key] = diagram
+        if diagram_cache is not None:
+            # 只保留当前文档中仍存在的章节；生成失败 (None) 的章节下次重试
+            current = {self.section_hash(h, b) for h, b in pairs if len(b.strip()) > 300}
+            diagram_cache.clear()
+            diagram_cache.update({k: v for k, v in diagrams.items() if k in current and v is not None})
+        
+        new_content = [sections[0]] # Preamble
+        for header, body in pairs:
             full_section = header + body
-            
-            # 放宽限制：只要内容长度足够，都尝试生成图表，让 LLM 决定是否必要
-            # 但为了避免无意义图表，仍然要求一定长度
             if len(body.strip()) > 300:
-                logger.info(f"Generating diagram for section: {header.strip()}")
-                diagram = self._create_diagram_for_text(header, body)
+                diagram = diagrams.get(self.section_hash(header, body))
                 if diagram:
                     full_section = header + "\n\n" + diagram + "\n" + body
-            
             new_content.append(full_section)
             
         return "".join(new_content)
 
-    def _create_diagram_for_text(self, title: str, text: str) -> str:
+    def _create_diagram_for_text(self, title: str, text: str) -> Optional[str]:
+        """返回图表代码块；不适合出图时返回空字符串，调用失败时返回 None"""
         prompt = ChatPromptTemplate.from_messages([
             ("system", "你是一个可视化专家，精通 AntV Infographic 和 Mermaid。\n"
                        "请根据章节内容，选择最合适的图表引擎生成一个图表代码块。\n"
@@ -120,14 +160,15 @@ class Visualizer:
             ("user", "章节标题: {title}\n内容片段: {text}")
         ])
         try:
-            response = self.llm.invoke(prompt.invoke({"title": title, "text": text[:3000]}))
+            response = self.client.invoke(prompt.invoke({"title": title, "text": text[:3000]}),
+                                          call_site="_create_diagram_for_text")
             content = response.content.strip()
             if "NO_CHART" in content:
                 return ""
             return content
         except Exception as e:
             logger.error(f"Failed to generate diagram for {title}: {e}")
-            return ""
+            return None
 
     def process_document(self, input_path: str, output_path: str = None):
         """主入口：处理整个文档。如果提供 output_path，则写入新文件；否则覆盖原文件。"""
@@ -140,13 +181,26 @@ class Visualizer:
 
         logger.info(f"Visualizing document: {input_path}")
 
+        target_path = output_path if output_path else input_path
+        
+        # 上次运行的章节图表记录，内容未变化的章节直接复用
+        cache_path = os.path.splitext(target_path)[0] + ".diagrams.json"
+        diagram_cache: Dict[str, str] = {}
+        if os.path.exists(cache_path):
+            try:
+                with open(cache_path, 'r', encoding='utf-8') as f:
+                    diagram_cache = json.load(f)
+            except Exception as e:
+                logger.warning(f"Failed to load diagram cache {cache_path}: {e}")
+
         # 仅处理中间章节图表，移除首尾图表
-        content_with_chapters = self.generate_chapter_diagrams(content)
+        content_with_chapters = self.generate_chapter_diagrams(content, diagram_cache)
 
         final_content = content_with_chapters
 
-        target_path = output_path if output_path else input_path
         with open(target_path, 'w', encoding='utf-8') as f:
             f.write(final_content)
+        with open(cache_path, 'w', encoding='utf-8') as f:
+            json.dump(diagram_cache, f, ensure_ascii=False, indent=2)
             
         logger.success(f"Visualization complete! Saved to {target_path}")
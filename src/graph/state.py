@@ -1,6 +1,30 @@
 from typing import List, Dict, TypedDict, Annotated, Optional
 import operator
 
+class PageRecord(TypedDict, total=False):
+    """
+    单个页面的处理结果。正文保存在 BlobStore 中，这里只记录其哈希与大小。
+    """
+    url: str
+    status: str  # analyzed / unchanged / deferred / duplicate / failed（重试耗尽）
+    error: Optional[str]
+    size: int  # 正文字节数
+    blob: str  # 正文在 BlobStore 中的 sha256
+    simhash: str  # 正文的 64 位 SimHash（十六进制），用于近似重复检测
+    duplicate_of: str  # duplicate：内容与之相同的规范页面 URL，复用其片段
+    # 仅 deferred（等待合并分析的短页面）与 duplicate 使用，处理完成后从记录中移除
+    title: str
+    content_hash: str
+
+class UrlTask(TypedDict):
+    """
+    提取图中单个 URL 分支的输入（通过 Send 分发）
+    """
+    url: str
+    project_name: str
+    target_url_prefix: str
+    force_refresh: bool
+
 class AgentState(TypedDict):
     """
     智能体状态定义
@@ -15,16 +39,24 @@ class AgentState(TypedDict):
     toc_structure: List[dict] # 提取到的目录结构
     candidate_urls: List[str]
     
+    # 增量抓取：仅处理 sitemap lastmod 比上次运行更新的 URL
+    changed_only: bool
+    # 本次扫描得到的 lastmod (url -> lastmod)，提取成功后写入快照；入口已扫描 sitemap 时预先填入，scan_node 直接复用
+    sitemap_lastmod: Dict[str, Optional[str]]
+    
     # 用户确认后的 URL
     approved_urls: List[str]
     
     # 爬取与分析阶段
     # 使用 Annotated[..., operator.ior] 允许在不同节点合并字典结果
-    results: Annotated[Dict[str, dict], operator.ior]
+    results: Annotated[Dict[str, PageRecord], operator.ior]
     
     # 临时文件路径列表
     fragment_files: Annotated[List[str], operator.add]
     
+    # 为 True 时忽略已有片段，强制重新分析（默认增量运行）
+    force_refresh: bool
+    
     # 状态标记
     current_step: str
     error: Optional[str]
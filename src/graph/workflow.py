@@ -1,12 +1,32 @@
 import os
-from src.core.extractor import extractor
+import random
+import sqlite3
+import threading
+import time
+import httpx
+import openai
+import requests
+from src.core.extractor import extractor, PageContent
 from src.core.generator import generator
+from src.core.pipeline import AnalysisPipeline, ThroughputMeter
+from src.core.dedup import get_detector
+from src.utils.blob_store import BlobStore
 from loguru import logger
 from langgraph.graph import StateGraph, END
-from src.graph.state import AgentState
-from src.core.scanner import scanner
+from langgraph.types import Send
+from langchain_core.runnables import RunnableConfig
+from src.graph.state import AgentState, UrlTask
+from src.core.scanner import scanner, SitemapEntry
+from src.utils.config import settings, PipelineSettings, GenerationSettings
 from langgraph.checkpoint.memory import MemorySaver
 
+def _project_dir(project_name: str) -> str:
+    """项目的输出目录 <output_dir>/<project>"""
+    return os.path.join(str(settings.output_dir) if settings else "outputs", project_name)
+
+def _snapshot_path(project_name: str) -> str:
+    return os.path.join(_project_dir(project_name), "sitemap_snapshot.json")
+
 def scan_node(state: AgentState):
     """
     执行扫描任务
@@ -14,66 +34,266 @@ def scan_node(state: AgentState):
     logger.info("Executing scan_node...")
     sitemap = state.get("sitemap_url")
     prefix = state.get("target_url_prefix", "")
-    
-    # If candidate_urls already provided (e.g. from CLI --url), skip scan
-    if state.get("candidate_urls"):
-        logger.info(f"Using pre-provided candidate URLs: {len(state['candidate_urls'])} URLs")
-        return {"candidate_urls": state["candidate_urls"], "current_step": "review_pending"}
+    project_name = state.get("project_name", "langchain")
+    candidates = state.get("candidate_urls") or []
     
     if not sitemap:
+        # If candidate_urls already provided (e.g. from CLI --url), skip scan
+        if candidates:
+            logger.info(f"Using pre-provided candidate URLs: {len(candidates)} URLs")
+            return {"candidate_urls": candidates, "current_step": "review_pending"}
         return {"error": "Missing sitemap_url"}
         
-    urls = scanner.scan(sitemap, prefix)
-    return {"candidate_urls": urls, "current_step": "review_pending"}
+    lastmods = state.get("sitemap_lastmod")
+    if lastmods:
+        # 入口已扫描过 sitemap（没有目录结构时用它发现 URL），直接复用，不再重复请求
+        entries = [SitemapEntry(loc=url, lastmod=lastmod) for url, lastmod in lastmods.items()]
+    else:
+        entries = scanner.scan_entries(sitemap, prefix)
+        lastmods = {e.loc: e.lastmod for e in entries}
+    
+    if state.get("changed_only"):
+        changed = set(scanner.filter_changed(entries, scanner.load_snapshot(_snapshot_path(project_name))))
+    else:
+        changed = set(lastmods)
+    
+    if candidates:
+        # 预先提供的 URL 中，不在 sitemap 里的无法判断是否变化，予以保留
+        urls = [u for u in candidates if u in changed or u not in lastmods]
+        logger.info(f"Using pre-provided candidate URLs: {len(urls)}/{len(candidates)} URLs after sitemap filtering")
+    else:
+        urls = [e.loc for e in entries if e.loc in changed]
+        
+    return {"candidate_urls": urls, "sitemap_lastmod": lastmods, "current_step": "review_pending"}
 
-def extract_node(state: AgentState):
+# 重试之间的退避基数（秒），第 n 次重试前随机等待 [0, base * 2^(n-1)]
+RETRY_BACKOFF_BASE = 0.5
+
+# (项目, URL 前缀, 是否强制刷新) -> AnalysisPipeline，由 create_graph 清空，每个图只构建一次
+_pipelines = {}
+_pipelines_lock = threading.Lock()
+# create_graph 使用的 checkpointer；恢复运行时分支从中读取已有结果
+_checkpointer = None
+
+def _pipeline_for(project_name: str, url_prefix: str = "", force_refresh: bool = False) -> AnalysisPipeline:
+    key = (project_name, url_prefix, force_refresh)
+    with _pipelines_lock:
+        if key not in _pipelines:
+            _pipelines[key] = _build_pipeline(project_name, url_prefix, force_refresh)
+        return _pipelines[key]
+
+def _build_pipeline(project_name: str, url_prefix: str, force_refresh: bool) -> AnalysisPipeline:
+    pipeline_settings = settings.pipeline if settings else PipelineSettings()
+    generation_settings = settings.generation if settings else GenerationSettings()
+    return AnalysisPipeline(
+        extractor,
+        generator,
+        os.path.join(_project_dir(project_name), "fragments"),
+        url_prefix=url_prefix,
+        analyze_workers=pipeline_settings.analyze_workers,
+        incremental=not force_refresh,
+        pack_tokens=generation_settings.pack_tokens,
+        pack_max_pages=generation_settings.pack_max_pages,
+        blob_store=BlobStore(os.path.join(_project_dir(project_name), "blobs")),
+        dedup=get_detector(project_name, pipeline_settings.dedup_distance) if pipeline_settings.dedup_enabled else None
+    )
+
+def _seed_detector(detector, done: dict):
+    """已处理的页面登记为规范页面，后续页面与之比较是否重复"""
+    for record in done.values():
+        if record.get("status") in ("analyzed", "unchanged"):
+            detector.add(record["url"], record.get("blob"),
+                         int(record["simhash"], 16) if record.get("simhash") else None)
+
+def _saved_values(config) -> dict:
+    """
+    读取本线程最新检查点中的状态，并合并中断时已完成分支的待写入结果
     """
-    执行内容提取与初步分析
+    thread_id = ((config or {}).get("configurable") or {}).get("thread_id")
+    saved = _checkpointer.get_tuple({"configurable": {"thread_id": thread_id}}) if _checkpointer and thread_id else None
+    if not saved:
+        return {}
+    values = dict(saved.checkpoint.get("channel_values") or {})
+    results = dict(values.get("results") or {})
+    for _, channel, value in saved.pending_writes or []:
+        if channel == "results" and value:
+            results.update(value)
+    values["results"] = results
+    return values
+
+def _resume_pipeline(pipeline: AnalysisPipeline, config):
     """
-    logger.info("Executing extract_node...")
+    恢复运行时检查点的下一步直接是未完成的 extract_url 分支，分发节点不会重新执行：
+    由第一个分支从检查点补做去重器登记与吞吐量统计
+    """
+    with _pipelines_lock:
+        if pipeline.meter is not None:
+            return
+        values = _saved_values(config)
+        done = values.get("results") or {}
+        if pipeline.dedup:
+            _seed_detector(pipeline.dedup, done)
+        pipeline.meter = ThroughputMeter(sum(1 for url in values.get("approved_urls") or [] if url not in done))
+
+def dispatch_node(state: AgentState):
+    """
+    审核通过后的分发入口：检查前置条件、合并 URL 别名，由 _fan_out 为每个待处理 URL 创建一个分支
+    """
+    logger.info("Executing dispatch_node...")
     approved_urls = state.get("approved_urls", [])
-    prefix = state.get("target_url_prefix", "")
-    project_name = state.get("project_name", "langchain")
     
     if not approved_urls:
         logger.warning("No approved_urls found, skipping extraction.")
         return {"error": "No approved URLs provided"}
         
-    results = extractor.extract_batch(approved_urls)
-    
-    output_dir = os.path.join("outputs", project_name, "fragments")
-    os.makedirs(output_dir, exist_ok=True)
-    
-    fragment_files = []
-    
     if not generator:
         logger.error("Generator instance is None!")
         return {"error": "Generator not initialized"}
+    
+    done = state.get("results") or {}
+    update = {"current_step": "extracting"}
+    pipeline = _pipeline_for(state.get("project_name", "langchain"), state.get("target_url_prefix", ""),
+                             state.get("force_refresh", False))
+    if pipeline.dedup:
+        # 已处理的页面（例如从 --resume 之前的检查点恢复的结果）重新登记为规范页面
+        _seed_detector(pipeline.dedup, done)
+        # 规范化后相同的 URL 只抓取第一个，其余记为重复页面，在 join 中复用其片段
+        _, aliases = pipeline.dedup.group_urls(approved_urls)
+        aliases = {url: kept for url, kept in aliases.items() if url not in done}
+        if aliases:
+            logger.info(f"Skipping {len(aliases)} URL aliases after canonicalization")
+            update["results"] = {url: {"url": url, "status": "duplicate", "duplicate_of": kept}
+                                 for url, kept in aliases.items()}
+            done = {**done, **update["results"]}
 
-    # 遍历结果，进行分析并保存
-    for url, data in results.items():
-        # 只有当 error 存在且不为 None 时才跳过
-        if data.get("error"):
-            logger.warning(f"Skipping {url} due to extraction error: {data['error']}")
-            continue
-            
-        title = data.get("title") or "Unknown Title"
-        content = data.get("content") or ""
-        
-        if not content:
-            logger.warning(f"Skipping {url} due to empty content")
-            continue
-            
-        logger.info(f"Analyzing content for {url}...")
-        analysis = generator.analyze_page(title, content)
-        if analysis:
-            filepath = generator.save_analysis(analysis, url, output_dir, url_prefix=prefix)
-            fragment_files.append(filepath)
-            logger.success(f"Analysis saved to {filepath}")
-        else:
-            logger.warning(f"Analysis failed for {url}")
-            
-    return {"results": results, "fragment_files": fragment_files, "current_step": "extraction_complete"}
+    pending = sum(1 for u in approved_urls if u not in done)
+    logger.info(f"Dispatching {pending}/{len(approved_urls)} URLs "
+                f"({len(approved_urls) - pending} already processed or duplicated)")
+    pipeline.meter = ThroughputMeter(pending)
+    return update
+
+def _fan_out(state: AgentState):
+    """
+    每个尚无结果的 URL 发送一个 extract_url 分支；分支结果作为检查点的待写入项逐个保存，
+    中断后恢复时只重跑未完成的分支
+    """
+    if state.get("error"):
+        return END
+    done = state.get("results") or {}
+    sends = [Send("extract_url", {"url": url,
+                                  "project_name": state.get("project_name", "langchain"),
+                                  "target_url_prefix": state.get("target_url_prefix", ""),
+                                  "force_refresh": state.get("force_refresh", False)})
+             for url in state.get("approved_urls", []) if url not in done]
+    return sends or "join"
+
+def _is_transient(exc: Exception) -> bool:
+    """
+    网络超时、连接错误与 429 / 5xx 在分支内重试，其余错误直接记入页面结果。
+    覆盖抓取（requests / httpx）与 LLM 调用（openai）抛出的异常。
+    """
+    if isinstance(exc, (requests.HTTPError, httpx.HTTPStatusError)):
+        status = getattr(exc.response, "status_code", None)
+        return status is not None and (status == 429 or status >= 500)
+    if isinstance(exc, openai.APIStatusError):
+        return exc.status_code == 429 or exc.status_code >= 500
+    return isinstance(exc, (requests.ConnectionError, requests.Timeout, httpx.TransportError,
+                            openai.APIConnectionError))
+
+def _extract_url(pipeline: AnalysisPipeline, url: str):
+    try:
+        page = extractor.fetch(url)
+    except Exception as e:
+        if _is_transient(e):
+            raise
+        logger.error(f"Error extracting {url}: {e}")
+        page = PageContent(url=url, error=str(e) or type(e).__name__)
+    
+    try:
+        return pipeline.process_page(page)
+    except Exception as e:
+        if _is_transient(e):
+            raise
+        logger.error(f"Error processing {url}: {e}")
+        return {"url": url, "error": str(e) or type(e).__name__}, None
+
+def extract_url_node(task: UrlTask, config: RunnableConfig):
+    """
+    单个 URL 的分支：抓取 -> 提取 -> 分析 -> 保存片段。
+    临时性错误按 EXTRACT_RETRY_ATTEMPTS 重试，最后一次仍失败时记为 failed 而不是抛出，
+    保证其他分支的结果与 join 节点（合并分析、去重、快照）不受单个 URL 影响。
+    """
+    url = task["url"]
+    pipeline = _pipeline_for(task["project_name"], task.get("target_url_prefix", ""), task.get("force_refresh", False))
+    _resume_pipeline(pipeline, config)
+    attempts = max(1, (settings.pipeline if settings else PipelineSettings()).retry_attempts)
+    for attempt in range(1, attempts + 1):
+        try:
+            record, filepath = _extract_url(pipeline, url)
+            break
+        except Exception as e:
+            if attempt >= attempts:
+                logger.error(f"Giving up on {url} after {attempts} attempts: {e}")
+                record, filepath = {"url": url, "status": "failed", "error": str(e) or type(e).__name__}, None
+                break
+            delay = random.uniform(0, RETRY_BACKOFF_BASE * (2 ** (attempt - 1)))
+            logger.warning(f"Transient error on {url} ({e}), retry {attempt}/{attempts - 1} in {delay:.1f}s")
+            time.sleep(delay)
+    if pipeline.meter:
+        pipeline.meter.tick()
+    return {"results": {url: record}, "fragment_files": [filepath] if filepath else []}
+
+def join_node(state: AgentState):
+    """
+    汇合所有 URL 分支：合并分析推迟的短页面，为重复页面复制规范页面的片段，清理正文存储，推进 sitemap 快照
+    """
+    logger.info("Executing join_node...")
+    project_name = state.get("project_name", "langchain")
+    results = state.get("results") or {}
+    
+    deferred = [record for record in results.values() if record.get("status") == "deferred"]
+    update = {"results": {}, "fragment_files": []}
+    pipeline = _pipeline_for(project_name, state.get("target_url_prefix", ""), state.get("force_refresh", False))
+    if deferred:
+        packed_results, packed_files = pipeline.process_deferred(deferred)
+        results = {**results, **packed_results}
+        update["results"].update(packed_results)
+        update["fragment_files"].extend(packed_files)
+    
+    # 规范页面（包括刚合并分析的短页面）都已保存片段后再处理重复页面
+    duplicates = [record for record in results.values() if record.get("status") == "duplicate"]
+    if duplicates:
+        resolved, copied = pipeline.resolve_duplicates(duplicates)
+        results = {**results, **resolved}
+        update["results"].update(resolved)
+        update["fragment_files"].extend(copied)
+        reused = sum(1 for record in resolved.values() if record.get("status") == "duplicate" and not record.get("error"))
+        stats = pipeline.dedup.stats if pipeline.dedup else {}
+        logger.info(f"Deduplicated {len(duplicates)} pages "
+                    f"({stats.get('url_aliases', 0)} URL aliases, {stats.get('exact', 0)} exact, "
+                    f"{stats.get('near', 0)} near duplicates): {reused} LLM analyses saved")
+    
+    # 短页面与重复页面都已处理，正文不再需要；仍为 deferred 的页面（理论上没有）保留正文
+    if pipeline.blob_store:
+        keep = {record["blob"] for record in results.values()
+                if record.get("status") == "deferred" and record.get("blob")}
+        removed, freed = pipeline.blob_store.prune(keep)
+        if removed:
+            logger.info(f"Pruned {removed} page bodies ({freed / 1024:.1f} KiB) from the blob store")
+    
+    # 推进 sitemap 快照：只记录处理成功的页面
+    lastmods = state.get("sitemap_lastmod") or {}
+    if lastmods:
+        done = {url: lastmods[url] for url, record in results.items()
+                if url in lastmods and not record.get("error")}
+        scanner.save_snapshot(_snapshot_path(project_name), done)
+    
+    failed = sum(1 for record in results.values() if record.get("error"))
+    throughput = f", throughput {pipeline.meter.pages_per_minute():.1f} pages/min" if pipeline.meter else ""
+    logger.info(f"Extraction joined: {len(results) - failed}/{len(results)} URLs succeeded, "
+                f"{len(state.get('fragment_files', [])) + len(update.get('fragment_files', []))} fragments"
+                f"{throughput}")
+    return {**update, "current_step": "extraction_complete"}
 
 def outline_node(state: AgentState):
     """
@@ -98,25 +318,43 @@ def outline_node(state: AgentState):
     
     return {"outline": outline_text, "current_step": "complete"}
 
+def create_checkpointer(path: str):
+    """
+    基于 SQLite 文件的 checkpointer，进程崩溃或中断后可通过 thread_id 恢复。
+    """
+    from langgraph.checkpoint.sqlite import SqliteSaver
+    
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    return SqliteSaver(sqlite3.connect(path, check_same_thread=False))
+
 def create_graph(checkpointer=None):
+    # 按当前配置与 extractor / generator 重新构建流水线
+    global _checkpointer
+    if checkpointer is None:
+        checkpointer = MemorySaver()
+    with _pipelines_lock:
+        _pipelines.clear()
+        _checkpointer = checkpointer
     workflow = StateGraph(AgentState)
     
     # 添加节点
     workflow.add_node("scan", scan_node)
-    workflow.add_node("extract", extract_node)
+    workflow.add_node("dispatch", dispatch_node)
+    workflow.add_node("extract_url", extract_url_node)
+    workflow.add_node("join", join_node)
     # workflow.add_node("outline", outline_node)
     
     # 设置入口
     workflow.set_entry_point("scan")
     
     # 连接
-    workflow.add_edge("scan", "extract")
-    # workflow.add_edge("extract", "outline")
-    workflow.add_edge("extract", END)
+    workflow.add_edge("scan", "dispatch")
+    workflow.add_conditional_edges("dispatch", _fan_out, ["extract_url", "join", END])
+    workflow.add_edge("extract_url", "join")
+    # workflow.add_edge("join", "outline")
+    workflow.add_edge("join", END)
     # workflow.add_edge("outline", END)
     
     # 编译图
-    if checkpointer is None:
-        checkpointer = MemorySaver()
     app = workflow.compile(interrupt_after=["scan"], checkpointer=checkpointer)
     return app
@@ -0,0 +1,71 @@
+import hashlib
+import os
+import threading
+from typing import Iterable, Optional, Tuple
+
+class BlobStore:
+    """
+    按内容寻址的正文存储：以 sha256 作为文件名（按前两位分目录），相同内容只写一次。
+    图状态与检查点中只保存哈希，正文留在磁盘上，按需读取。
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    @staticmethod
+    def key_for(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key)
+
+    def __contains__(self, key: str) -> bool:
+        return os.path.exists(self.path(key))
+
+    def put_text(self, text: str) -> Tuple[str, int]:
+        """保存正文。Returns: (哈希, 字节数)"""
+        data = text.encode("utf-8")
+        key = self.key_for(data)
+        path = self.path(key)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return key, len(data)
+
+    def get_text(self, key: str) -> Optional[str]:
+        try:
+            with open(self.path(key), "rb") as f:
+                return f.read().decode("utf-8")
+        except OSError:
+            return None
+
+    def prune(self, keep: Iterable[str] = ()) -> Tuple[int, int]:
+        """
+        删除 keep 以外的所有正文（及残留的临时文件）和空目录。
+        只在没有分支写入时调用（提取图的 join 节点之后）。Returns: (删除的文件数, 释放的字节数)
+        """
+        keep = set(keep)
+        removed = freed = 0
+        if not os.path.isdir(self.root):
+            return removed, freed
+        for entry in os.scandir(self.root):
+            if not entry.is_dir():
+                continue
+            for blob in os.scandir(entry.path):
+                if blob.name in keep:
+                    continue
+                try:
+                    size = blob.stat().st_size
+                    os.remove(blob.path)
+                except OSError:
+                    continue
+                removed += 1
+                freed += size
+            try:
+                os.rmdir(entry.path)
+            except OSError:
+                pass
+        return removed, freed
@@ -17,16 +17,125 @@ class LLMSettings(BaseModel):
     base_url: str = Field(..., alias="BASIC_MODEL_BASE_URL")
     api_key: str = Field(..., alias="BASIC_MODEL_API_KEY")
     model: str = Field(..., alias="BASIC_MODEL_MODEL")
+    # 限流与重试：0 表示不限制
+    requests_per_minute: int = Field(default=0, alias="BASIC_MODEL_RPM")
+    tokens_per_minute: int = Field(default=0, alias="BASIC_MODEL_TPM")
+    max_retries: int = Field(default=5, alias="BASIC_MODEL_MAX_RETRIES")
+    # 每百万 token 的价格，用于 metrics.json 中的费用估算；0 表示不计算
+    prompt_price: float = Field(default=0.0, alias="BASIC_MODEL_PROMPT_PRICE")
+    completion_price: float = Field(default=0.0, alias="BASIC_MODEL_COMPLETION_PRICE")
+
+    class Config:
+        populate_by_name = True
+
+class PipelineSettings(BaseModel):
+    """
+    抓取 / 分析流水线的并发配置
+    """
+    # 同时进行的 LLM 分析调用数（各 URL 分支共享，join 中合并分析短页面同样使用）
+    analyze_workers: int = Field(default=4, alias="ANALYZE_WORKERS")
+    # 正文解析方式：thread（线程池）或 process（进程池，绕开 GIL）
+    extract_mode: str = Field(default="thread", alias="EXTRACT_MODE")
+    # 进程池大小，0 表示使用 CPU 核数
+    parse_workers: int = Field(default=0, alias="EXTRACT_PARSE_WORKERS")
+    # 下载后端：thread（requests 线程池）或 async（asyncio + httpx）
+    fetch_backend: str = Field(default="thread", alias="EXTRACT_BACKEND")
+    # async 后端：总在途请求数、每个主机的并发上限、同一主机两次请求的最小间隔（秒）
+    async_concurrency: int = Field(default=100, alias="EXTRACT_ASYNC_CONCURRENCY")
+    per_host_limit: int = Field(default=8, alias="EXTRACT_PER_HOST_LIMIT")
+    politeness_delay: float = Field(default=0.0, alias="EXTRACT_POLITENESS_DELAY")
+    # 提取图中同时运行的单 URL 分支数上限（LangGraph max_concurrency）
+    max_concurrency: int = Field(default=5, alias="EXTRACT_MAX_CONCURRENCY")
+    # 单 URL 分支遇到网络超时 / 429 / 5xx 时的最大尝试次数（含首次）
+    retry_attempts: int = Field(default=3, alias="EXTRACT_RETRY_ATTEMPTS")
+    # 分析前去重：URL 规范化 + 正文哈希 + SimHash，重复页面复用规范页面的片段
+    dedup_enabled: bool = Field(default=True, alias="EXTRACT_DEDUP")
+    # SimHash 汉明距离阈值（64 位），不超过该值视为近似重复；-1 表示只做精确去重
+    dedup_distance: int = Field(default=3, alias="EXTRACT_DEDUP_DISTANCE")
+
+    class Config:
+        populate_by_name = True
+
+class HttpCacheSettings(BaseModel):
+    """
+    条件请求 (ETag / Last-Modified) 缓存配置
+    """
+    enabled: bool = Field(default=True, alias="HTTP_CACHE_ENABLED")
+    cache_dir: str = Field(default=os.path.join("outputs", ".http_cache"), alias="HTTP_CACHE_DIR")
+    max_mb: int = Field(default=512, alias="HTTP_CACHE_MAX_MB")
+
+    class Config:
+        populate_by_name = True
+
+class LLMCacheSettings(BaseModel):
+    """
+    LLM 响应缓存配置
+    """
+    enabled: bool = Field(default=True, alias="LLM_CACHE_ENABLED")
+    cache_dir: str = Field(default=os.path.join("outputs", ".llm_cache"), alias="LLM_CACHE_DIR")
+    max_mb: int = Field(default=256, alias="LLM_CACHE_MAX_MB")
+
+    class Config:
+        populate_by_name = True
+
+class GenerationSettings(BaseModel):
+    """
+    页面分析与文档生成阶段配置
+    """
+    # 片段内存缓存上限（MB），超出后按 LRU 淘汰
+    fragment_cache_mb: int = Field(default=256, alias="FRAGMENT_CACHE_MB")
+    # 片段存储：files（每个 URL 一个 JSON 文件）或 jsonl（追加写入的单一日志 + 偏移索引）
+    fragment_backend: str = Field(default="files", alias="FRAGMENT_BACKEND")
+    # jsonl 日志的 fsync 策略：always（每次追加）、close（关闭时）、never
+    fragment_fsync: str = Field(default="close", alias="FRAGMENT_FSYNC")
+    # 单次分析的正文 token 上限，超出的页面按段落 / 行切块后并行分析再合并
+    chunk_tokens: int = Field(default=6000, alias="ANALYZE_CHUNK_TOKENS")
+    chunk_workers: int = Field(default=4, alias="ANALYZE_CHUNK_WORKERS")
+    # 同一小节的短页面合并为一次调用的 token 预算，0 表示不合并
+    pack_tokens: int = Field(default=3000, alias="ANALYZE_PACK_TOKENS")
+    # 单次合并调用最多包含的页面数，页面过多时输出 JSON 变长、更易解析失败
+    pack_max_pages: int = Field(default=8, alias="ANALYZE_PACK_MAX_PAGES")
+    # 分析结果的输出方式：parser（提示词中给出 JSON 格式，解析文本）或 structured（模型的结构化输出 / function calling）
+    output_mode: str = Field(default="parser", alias="ANALYZE_OUTPUT_MODE")
+    # 输出未通过校验时，把错误反馈给模型修复的最大次数
+    repair_attempts: int = Field(default=2, alias="ANALYZE_REPAIR_ATTEMPTS")
+    # 片段整合 (Map-Reduce)：每批输入的 token 预算、最终合并的上下文预算、并发数
+    integrate_batch_tokens: int = Field(default=12000, alias="INTEGRATE_BATCH_TOKENS")
+    integrate_context_tokens: int = Field(default=24000, alias="INTEGRATE_CONTEXT_TOKENS")
+    integrate_workers: int = Field(default=4, alias="INTEGRATE_WORKERS")
+    # --visualize 时并发生成章节图表的线程数
+    visualize_workers: int = Field(default=4, alias="VISUALIZE_WORKERS")
 
     class Config:
         populate_by_name = True
 
 class AppSettings(BaseModel):
     llm: LLMSettings
+    pipeline: PipelineSettings = Field(default_factory=PipelineSettings)
+    http_cache: HttpCacheSettings = Field(default_factory=HttpCacheSettings)
+    llm_cache: LLMCacheSettings = Field(default_factory=LLMCacheSettings)
+    generation: GenerationSettings = Field(default_factory=GenerationSettings)
     
     # 可以在这里添加其他配置，如输出目录等
     output_dir: Path = Field(default=Path("outputs"))
 
+def _env_int(name: str, default: int) -> int:
+    """读取整数类型的环境变量，未设置时返回默认值"""
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+def _env_float(name: str, default: float) -> float:
+    """读取浮点类型的环境变量，未设置时返回默认值"""
+    value = os.environ.get(name)
+    return float(value) if value else default
+
+def _env_bool(name: str, default: bool) -> bool:
+    """读取布尔类型的环境变量 (1/true/yes/on)，未设置时返回默认值"""
+    value = os.environ.get(name)
+    if not value:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
 def load_config() -> AppSettings:
     """
     从环境变量加载配置
@@ -39,10 +148,58 @@ def load_config() -> AppSettings:
         llm_settings = LLMSettings(
             base_url=os.environ["BASIC_MODEL_BASE_URL"],
             api_key=os.environ["BASIC_MODEL_API_KEY"],
-            model=os.environ["BASIC_MODEL_MODEL"]
+            model=os.environ["BASIC_MODEL_MODEL"],
+            requests_per_minute=_env_int("BASIC_MODEL_RPM", 0),
+            tokens_per_minute=_env_int("BASIC_MODEL_TPM", 0),
+            max_retries=_env_int("BASIC_MODEL_MAX_RETRIES", 5),
+            prompt_price=_env_float("BASIC_MODEL_PROMPT_PRICE", 0.0),
+            completion_price=_env_float("BASIC_MODEL_COMPLETION_PRICE", 0.0)
+        )
+        
+        pipeline_settings = PipelineSettings(
+            analyze_workers=_env_int("ANALYZE_WORKERS", 4),
+            extract_mode=os.environ.get("EXTRACT_MODE") or "thread",
+            parse_workers=_env_int("EXTRACT_PARSE_WORKERS", 0),
+            fetch_backend=os.environ.get("EXTRACT_BACKEND") or "thread",
+            async_concurrency=_env_int("EXTRACT_ASYNC_CONCURRENCY", 100),
+            per_host_limit=_env_int("EXTRACT_PER_HOST_LIMIT", 8),
+            politeness_delay=_env_float("EXTRACT_POLITENESS_DELAY", 0.0),
+            max_concurrency=_env_int("EXTRACT_MAX_CONCURRENCY", 5),
+            retry_attempts=_env_int("EXTRACT_RETRY_ATTEMPTS", 3),
+            dedup_enabled=_env_bool("EXTRACT_DEDUP", True),
+            dedup_distance=_env_int("EXTRACT_DEDUP_DISTANCE", 3)
+        )
+        
+        http_cache_settings = HttpCacheSettings(
+            enabled=_env_bool("HTTP_CACHE_ENABLED", True),
+            cache_dir=os.environ.get("HTTP_CACHE_DIR") or os.path.join("outputs", ".http_cache"),
+            max_mb=_env_int("HTTP_CACHE_MAX_MB", 512)
+        )
+        
+        llm_cache_settings = LLMCacheSettings(
+            enabled=_env_bool("LLM_CACHE_ENABLED", True),
+            cache_dir=os.environ.get("LLM_CACHE_DIR") or os.path.join("outputs", ".llm_cache"),
+            max_mb=_env_int("LLM_CACHE_MAX_MB", 256)
+        )
+        
+        generation_settings = GenerationSettings(
+            fragment_cache_mb=_env_int("FRAGMENT_CACHE_MB", 256),
+            fragment_backend=os.environ.get("FRAGMENT_BACKEND") or "files",
+            fragment_fsync=os.environ.get("FRAGMENT_FSYNC") or "close",
+            chunk_tokens=_env_int("ANALYZE_CHUNK_TOKENS", 6000),
+            chunk_workers=_env_int("ANALYZE_CHUNK_WORKERS", 4),
+            pack_tokens=_env_int("ANALYZE_PACK_TOKENS", 3000),
+            pack_max_pages=_env_int("ANALYZE_PACK_MAX_PAGES", 8),
+            output_mode=os.environ.get("ANALYZE_OUTPUT_MODE") or "parser",
+            repair_attempts=_env_int("ANALYZE_REPAIR_ATTEMPTS", 2),
+            integrate_batch_tokens=_env_int("INTEGRATE_BATCH_TOKENS", 12000),
+            integrate_context_tokens=_env_int("INTEGRATE_CONTEXT_TOKENS", 24000),
+            integrate_workers=_env_int("INTEGRATE_WORKERS", 4),
+            visualize_workers=_env_int("VISUALIZE_WORKERS", 4)
         )
         
-        return AppSettings(llm=llm_settings)
+        return AppSettings(llm=llm_settings, pipeline=pipeline_settings, http_cache=http_cache_settings,
+                           llm_cache=llm_cache_settings, generation=generation_settings)
     except KeyError as e:
         raise ValueError(f"Missing required environment variable: {e}")
 
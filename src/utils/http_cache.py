@@ -0,0 +1,175 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional, Dict
+from loguru import logger
+from src.utils.config import settings, HttpCacheSettings
+
+class CachedResponse:
+    """
+    条件请求的结果。from_cache 为 True 表示服务端返回 304，正文来自本地缓存。
+    """
+
+    def __init__(self, url: str, content: bytes, encoding: Optional[str], status_code: int, from_cache: bool):
+        self.url = url
+        self.content = content
+        self.encoding = encoding
+        self.status_code = status_code
+        self.from_cache = from_cache
+
+    @property
+    def text(self) -> str:
+        return self.content.decode(self.encoding or "utf-8", errors="replace")
+
+class HttpCache:
+    """
+    基于 ETag / Last-Modified 的持久化 HTTP 缓存。
+    每个 URL 保存校验器与响应正文，下次请求时发送 If-None-Match / If-Modified-Since，
+    服务端返回 304 时直接使用本地副本。总大小超过 max_bytes 时按最近最少使用 (LRU) 淘汰。
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = 512 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+
+    def _db(self) -> sqlite3.Connection:
+        # 惰性打开，避免仅导入模块时就创建缓存目录
+        if self._conn is None:
+            os.makedirs(os.path.join(self.cache_dir, "bodies"), exist_ok=True)
+            self._conn = sqlite3.connect(os.path.join(self.cache_dir, "index.sqlite"), check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, encoding TEXT, "
+                "size INTEGER NOT NULL, last_access REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON entries(last_access)")
+            self._conn.commit()
+        return self._conn
+
+    def _body_path(self, url: str) -> str:
+        return os.path.join(self.cache_dir, "bodies", hashlib.sha256(url.encode("utf-8")).hexdigest())
+
+    def conditional_headers(self, url: str) -> Dict[str, str]:
+        """返回该 URL 的条件请求头（无缓存时为空）"""
+        with self._lock:
+            row = self._db().execute("SELECT etag, last_modified FROM entries WHERE url = ?", (url,)).fetchone()
+        headers = {}
+        if row:
+            etag, last_modified = row
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+        return headers
+
+    def lookup(self, url: str) -> Optional[CachedResponse]:
+        """读取本地副本并刷新访问时间。副本缺失时删除索引项并返回 None。"""
+        with self._lock:
+            db = self._db()
+            row = db.execute("SELECT encoding FROM entries WHERE url = ?", (url,)).fetchone()
+            if not row:
+                return None
+            try:
+                with open(self._body_path(url), "rb") as f:
+                    content = f.read()
+            except OSError:
+                db.execute("DELETE FROM entries WHERE url = ?", (url,))
+                db.commit()
+                return None
+            db.execute("UPDATE entries SET last_access = ? WHERE url = ?", (time.time(), url))
+            db.commit()
+        return CachedResponse(url, content, row[0], 304, from_cache=True)
+
+    def store(self, url: str, content: bytes, etag: Optional[str], last_modified: Optional[str],
+              encoding: Optional[str] = None):
+        """保存响应。没有任何校验器的响应无法做条件请求，不缓存。"""
+        if not etag and not last_modified:
+            return
+        if len(content) > self.max_bytes:
+            return
+        path = self._body_path(url)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with self._lock:
+            db = self._db()
+            with open(tmp_path, "wb") as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+            db.execute(
+                "INSERT OR REPLACE INTO entries (url, etag, last_modified, encoding, size, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (url, etag, last_modified, encoding, len(content), time.time())
+            )
+            self._evict(db)
+            db.commit()
+
+    def _evict(self, db: sqlite3.Connection):
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for url, size in db.execute("SELECT url, size FROM entries ORDER BY last_access").fetchall():
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(self._body_path(url))
+            except OSError:
+                pass
+            db.execute("DELETE FROM entries WHERE url = ?", (url,))
+            total -= size
+
+    def revalidated(self, url: str) -> Optional[CachedResponse]:
+        """服务端返回 304 后调用：读取本地副本并计入命中统计"""
+        cached = self.lookup(url)
+        if cached is not None:
+            with self._lock:
+                self.hits += 1
+                self.bytes_saved += len(cached.content)
+            logger.debug(f"HTTP cache hit (304): {url}")
+        return cached
+
+    def count_miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def fetch(self, http, url: str, headers: Optional[Dict[str, str]] = None, timeout: int = 10,
+              **kwargs) -> CachedResponse:
+        """
+        发送条件 GET 请求。http 可以是 requests 模块或 requests.Session。
+        非 2xx/304 响应会抛出 requests 的 HTTPError。
+        """
+        request_headers = dict(headers or {})
+        request_headers.update(self.conditional_headers(url))
+        response = http.get(url, headers=request_headers, timeout=timeout, **kwargs)
+
+        if response.status_code == 304:
+            cached = self.revalidated(url)
+            if cached is not None:
+                return cached
+            # 本地副本已丢失，去掉条件头重新请求
+            logger.debug(f"HTTP cache entry missing for {url}, refetching")
+            response = http.get(url, headers=dict(headers or {}), timeout=timeout, **kwargs)
+
+        response.raise_for_status()
+        self.count_miss()
+        content = response.content
+        encoding = response.encoding or getattr(response, "apparent_encoding", None)
+        self.store(url, content, response.headers.get("ETag"), response.headers.get("Last-Modified"), encoding)
+        return CachedResponse(url, content, encoding, response.status_code, from_cache=False)
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "bytes_saved": self.bytes_saved}
+
+def _create_default_cache() -> Optional[HttpCache]:
+    cache_settings = settings.http_cache if settings else HttpCacheSettings()
+    if not cache_settings.enabled:
+        return None
+    return HttpCache(cache_settings.cache_dir, max_bytes=cache_settings.max_mb * 1024 * 1024)
+
+# 单例：Extractor 与 Scanner 共享同一个缓存
+http_cache = _create_default_cache()
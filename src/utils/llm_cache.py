@@ -0,0 +1,111 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional, Dict, Any
+from loguru import logger
+from src.utils.config import settings, LLMCacheSettings
+
+class LLMResponseCache:
+    """
+    按内容寻址的持久化 LLM 响应缓存。
+    键为 (模型, temperature, 渲染后的提示消息) 的哈希，提示词或模型任一变化都会自然失效。
+    中断后重跑时，已完成的调用直接从本地返回。总大小超过 max_bytes 时按最近最少使用 (LRU) 淘汰。
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = 256 * 1024 * 1024, bypass: bool = False):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        # 为 True 时不读取缓存（新响应仍会写入），用于强制刷新
+        self.bypass = bypass
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _db(self) -> sqlite3.Connection:
+        # 惰性打开，避免仅导入模块时就创建缓存目录
+        if self._conn is None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._conn = sqlite3.connect(os.path.join(self.cache_dir, "responses.sqlite"), check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, model TEXT, content TEXT NOT NULL, metadata TEXT, "
+                "size INTEGER NOT NULL, last_access REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON responses(last_access)")
+            self._conn.commit()
+        return self._conn
+
+    @staticmethod
+    def make_key(model: Optional[str], temperature: Optional[float], prompt_value, variant: Optional[str] = None) -> str:
+        """模型 + temperature + 提示消息（类型与内容）的 sha256。variant 区分同一提示词的不同调用方式（如结构化输出）"""
+        if hasattr(prompt_value, "to_messages"):
+            messages = [[m.type, m.content] for m in prompt_value.to_messages()]
+        else:
+            messages = str(prompt_value)
+        key = {"model": model, "temperature": temperature, "messages": messages}
+        if variant:
+            key["variant"] = variant
+        payload = json.dumps(key, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Returns: {"content": str, "metadata": dict}，未命中或 bypass 时返回 None"""
+        if self.bypass:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            db = self._db()
+            row = db.execute("SELECT content, metadata FROM responses WHERE key = ?", (key,)).fetchone()
+            if not row:
+                self.misses += 1
+                return None
+            db.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+            db.commit()
+            self.hits += 1
+        return {"content": row[0], "metadata": json.loads(row[1]) if row[1] else {}}
+
+    def put(self, key: str, model: Optional[str], content: str, metadata: Optional[Dict[str, Any]] = None):
+        metadata_json = json.dumps(metadata or {}, ensure_ascii=False, default=str)
+        size = len(content.encode("utf-8")) + len(metadata_json)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            db = self._db()
+            db.execute(
+                "INSERT OR REPLACE INTO responses (key, model, content, metadata, size, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, content, metadata_json, size, time.time())
+            )
+            self._evict(db)
+            db.commit()
+
+    def _evict(self, db: sqlite3.Connection):
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in db.execute("SELECT key, size FROM responses ORDER BY last_access").fetchall():
+            if total <= self.max_bytes:
+                break
+            db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
+
+    def log_stats(self):
+        if self.hits or self.misses:
+            logger.info(f"LLM cache: {self.hits} hits, {self.misses} misses")
+
+def _create_default_cache() -> Optional[LLMResponseCache]:
+    cache_settings = settings.llm_cache if settings else LLMCacheSettings()
+    if not cache_settings.enabled:
+        return None
+    return LLMResponseCache(cache_settings.cache_dir, max_bytes=cache_settings.max_mb * 1024 * 1024)
+
+# 单例：Generator 与 Visualizer 共享同一个缓存
+llm_cache = _create_default_cache()
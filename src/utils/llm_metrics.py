@@ -0,0 +1,124 @@
+import json
+import math
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+from loguru import logger
+from src.utils.config import settings
+
+def _percentile(values: List[float], q: float) -> float:
+    """最近秩法分位数，values 需已排序"""
+    if not values:
+        return 0.0
+    index = max(0, min(len(values) - 1, math.ceil(q * len(values)) - 1))
+    return values[index]
+
+class LLMMetrics:
+    """
+    按调用位置 (call_site) 统计 LLM 调用：请求数、prompt / completion token、延迟分位数、重试、缓存命中与失败。
+    由 LLMClient 在每次调用时记录，线程安全。运行结束时写入 outputs/<project>/metrics.json，
+    用于判断哪个阶段占用了最多的费用与耗时。
+    prompt_price / completion_price 为每百万 token 的价格，均为 0 时不计算费用。
+    """
+
+    def __init__(self, prompt_price: float = 0.0, completion_price: float = 0.0):
+        self.prompt_price = prompt_price
+        self.completion_price = completion_price
+        self._sites: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def _site(self, call_site: str) -> Dict[str, Any]:
+        if call_site not in self._sites:
+            self._sites[call_site] = {"calls": 0, "errors": 0, "retries": 0, "cache_hits": 0,
+                                      "prompt_tokens": 0, "completion_tokens": 0, "estimated_calls": 0,
+                                      "latencies": []}
+        return self._sites[call_site]
+
+    def record_call(self, call_site: str, latency: float, prompt_tokens: int, completion_tokens: int,
+                    retries: int = 0, estimated: bool = False):
+        """
+        记录一次成功的模型请求。latency 包含重试与退避等待的时间；
+        estimated 表示响应中没有用量信息，token 数为本地估算值。
+        """
+        with self._lock:
+            site = self._site(call_site)
+            site["calls"] += 1
+            site["retries"] += retries
+            site["prompt_tokens"] += prompt_tokens
+            site["completion_tokens"] += completion_tokens
+            site["estimated_calls"] += int(estimated)
+            site["latencies"].append(latency)
+
+    def record_error(self, call_site: str, latency: float, retries: int = 0):
+        """记录一次重试耗尽或不可重试的失败请求"""
+        with self._lock:
+            site = self._site(call_site)
+            site["errors"] += 1
+            site["retries"] += retries
+            site["latencies"].append(latency)
+
+    def record_cache_hit(self, call_site: str):
+        with self._lock:
+            self._site(call_site)["cache_hits"] += 1
+
+    def _cost(self, prompt_tokens: int, completion_tokens: int) -> Optional[float]:
+        if not self.prompt_price and not self.completion_price:
+            return None
+        return round((prompt_tokens * self.prompt_price + completion_tokens * self.completion_price) / 1e6, 6)
+
+    def summary(self) -> Dict[str, Any]:
+        """Returns: {"call_sites": {call_site: 统计}, "total": 汇总}，调用位置按 token 总数降序"""
+        with self._lock:
+            sites = {name: dict(site, latencies=sorted(site["latencies"])) for name, site in self._sites.items()}
+
+        def summarize(site: Dict[str, Any]) -> Dict[str, Any]:
+            latencies = site.pop("latencies")
+            site["total_tokens"] = site["prompt_tokens"] + site["completion_tokens"]
+            site["latency_s"] = {"p50": round(_percentile(latencies, 0.5), 3),
+                                 "p90": round(_percentile(latencies, 0.9), 3),
+                                 "p99": round(_percentile(latencies, 0.99), 3),
+                                 "max": round(latencies[-1], 3) if latencies else 0.0,
+                                 "total": round(sum(latencies), 3)}
+            cost = self._cost(site["prompt_tokens"], site["completion_tokens"])
+            if cost is not None:
+                site["cost"] = cost
+            return site
+
+        total = {key: sum(site[key] for site in sites.values())
+                 for key in ("calls", "errors", "retries", "cache_hits", "prompt_tokens", "completion_tokens",
+                             "estimated_calls")}
+        total["latencies"] = sorted(latency for site in sites.values() for latency in site["latencies"])
+        call_sites = {name: summarize(site) for name, site in sites.items()}
+        call_sites = dict(sorted(call_sites.items(), key=lambda item: item[1]["total_tokens"], reverse=True))
+        return {"call_sites": call_sites, "total": summarize(total)}
+
+    def write(self, path: str) -> Dict[str, Any]:
+        """写入 JSON 汇总（先写临时文件再替换）。Returns: 汇总内容"""
+        summary = {"generated_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"), **self.summary()}
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+        return summary
+
+    def log_summary(self):
+        summary = self.summary()
+        for name, site in summary["call_sites"].items():
+            logger.info(f"LLM [{name}]: {site['calls']} calls, {site['cache_hits']} cache hits, "
+                        f"{site['retries']} retries, {site['errors']} errors, "
+                        f"{site['prompt_tokens']} + {site['completion_tokens']} tokens, "
+                        f"p50 {site['latency_s']['p50']:.2f}s / p90 {site['latency_s']['p90']:.2f}s, "
+                        f"total {site['latency_s']['total']:.1f}s"
+                        + (f", ${site['cost']:.4f}" if "cost" in site else ""))
+
+    def reset(self):
+        with self._lock:
+            self._sites.clear()
+
+# 单例：Generator 与 Visualizer 的所有 LLM 调用记录到同一份统计
+llm_metrics = LLMMetrics(
+    prompt_price=settings.llm.prompt_price,
+    completion_price=settings.llm.completion_price
+) if settings else LLMMetrics()
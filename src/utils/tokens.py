@@ -0,0 +1,78 @@
+import re
+from typing import List, Optional
+
+# CJK 字符大致按 1 token/字计算，其余文本按约 4 字符/token 估算
+_CJK_PATTERN = re.compile(r'[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]')
+
+_encoding = None
+_encoding_failed = False
+
+def _get_encoding():
+    """
+    惰性加载 tiktoken 编码器。tiktoken 首次使用需要下载词表，
+    离线或未安装时回退到启发式估算。
+    """
+    global _encoding, _encoding_failed
+    if _encoding is None and not _encoding_failed:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _encoding_failed = True
+    return _encoding
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """
+    估算文本的 token 数。
+    """
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+def _blocks(text: str, max_tokens: int) -> List[str]:
+    """
+    按段落（空行）切分；超长段落按行切分，超长单行按字符均分。
+    """
+    blocks = []
+    for paragraph in re.split(r'\n\s*\n', text):
+        paragraph = paragraph.strip("\n")
+        if not paragraph.strip():
+            continue
+        if estimate_tokens(paragraph) <= max_tokens:
+            blocks.append(paragraph)
+            continue
+        for line in paragraph.split("\n"):
+            tokens = estimate_tokens(line)
+            if tokens <= max_tokens:
+                blocks.append(line)
+                continue
+            pieces = -(-tokens // max_tokens)
+            size = -(-len(line) // pieces)
+            blocks.extend(line[i:i + size] for i in range(0, len(line), size))
+    return blocks
+
+def split_by_tokens(text: str, max_tokens: int) -> List[str]:
+    """
+    将长文本切分为不超过 max_tokens 的若干块，优先在段落与行边界处断开。
+    trafilatura 输出的纯文本每个元素（标题、段落、列表项）占一行，因此不会在句子中间断开。
+    """
+    if not text or estimate_tokens(text) <= max_tokens:
+        return [text] if text else []
+
+    chunks: List[str] = []
+    current: List[str] = []
+    current_tokens = 0
+    for block in _blocks(text, max_tokens):
+        tokens = estimate_tokens(block)
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append("\n\n".join(current))
+            current, current_tokens = [], 0
+        current.append(block)
+        current_tokens += tokens
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
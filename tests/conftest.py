@@ -0,0 +1,124 @@
+import os
+
+# settings 在 src.utils.config 导入时从环境变量加载，缺少 BASIC_MODEL_* 时为 None，
+# Generator / Visualizer 无法构造。测试只使用假模型，这里在任何测试模块导入之前补上占位配置
+# （mock 密钥使 Generator 进入模拟模式，需要调用假模型的测试自行关闭）。已设置的环境变量保持不变。
+for _name, _value in (("BASIC_MODEL_BASE_URL", "http://localhost:9/v1"),
+                      ("BASIC_MODEL_API_KEY", "mock"),
+                      ("BASIC_MODEL_MODEL", "gpt-4o")):
+    os.environ.setdefault(_name, _value)
+
+import threading
+import pytest
+import src.core.dedup as dedup
+import src.graph.workflow as workflow
+from src.core.extractor import PageContent
+from src.core.fragment_backend import get_fragment_backend
+from src.core.generator import Generator
+from src.utils.config import settings
+from src.utils.http_cache import http_cache
+from src.utils.llm_cache import llm_cache
+
+class Crash(BaseException):
+    """模拟进程中途被杀死"""
+
+class FakeExtractor:
+    """
+    不访问网络的抓取器：bodies 为 url -> 正文，未提供时按 body_size 生成正文。
+    failures 为 url -> 依次抛出的异常；标题取 URL 的最后一段
+    """
+
+    def __init__(self, bodies=None, body_size=0, failures=None):
+        self.bodies = bodies
+        self.body_size = body_size
+        self.failures = failures or {}
+        self.fetched = []
+        self._lock = threading.Lock()
+
+    def fetch(self, url):
+        with self._lock:
+            self.fetched.append(url)
+            if self.failures.get(url):
+                raise self.failures[url].pop(0)
+        content = self.bodies[url] if self.bodies is not None else f"content of {url} " + "BODY-TEXT " * self.body_size
+        return PageContent(url=url, title=url.rsplit("/", 1)[-1], content=content)
+
+class FakeGenerator:
+    """记录分析过的标题，片段写入真实的片段存储；crash_after 个页面之后抛出 Crash"""
+    copy_fragment = Generator.copy_fragment
+
+    def __init__(self, crash_after=None):
+        self.analyzed = []
+        self.crash_after = crash_after
+
+    def content_hash(self, title, content):
+        return f"hash-{title}"
+
+    def find_reusable_fragment(self, *args, **kwargs):
+        return None
+
+    def analyze_page(self, title, content):
+        if self.crash_after is not None and len(self.analyzed) >= self.crash_after:
+            raise Crash()
+        self.analyzed.append(title)
+        return {"summary": f"summary of {title}"}
+
+    def analyze_pages(self, pages):
+        self.analyzed.append([url for url, _, _ in pages])
+        return {url: {"summary": f"summary of {title}"} for url, title, _ in pages}
+
+    def save_analysis(self, analysis, url, output_dir, url_prefix="", content_hash=None):
+        os.makedirs(output_dir, exist_ok=True)
+        return get_fragment_backend(output_dir).save(url, {"url": url, "content_hash": content_hash, **analysis},
+                                                     url_prefix)
+
+class GraphEnv:
+    """提取图测试环境：换入假的抓取器 / 生成器，在 tmp_path 下创建检查点并完成扫描与审核"""
+
+    def __init__(self, monkeypatch, root):
+        self.monkeypatch = monkeypatch
+        self.checkpoint_path = str(root / "checkpoints.sqlite")
+
+    def use(self, extractor=None, generator=None):
+        if extractor is not None:
+            self.monkeypatch.setattr(workflow, "extractor", extractor)
+        if generator is not None:
+            self.monkeypatch.setattr(workflow, "generator", generator)
+
+    def create_app(self):
+        return workflow.create_graph(checkpointer=workflow.create_checkpointer(self.checkpoint_path))
+
+    def approve(self, app, config, project_name, urls):
+        """运行扫描并批准全部 URL，停在分发之前"""
+        app.invoke({"project_name": project_name, "candidate_urls": urls, "approved_urls": [], "results": {},
+                    "fragment_files": [], "current_step": "start", "error": None}, config=config)
+        app.update_state(config, {"approved_urls": urls})
+
+    @staticmethod
+    def project_dir(project_name):
+        return os.path.join(str(settings.output_dir), project_name)
+
+@pytest.fixture
+def graph_env(monkeypatch, tmp_path):
+    """
+    隔离的提取图环境：输出目录指向 tmp_path，短页面不合并，重试不等待，去重器从空开始。
+    换入的模块全局变量与配置在测试结束后由 monkeypatch 还原
+    """
+    monkeypatch.setattr(settings, "output_dir", tmp_path / "outputs")
+    monkeypatch.setattr(settings.generation, "pack_tokens", 0)
+    monkeypatch.setattr(workflow, "RETRY_BACKOFF_BASE", 0)
+    monkeypatch.setattr(dedup, "_detectors", {})
+    return GraphEnv(monkeypatch, tmp_path)
+
+@pytest.fixture(autouse=True)
+def isolated_caches(monkeypatch, tmp_path):
+    """共享的 HTTP / LLM 缓存单例改为写入 tmp_path，测试不在仓库中留下 outputs/"""
+    caches = [cache for cache in (http_cache, llm_cache) if cache is not None]
+    for cache in caches:
+        monkeypatch.setattr(cache, "cache_dir", str(tmp_path / os.path.basename(cache.cache_dir)))
+        monkeypatch.setattr(cache, "_conn", None)
+    yield
+    for cache in caches:
+        if cache._conn is not None:
+            cache._conn.close()
+
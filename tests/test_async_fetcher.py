@@ -0,0 +1,173 @@
+import concurrent.futures
+import hashlib
+import http.server
+import os
+import sys
+import threading
+import time
+import httpx
+import pytest
+from loguru import logger
+from src.core.async_fetcher import AsyncFetcher
+from src.utils.http_cache import HttpCache
+
+BODY = b"<html><head><title>Async</title></head><body>hello</body></html>"
+ETAG = '"%s"' % hashlib.md5(BODY).hexdigest()
+
+class ScriptedServer:
+    """
+    本地 HTTP 服务器：/status/<code> 按脚本依次返回状态码，/etag 支持条件请求，
+    /slow 与 /hang 用于观察并发与取消。记录每个请求的路径与条件头。
+    """
+
+    def __init__(self):
+        self.requests = []
+        self.scripts = {}
+        self.active = self.peak = 0
+        self.release = threading.Event()
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                with server._lock:
+                    server.requests.append((self.path, self.headers.get("If-None-Match")))
+                try:
+                    server.handle(self)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass   # 客户端已取消请求
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.base = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def paths(self, path):
+        return [p for p, _ in self.requests if p == path]
+
+    def handle(self, request):
+        path = request.path
+        if path in self.scripts and self.scripts[path]:
+            status, headers = self.scripts[path].pop(0)
+            request.send_response(status)
+            for name, value in headers.items():
+                request.send_header(name, value)
+            request.send_header("Content-Length", "0")
+            request.end_headers()
+            return
+        if path == "/etag" and request.headers.get("If-None-Match") == ETAG:
+            request.send_response(304)
+            request.end_headers()
+            return
+        if path.startswith("/slow"):
+            with self._lock:
+                self.active += 1
+                self.peak = max(self.peak, self.active)
+            time.sleep(0.2)
+            with self._lock:
+                self.active -= 1
+        if path == "/hang":
+            self.release.wait(10)
+        request.send_response(200)
+        request.send_header("ETag", ETAG)
+        request.send_header("Content-Type", "text/html; charset=utf-8")
+        request.send_header("Content-Length", str(len(BODY)))
+        request.end_headers()
+        request.wfile.write(BODY)
+
+@pytest.fixture
+def server():
+    server = ScriptedServer()
+    yield server
+    server.release.set()
+    server.httpd.shutdown()
+    server.httpd.server_close()
+
+@pytest.fixture
+def make_fetcher():
+    fetchers = []
+
+    def make(**kwargs):
+        fetcher = AsyncFetcher(**{"timeout": 5, "backoff_base": 0, **kwargs})
+        fetchers.append(fetcher)
+        return fetcher
+
+    yield make
+    for fetcher in fetchers:
+        fetcher.close()
+
+def test_retry_after_on_429(server, make_fetcher):
+    fetcher = make_fetcher(max_retries=2)
+    server.scripts["/limited"] = [(429, {"Retry-After": "1"})]
+    start = time.monotonic()
+    content, encoding = fetcher.fetch(f"{server.base}/limited")
+    # 退避基数为 0，等待时间只来自 Retry-After
+    assert time.monotonic() - start >= 0.9
+    assert content == BODY and encoding == "utf-8" and len(server.paths("/limited")) == 2
+
+    # 5xx 重试耗尽后抛出，4xx 不重试
+    server.scripts["/down"] = [(503, {})] * 3
+    with pytest.raises(httpx.HTTPStatusError):
+        fetcher.fetch(f"{server.base}/down")
+    assert len(server.paths("/down")) == 3
+    server.scripts["/missing"] = [(404, {})]
+    with pytest.raises(httpx.HTTPStatusError):
+        fetcher.fetch(f"{server.base}/missing")
+    assert len(server.paths("/missing")) == 1
+
+def test_304_revalidation_through_cache(server, make_fetcher, tmp_path):
+    cache = HttpCache(str(tmp_path / "http"))
+    fetcher = make_fetcher(cache=cache)
+    url = f"{server.base}/etag"
+
+    assert fetcher.fetch(url) == (BODY, "utf-8")
+    assert fetcher.fetch(url) == (BODY, "utf-8")
+    # 第二次带上 If-None-Match，服务端返回 304，正文来自本地副本
+    assert server.requests == [("/etag", None), ("/etag", ETAG)]
+    assert cache.stats() == {"hits": 1, "misses": 1, "bytes_saved": len(BODY)}
+
+def test_304_without_local_copy_refetches(server, make_fetcher, tmp_path):
+    cache = HttpCache(str(tmp_path / "http"))
+    fetcher = make_fetcher(cache=cache)
+    url = f"{server.base}/etag"
+    fetcher.fetch(url)
+
+    # 本地副本丢失：304 后去掉条件头重新请求完整正文
+    os.remove(cache._body_path(url))
+    assert fetcher.fetch(url) == (BODY, "utf-8")
+    assert server.requests == [("/etag", None), ("/etag", ETAG), ("/etag", None)]
+    assert cache.stats()["hits"] == 0 and cache.conditional_headers(url) == {"If-None-Match": ETAG}
+
+def test_per_host_limit(server, make_fetcher):
+    fetcher = make_fetcher(concurrency=10, per_host=2)
+    urls = [f"{server.base}/slow-{i}" for i in range(6)]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=6) as pool:
+        results = list(pool.map(fetcher.fetch, urls))
+    # 6 个调用方同时提交，同一主机在途请求不超过 per_host
+    assert all(content == BODY for content, _ in results)
+    assert server.peak == 2
+    logger.success(f"Per-host limit held at {server.peak} in-flight requests.")
+
+def test_close_cancels_in_flight_fetch(server, make_fetcher):
+    fetcher = make_fetcher()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as pool:
+        pending = pool.submit(fetcher.fetch, f"{server.base}/hang")
+        deadline = time.monotonic() + 5
+        while not server.paths("/hang") and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert server.paths("/hang")
+
+        # 服务端仍未响应时关闭：在途请求被取消，调用方立即收到 CancelledError
+        start = time.monotonic()
+        fetcher.close()
+        assert time.monotonic() - start < 2
+        with pytest.raises(concurrent.futures.CancelledError):
+            pending.result(timeout=2)
+    assert fetcher._loop is None and not fetcher._hosts
+    logger.success("close() cancelled the in-flight request.")
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,126 @@
+import json
+from langchain_core.messages import AIMessage
+from loguru import logger
+from src.core.extractor import parse_page
+from src.utils.tokens import estimate_tokens, split_by_tokens
+from src.core.generator import Generator, PageAnalysis, KnowledgePoint
+from src.core.pipeline import SectionPacker
+
+def test_split_by_tokens_keeps_all_content():
+    sections = []
+    for s in range(12):
+        paragraphs = [f"Paragraph {s}.{p}: " + "agents call tools and observe results. " * 30 for p in range(5)]
+        sections.append(f"# Section {s}\n\n" + "\n\n".join(paragraphs))
+    text = "\n\n".join(sections) + "\n\n" + "x" * 20000  # 一个没有任何边界的超长行
+
+    chunks = split_by_tokens(text, 1000)
+    assert len(chunks) > 1
+    assert all(estimate_tokens(c) <= 1000 for c in chunks)
+    # 不丢内容：去掉空白后拼接结果与原文一致
+    assert "".join("".join(chunks).split()) == "".join(text.split())
+    assert split_by_tokens("short page", 1000) == ["short page"]
+    logger.success(f"Split {estimate_tokens(text)} tokens into {len(chunks)} chunks without loss.")
+
+def test_split_real_extractor_output_at_line_boundaries():
+    # trafilatura 的纯文本输出：标题与段落各占一行，没有空行与 Markdown 标题
+    body = "".join(f"<h2>Section {s}</h2>" + "".join(
+        f"<p>Paragraph {s}.{p}: " + "agents call tools and observe results. " * 20 + "</p>" for p in range(4))
+        for s in range(10))
+    page = parse_page("https://docs.example.com/guide", f"<html><body><article>{body}</article></body></html>")
+    lines = page.content.split("\n")
+    assert "\n\n" not in page.content and not any(line.startswith("#") for line in lines)
+
+    chunks = split_by_tokens(page.content, 1000)
+    assert len(chunks) > 1 and all(estimate_tokens(c) <= 1000 for c in chunks)
+    # 每块由完整的行组成，拼接后与原文逐行一致
+    assert [line for c in chunks for line in c.split("\n\n")] == lines
+    logger.success(f"Split {len(lines)} extracted lines into {len(chunks)} chunks at line boundaries.")
+
+def test_merge_analyses_dedups_knowledge_points():
+    a = PageAnalysis(summary="Part one.", page_type="Reference", knowledge_points=[
+        KnowledgePoint(concept="Agent (智能体)", explanation="short", importance=3, tags=["core"]),
+        KnowledgePoint(concept="Tool", explanation="tool", importance=2),
+    ])
+    b = PageAnalysis(summary="Part two.", page_type="Guide", knowledge_points=[
+        KnowledgePoint(concept="agent", explanation="better", importance=5, tags=["runtime"]),
+        KnowledgePoint(concept="Memory", explanation="memory", importance=4),
+    ])
+    merged = Generator.merge_analyses([a, b])
+    assert merged.page_type == "Reference"
+    assert merged.summary == "Part one.\nPart two."
+    assert [kp.concept for kp in merged.knowledge_points] == ["Agent (智能体)", "Tool", "Memory"]
+    agent = merged.knowledge_points[0]
+    assert agent.importance == 5 and agent.explanation == "better" and agent.tags == ["core", "runtime"]
+    # 原始结果未被修改
+    assert a.knowledge_points[0].importance == 3
+    logger.success("Chunk analyses merged with deduplicated knowledge points.")
+
+def test_section_packer_groups_by_section():
+    packer = SectionPacker(budget=100, max_pending=5)
+    assert packer.add("https://d.com/a/1", "a1", 40) == []
+    assert packer.add("https://d.com/b/1", "b1", 40) == []
+    # 同一小节超过预算：先提交已有分组
+    assert packer.add("https://d.com/a/2", "a2", 70) == [["a1"]]
+    # 恰好达到预算：立即提交
+    assert packer.add("https://d.com/a/3", "a3", 30) == [["a2", "a3"]]
+    # 待合并页面过多：提交最早的分组
+    for i in range(4):
+        packer.add(f"https://d.com/c/{i}", f"c{i}", 1)
+    assert packer.add("https://d.com/d/1", "d1", 1) == [["b1"]]
+    assert packer.drain() == [["c0", "c1", "c2", "c3"], ["d1"]]
+    assert packer.drain() == []
+    # 页面数上限：预算未满也提交
+    packer = SectionPacker(budget=100, max_pages=2)
+    assert packer.add("https://d.com/e/1", "e1", 1) == []
+    assert packer.add("https://d.com/e/2", "e2", 1) == [["e1", "e2"]]
+    logger.success("Section packer groups short pages per section within budget.")
+
+class FakeClient:
+    """合并调用返回 packed_reply（可为无效 JSON），单页调用返回固定分析"""
+
+    def __init__(self, packed_reply):
+        self.packed_reply = packed_reply
+        self.calls = []
+
+    def invoke(self, prompt_value, call_site="llm", validate=None, cache_prompt=None):
+        self.calls.append((call_site, prompt_value.to_string()))
+        if call_site == "analyze_pages":
+            return AIMessage(content=self.packed_reply)
+        return AIMessage(content=json.dumps({"summary": "single", "page_type": "Guide", "knowledge_points": []}))
+
+def test_analyze_pages_packs_and_falls_back():
+    generator = Generator()
+    generator.is_mock_mode = False
+    pages = [(f"https://d.com/guide/{i}", f"Page {i}", f"Body of page {i}. " * 20) for i in range(5)]
+    analysis = {"summary": "packed", "page_type": "Concept",
+                "knowledge_points": [{"concept": "Agent", "explanation": "e", "tags": [], "importance": 3}]}
+
+    # 一次调用返回 4 个页面，遗漏的 1 个单独分析
+    generator.client = FakeClient(json.dumps({"pages": [{"url": url, "analysis": analysis} for url, _, _ in pages[:4]]}))
+    results = generator.analyze_pages(pages)
+    assert [site for site, _ in generator.client.calls] == ["analyze_pages", "analyze_page"]
+    assert [results[url].summary for url, _, _ in pages] == ["packed"] * 4 + ["single"]
+    # 合并调用的提示词比逐页调用的总和短
+    packed_prompt = generator.client.calls[0][1]
+    single_prompts = sum(estimate_tokens(generator.analyze_prompt.invoke({
+        "title": title, "content": content, "format_instructions": generator.parser.get_format_instructions()
+    }).to_string()) for _, title, content in pages)
+    assert estimate_tokens(packed_prompt) < single_prompts / 2
+    assert generator.pack_stats["pages"] == 4 and generator.pack_stats["tokens_saved"] > 0
+
+    # 解析失败（不修复）：全部退回逐页分析
+    generator.repair_attempts = 0
+    generator.client = FakeClient("not json")
+    results = generator.analyze_pages(pages)
+    assert len(generator.client.calls) == 1 + len(pages)
+    assert all(results[url].summary == "single" for url, _, _ in pages)
+    assert generator.pack_stats["fallback_pages"] == 1 + len(pages)
+    logger.success(f"Packed {len(pages)} pages into one call: {estimate_tokens(packed_prompt)} vs "
+                   f"{single_prompts} prompt tokens.")
+
+if __name__ == "__main__":
+    test_split_by_tokens_keeps_all_content()
+    test_split_real_extractor_output_at_line_boundaries()
+    test_merge_analyses_dedups_knowledge_points()
+    test_section_packer_groups_by_section()
+    test_analyze_pages_packs_and_falls_back()
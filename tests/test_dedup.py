@@ -0,0 +1,136 @@
+import os
+import sys
+import pytest
+from loguru import logger
+import src.core.dedup as dedup
+import src.graph.workflow as workflow
+from conftest import Crash, FakeExtractor, FakeGenerator
+from src.core.dedup import DuplicateDetector, canonicalize_url, get_detector
+from src.core.fragment_backend import get_fragment_backend
+from src.core.pipeline import AnalysisPipeline
+from src.utils.blob_store import BlobStore
+
+def _body(words=1000, replace=None):
+    tokens = [f"token{i}" for i in range(words)]
+    for index, word in (replace or {}).items():
+        tokens[index] = word
+    return " ".join(tokens)
+
+def test_canonicalize_and_claim():
+    assert canonicalize_url("HTTPS://Docs.Example.com:443/guide/index.html?utm_source=x&b=2&a=1#top") == \
+        "https://docs.example.com/guide?a=1&b=2"
+    assert canonicalize_url("https://docs.example.com/guide/") == canonicalize_url("https://docs.example.com//guide")
+    assert canonicalize_url("http://docs.example.com:8080/a") == "http://docs.example.com:8080/a"
+    # readme 是独立页面，不与所在目录合并
+    assert canonicalize_url("https://docs.example.com/guide/readme") != canonicalize_url("https://docs.example.com/guide")
+
+    detector = DuplicateDetector(max_distance=3)
+    kept, aliases = detector.group_urls(["https://d.com/a", "https://d.com/a/", "https://d.com/b"])
+    assert kept == ["https://d.com/a", "https://d.com/b"] and aliases == {"https://d.com/a/": "https://d.com/a"}
+
+    base = detector.fingerprint(_body())
+    near = detector.fingerprint(_body(replace={500: "changed"}))
+    other = detector.fingerprint(_body(replace={i: f"other{i}" for i in range(0, 1000, 2)}))
+    assert detector.fingerprint("too short") is None
+    assert detector.claim("https://d.com/a", "h1", base) is None
+    assert detector.claim("https://d.com/a", "h1", base) is None  # 同一 URL 再次处理不算重复
+    assert detector.claim("https://d.com/mirror", "h1", None) == ("https://d.com/a", "exact")
+    assert detector.claim("https://d.com/v2", "h2", near) == ("https://d.com/a", "near")
+    assert detector.claim("https://d.com/other", "h3", other) is None
+    assert detector.stats == {"url_aliases": 1, "exact": 1, "near": 1} and detector.saved_calls() == 3
+    logger.success(f"Near-duplicate distance {(base ^ near).bit_count()}, unrelated {(base ^ other).bit_count()}.")
+
+def test_bands_cover_configured_distance(monkeypatch):
+    # 距离为 6 且每个 16 位段都有差异的两个指纹：4 段倒排会漏掉，段数随阈值增加后能找到
+    base = 0x0123456789ABCDEF
+    near = base ^ sum(1 << bit for bit in (0, 16, 32, 48, 5, 21))
+    detector = DuplicateDetector(max_distance=6)
+    assert detector.claim("https://d.com/a", None, base) is None
+    assert detector.claim("https://d.com/b", None, near) == ("https://d.com/a", "near")
+    # 不同阈值不共用去重器
+    monkeypatch.setattr(dedup, "_detectors", {})
+    assert get_detector("bands", 3) is get_detector("bands", 3) and get_detector("bands", 6).max_distance == 6
+
+def test_duplicates_reuse_canonical_fragment(graph_env):
+    base = "https://docs.example.com/guide"
+    bodies = {
+        f"{base}/agents": _body(),
+        f"{base}/agents-mirror": _body(),                            # 正文完全相同
+        f"{base}/agents-v2": _body(replace={500: "changed"}),        # 近似重复
+        f"{base}/tools": _body(replace={i: f"tool{i}" for i in range(0, 1000, 2)}),
+    }
+    urls = list(bodies) + [f"{base}/agents/"]                       # URL 别名，不会被抓取
+    config = {"configurable": {"thread_id": "dedup-test"}, "max_concurrency": 1}
+    extractor, generator = FakeExtractor(bodies), FakeGenerator()
+    graph_env.use(extractor=extractor, generator=generator)
+
+    app = graph_env.create_app()
+    graph_env.approve(app, config, "dedup-test", urls)
+    app.invoke(None, config=config)
+
+    assert generator.analyzed == ["agents", "tools"]
+    assert f"{base}/agents/" not in extractor.fetched
+    state = app.get_state(config).values
+    results = state["results"]
+    for url in (f"{base}/agents-mirror", f"{base}/agents-v2", f"{base}/agents/"):
+        assert results[url]["status"] == "duplicate" and results[url]["duplicate_of"] == f"{base}/agents"
+        assert not results[url].get("error") and "title" not in results[url]
+    assert len(state["fragment_files"]) == 5
+
+    backend = get_fragment_backend(os.path.join(graph_env.project_dir("dedup-test"), "fragments"))
+    _, copy = backend.load(f"{base}/agents-v2")
+    assert copy["summary"] == "summary of agents" and copy["duplicate_of"] == f"{base}/agents"
+    assert copy["content_hash"] == "hash-agents-v2"
+    detector = get_detector("dedup-test")
+    assert detector.stats == {"url_aliases": 1, "exact": 1, "near": 1}
+    logger.success(f"Duplicate pages reused the canonical fragment: {detector.saved_calls()} LLM calls saved.")
+
+def test_resumed_run_keeps_analyzed_pages_as_canonical(graph_env, monkeypatch):
+    base = "https://docs.example.com/guide"
+    bodies = {
+        f"{base}/agents": _body(),
+        f"{base}/tools": _body(replace={i: f"tool{i}" for i in range(0, 1000, 2)}),
+        f"{base}/agents-v2": _body(replace={500: "changed"}),        # agents 的近似重复
+    }
+    config = {"configurable": {"thread_id": "resume-dedup"}, "max_concurrency": 1}
+    # 抓取 agents-v2 时进程崩溃，agents 与 tools 已分析
+    graph_env.use(extractor=FakeExtractor(bodies, failures={f"{base}/agents-v2": [Crash()]}), generator=FakeGenerator())
+    app = graph_env.create_app()
+    graph_env.approve(app, config, "resume-dedup", list(bodies))
+    with pytest.raises(Crash):
+        app.invoke(None, config=config)
+
+    # 新进程：去重器从空开始，分发节点不会重新执行
+    monkeypatch.setattr(dedup, "_detectors", {})
+    generator = FakeGenerator()
+    graph_env.use(generator=generator)
+    app = graph_env.create_app()
+    app.invoke(None, config=config)
+
+    results = app.get_state(config).values["results"]
+    assert generator.analyzed == []
+    assert results[f"{base}/agents-v2"]["status"] == "duplicate"
+    assert results[f"{base}/agents-v2"]["duplicate_of"] == f"{base}/agents"
+    meter = workflow._pipeline_for("resume-dedup").meter
+    assert meter is not None and meter.total == 1 and meter.completed == 1
+    logger.success("Resumed run re-registered analyzed pages as canonical before dispatching the rest.")
+
+def test_corrupt_canonical_fragment_falls_back_to_analysis(tmp_path):
+    output_dir = str(tmp_path / "fragments")
+    os.makedirs(output_dir)
+    blobs = BlobStore(str(tmp_path / "blobs"))
+    generator = FakeGenerator()
+    pipeline = AnalysisPipeline(None, generator, output_dir, blob_store=blobs)
+    canonical, duplicate = "https://docs.example.com/guide/agents", "https://docs.example.com/guide/agents-mirror"
+    with open(get_fragment_backend(output_dir).path_for(canonical), "w", encoding="utf-8") as f:
+        f.write('{"url": "https://docs.example.com/guide/agents", "summ')
+    blob, _ = blobs.put_text(_body())
+
+    results, files = pipeline.resolve_duplicates([{"url": duplicate, "status": "duplicate", "duplicate_of": canonical,
+                                                   "blob": blob, "title": "agents-mirror", "content_hash": "h"}])
+    assert generator.analyzed == ["agents-mirror"] and len(files) == 1
+    assert results[duplicate]["status"] == "analyzed" and "duplicate_of" not in results[duplicate]
+    logger.success("Corrupt canonical fragment fell back to analyzing the duplicate page.")
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,78 @@
+import sys
+import pytest
+import trafilatura
+from bs4 import BeautifulSoup
+from loguru import logger
+from src.core.extractor import Extractor, parse_page
+
+BODY = "".join(f"<p>Paragraph {p}: agents call tools and observe the results before deciding the next step.</p>"
+               for p in range(6))
+
+SAMPLES = {
+    "title": f"<html><head><title>Agents</title></head><body><article><h1>Agents overview</h1>{BODY}</article></body></html>",
+    "title-with-site": f"<html><head><title>Agents | LangChain Docs</title></head><body><article><h1>Agents</h1>{BODY}</article></body></html>",
+    "og-title": f"<html><head><meta property='og:title' content='OG Agents'><title>Agents</title></head><body><article>{BODY}</article></body></html>",
+    "h1-only": f"<html><head></head><body><main><h1>Tools guide</h1>{BODY}</main></body></html>",
+    "table": f"<html><head><title>Ref</title></head><body><main><h1>Ref</h1>{BODY}<table><tr><td>name</td><td>str</td></tr><tr><td>age</td><td>int</td></tr></table></main></body></html>",
+    "comments": f"<html><head><title>C</title></head><body><article>{BODY}</article><div class='comments'><p>Great post, thanks a lot for writing this!</p></div></body></html>",
+}
+
+def legacy_parse(html):
+    """旧实现：trafilatura.extract 提取正文，bare_extraction 取标题，BeautifulSoup 兜底 <title> / <h1>"""
+    content = trafilatura.extract(html, include_comments=False, include_tables=True)
+    metadata = trafilatura.bare_extraction(html)
+    title = getattr(metadata, "title", None) if metadata else None
+    text = (getattr(metadata, "text", None) if metadata else None) or content
+    if not title:
+        soup = BeautifulSoup(html, "lxml")
+        if soup.title and soup.title.string:
+            title = soup.title.string.strip()
+        if not title:
+            h1 = soup.find("h1")
+            if h1:
+                title = h1.get_text().strip()
+    return title, text
+
+@pytest.mark.parametrize("name", list(SAMPLES))
+def test_parse_page_matches_legacy_extraction(name):
+    html = SAMPLES[name]
+    page = parse_page("https://d.com/page", html)
+    assert page.error is None
+    assert (page.title, page.content) == legacy_parse(html)
+
+def test_parse_page_title_falls_back_to_h1():
+    page = parse_page("https://d.com/page", SAMPLES["h1-only"])
+    assert page.title == "Tools guide" and page.content.startswith("Tools guide\nParagraph 0")
+    # 字节输入与字符串结果一致
+    assert parse_page("https://d.com/page", SAMPLES["h1-only"].encode("utf-8")) == page
+
+def test_parse_page_errors():
+    assert parse_page("https://d.com/page", "").error == "Invalid HTML"
+    assert parse_page("https://d.com/page", b"").error == "Invalid HTML"
+    empty = parse_page("https://d.com/page", "<html><head><title>Empty</title></head><body></body></html>")
+    assert empty.title == "Empty" and empty.error == "No content extracted"
+    logger.success("parse_page matches the legacy two-pass extraction.")
+
+def test_process_pool_parse_matches_thread_mode():
+    pages = {f"https://d.com/{name}": html.encode("utf-8") for name, html in SAMPLES.items()}
+    pages["https://d.com/invalid"] = b""
+    threaded = Extractor(parse_mode="thread")
+    pooled = Extractor(parse_mode="process", parse_workers=2)
+    try:
+        # spawn 子进程中解析，结果经 pickle 传回，与调用线程中解析一致
+        for url, content in pages.items():
+            assert pooled._parse(url, content, "utf-8") == threaded._parse(url, content, "utf-8")
+        assert pooled._parse_pool is not None
+        assert pooled._parse_pool._mp_context.get_start_method() == "spawn"
+        pool = pooled._parse_pool
+    finally:
+        pooled.close()
+        threaded.close()
+    # close 关闭进程池，不再接受新任务
+    assert pooled._parse_pool is None
+    with pytest.raises(RuntimeError):
+        pool.submit(parse_page, "https://d.com/page", "")
+    logger.success("Process-pool parsing matches thread mode.")
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,94 @@
+import os
+import tempfile
+from loguru import logger
+from src.core.fragment_backend import FileFragmentBackend, JsonlFragmentBackend, read_fragment
+from src.core.generator import generator, PageAnalysis
+from src.core.indexer import FragmentIndexer, FragmentStore
+from src.utils.config import settings
+
+def _fragment(url, summary):
+    return {"url": url, "title": url.rsplit("/", 1)[-1], "summary": summary, "page_type": "Guide",
+            "knowledge_points": []}
+
+def test_jsonl_backend_appends_and_reopens():
+    directory = os.path.join(tempfile.mkdtemp(), "fragments")
+    # 逐页文件后端中这两个 URL 映射到同一文件名
+    urls = ["https://docs.example.com/a/b", "https://docs.example.com/a_b"]
+    assert FileFragmentBackend(directory).path_for(urls[0]) == FileFragmentBackend(directory).path_for(urls[1])
+
+    backend = JsonlFragmentBackend(directory, fsync="always")
+    refs = [backend.save(url, _fragment(url, "v1")) for url in urls]
+    backend.save(urls[0], _fragment(urls[0], "v2"))
+    assert backend.load(urls[0])[1]["summary"] == "v2" and backend.load(urls[1])[1]["summary"] == "v1"
+    assert read_fragment(refs[1])[0]["url"] == urls[1]
+    assert [data["summary"] for _, data, _ in backend.iter_records()] == ["v1", "v2"]
+    backend.close()
+
+    # 模拟写入中途崩溃：末尾留下不完整的一行
+    with open(backend.log_path, "ab") as f:
+        f.write(b'{"url": "https://docs.example.com/partial", "summ')
+    reopened = JsonlFragmentBackend(directory)
+    assert len(reopened) == 2 and "https://docs.example.com/partial" not in reopened
+    reopened.save("https://docs.example.com/c", _fragment("https://docs.example.com/c", "v1"))
+    assert reopened.load("https://docs.example.com/c")[1]["summary"] == "v1"
+
+    # 压缩：只保留每个 URL 的最新版本
+    before, after = reopened.compact()
+    assert after < before and after == os.path.getsize(reopened.log_path)
+    assert reopened.load(urls[0])[1]["summary"] == "v2" and len(reopened) == 3
+    reopened.close()
+    assert JsonlFragmentBackend(directory).load(urls[1])[1]["summary"] == "v1"
+    logger.success(f"JSONL fragment log compacted from {before} to {after} bytes.")
+
+def test_jsonl_backend_skips_corrupt_lines():
+    directory = os.path.join(tempfile.mkdtemp(), "fragments")
+    backend = JsonlFragmentBackend(directory)
+    urls = [f"https://docs.example.com/page-{i}" for i in range(3)]
+    backend.save(urls[0], _fragment(urls[0], "v1"))
+    backend.close()
+    # 中间一行损坏（完整但无法解析），其后的记录必须保留
+    with open(backend.log_path, "ab") as f:
+        f.write(b'{"url": "https://docs.example.com/corrupt", "summ\n')
+    os.remove(backend.index_path)
+    reopened = JsonlFragmentBackend(directory)
+    for url in urls[1:]:
+        reopened.save(url, _fragment(url, "v1"))
+    reopened.close()
+    size = os.path.getsize(reopened.log_path)
+
+    again = JsonlFragmentBackend(directory)
+    os.remove(again.index_path)
+    again = JsonlFragmentBackend(directory)
+    assert len(again) == 3 and all(again.load(url)[1]["summary"] == "v1" for url in urls)
+    assert os.path.getsize(again.log_path) == size
+    before, after = again.compact()
+    assert after < before and len(JsonlFragmentBackend(directory)) == 3
+    logger.success("Corrupt line in the middle of the log skipped without losing later records.")
+
+def test_generation_reads_jsonl_backend():
+    directory = os.path.join(tempfile.mkdtemp(), "fragments")
+    saved = settings.generation.fragment_backend
+    settings.generation.fragment_backend = "jsonl"
+    try:
+        url = "https://docs.example.com/concepts/agents"
+        analysis = PageAnalysis(summary="Agents summary", page_type="Concept", knowledge_points=[])
+        ref = generator.save_analysis(analysis, url, directory, content_hash="h1")
+        assert generator.find_reusable_fragment(url, "h1", directory) == ref
+        assert generator.find_reusable_fragment(url, "h2", directory) is None
+        assert os.listdir(directory) == ["fragments.jsonl"]
+
+        store = FragmentStore()
+        indexer = FragmentIndexer(directory, store=store)
+        indexer.build_index()
+        fragment = indexer.find_fragment("agents")
+        assert fragment["path"] == ref and store.get(ref)["summary"] == "Agents summary" and store.loads == 0
+        book = generator.generate_from_structure([{"title": "Agents", "url": url}], directory)
+        assert "Agents summary" in book
+        logger.success("Generation indexed fragments from the JSONL log in one pass.")
+    finally:
+        settings.generation.fragment_backend = saved
+
+if __name__ == "__main__":
+    test_jsonl_backend_appends_and_reopens()
+    test_jsonl_backend_skips_corrupt_lines()
+    test_generation_reads_jsonl_backend()
@@ -48,8 +48,9 @@ def test_graph_scan():
     logger.info("Resuming Graph execution (Phase 2: Extract)...")
     
     for event in app.stream(None, config=config):
-        if "extract" in event:
-            logger.success(f"Extraction complete for {len(event['extract']['results'])} pages.")
+        if "join" in event:
+            results = app.get_state(config).values.get("results") or {}
+            logger.success(f"Extraction complete for {len(results)} pages.")
             
     logger.success("Workflow completed (Fragments generated).")
 
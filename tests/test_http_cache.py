@@ -0,0 +1,51 @@
+import hashlib
+import http.server
+import tempfile
+import threading
+import requests
+from loguru import logger
+from src.utils.http_cache import HttpCache
+
+BODY = b"<html><head><title>Cached</title></head><body>hello</body></html>"
+ETAG = '"%s"' % hashlib.md5(BODY).hexdigest()
+
+class EtagHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.headers.get("If-None-Match") == ETAG:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("ETag", ETAG)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.end_headers()
+        self.wfile.write(BODY)
+
+    def log_message(self, *args):
+        pass
+
+def test_http_cache():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), EtagHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+
+    try:
+        cache = HttpCache(tempfile.mkdtemp(), max_bytes=len(BODY) + 10)
+
+        first = cache.fetch(requests, f"{base}/a")
+        second = cache.fetch(requests, f"{base}/a")
+        assert not first.from_cache
+        assert second.from_cache
+        assert second.content == BODY
+        logger.info(f"Cache stats: {cache.stats()}")
+
+        # 容量只够一个条目：写入 /b 后 /a 被淘汰
+        cache.fetch(requests, f"{base}/b")
+        assert cache.conditional_headers(f"{base}/a") == {}
+        assert cache.conditional_headers(f"{base}/b") == {"If-None-Match": ETAG}
+        logger.success("HTTP cache works as expected.")
+    finally:
+        server.shutdown()
+
+if __name__ == "__main__":
+    test_http_cache()
@@ -0,0 +1,104 @@
+import json
+import os
+import random
+import tempfile
+from loguru import logger
+from src.core.indexer import FragmentIndexer, FragmentManifest, FragmentStore
+
+def linear_find(index, keyword_or_suffix):
+    """旧实现：三次线性扫描，作为对照"""
+    keyword_or_suffix = keyword_or_suffix.lower()
+    for url, data in index.items():
+        if url.endswith(keyword_or_suffix):
+            return data
+    for url, data in index.items():
+        if keyword_or_suffix in url:
+            return data
+    for url, data in index.items():
+        if keyword_or_suffix in data.get("title", "").lower():
+            return data
+    return None
+
+def test_indexed_lookup_matches_linear_scan():
+    rng = random.Random(42)
+    words = ["agents", "tools", "memory", "streaming", "models", "Messages", "rag", "overview", "install", "how-to"]
+    fragments_dir = os.path.join(tempfile.mkdtemp(), "fragments")
+    os.makedirs(fragments_dir)
+    for i in range(300):
+        path = "/".join(rng.choice(words) for _ in range(rng.randint(1, 4)))
+        data = {
+            "url": f"https://docs.example.com/{path}/{i % 37}" + ("/" if i % 5 == 0 else ""),
+            "title": f"{rng.choice(words).title()} Guide {i}",
+            "summary": "", "page_type": "Guide", "knowledge_points": []
+        }
+        with open(os.path.join(fragments_dir, f"{i}.json"), "w", encoding="utf-8") as f:
+            json.dump(data, f)
+
+    indexer = FragmentIndexer(fragments_dir)
+    indexer.build_index()
+
+    queries = words + ["agents/1", "/3", "guide 12", "m", "", "ls/", "docs.example.com", "missing", "Messages"]
+    queries += [f"{rng.choice(words)}/{rng.choice(words)}" for _ in range(50)]
+    for q in queries:
+        assert indexer.find_fragment(q) == linear_find(indexer.index, q), q
+    logger.success(f"Indexed lookup matches linear scan for {len(queries)} queries.")
+
+def test_manifest_revalidates_changed_files():
+    fragments_dir = os.path.join(tempfile.mkdtemp(), "fragments")
+    os.makedirs(fragments_dir)
+
+    def write(name, url, title):
+        with open(os.path.join(fragments_dir, name), "w", encoding="utf-8") as f:
+            json.dump({"url": url, "title": title, "summary": "", "page_type": "Guide"}, f)
+
+    write("a.json", "https://docs.example.com/a", "A")
+    write("b.json", "https://docs.example.com/b", "B")
+    FragmentIndexer(fragments_dir).build_index()
+    assert os.path.exists(os.path.join(os.path.dirname(fragments_dir), FragmentManifest.FILENAME))
+
+    # 修改、删除、新增各一个文件后，索引应与直接读取 JSON 一致
+    write("a.json", "https://docs.example.com/a", "A (updated title)")
+    os.remove(os.path.join(fragments_dir, "b.json"))
+    write("c.json", "https://docs.example.com/c/", "C")
+
+    index = FragmentIndexer(fragments_dir).build_index()
+    assert set(index) == {"https://docs.example.com/a", "https://docs.example.com/c"}
+    assert index["https://docs.example.com/a"]["title"] == "A (updated title)"
+    logger.success("Fragment manifest picks up modified, deleted and new files.")
+
+def test_fragment_store_loads_each_file_once():
+    fragments_dir = os.path.join(tempfile.mkdtemp(), "fragments")
+    os.makedirs(fragments_dir)
+    paths = []
+    for i in range(20):
+        path = os.path.join(fragments_dir, f"{i}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"url": f"https://docs.example.com/{i:02d}", "summary": "x" * 100}, f)
+        paths.append(path)
+
+    # 首次建索引时解析的片段直接进入缓存
+    store = FragmentStore()
+    FragmentIndexer(fragments_dir, store=store).build_index()
+    for path in paths * 3:
+        assert store.get(path)["summary"] == "x" * 100
+    assert store.loads == 0 and store.hits == 60
+
+    # 清单命中时按需加载，每个文件只读一次
+    store = FragmentStore()
+    FragmentIndexer(fragments_dir, store=store).build_index()
+    for path in paths * 3:
+        store.get(path)
+    assert store.loads == 20
+
+    # 超出上限时按 LRU 淘汰
+    size = os.path.getsize(paths[0])
+    store = FragmentStore(max_bytes=size * 5)
+    for path in paths:
+        store.get(path)
+    assert len(store._items) == 5 and store._bytes <= store.max_bytes
+    logger.success("Fragment store serves repeated reads from memory within its cap.")
+
+if __name__ == "__main__":
+    test_indexed_lookup_matches_linear_scan()
+    test_manifest_revalidates_changed_files()
+    test_fragment_store_loads_each_file_once()
@@ -0,0 +1,51 @@
+import json
+import os
+import tempfile
+import threading
+from langchain_core.messages import AIMessage
+from loguru import logger
+from src.core.generator import Generator
+
+class FakeClient:
+    """每次合并返回固定长度的草稿，记录各类调用次数"""
+
+    def __init__(self, draft_words: int):
+        self.draft_words = draft_words
+        self.calls = {"merge": 0, "reduce": 0, "final": 0}
+        self.lock = threading.Lock()
+
+    def invoke(self, prompt_value, call_site="llm"):
+        system = prompt_value.to_messages()[0].content
+        kind = "final" if "主编" in system else ("reduce" if "草稿合并" in system else "merge")
+        with self.lock:
+            self.calls[kind] += 1
+        return AIMessage(content=f"## {kind}\n\n" + "detail " * self.draft_words)
+
+def test_integrate_fragments_tree_reduce():
+    generator = Generator()
+    generator.integrate_batch_tokens = 2000
+    generator.integrate_context_tokens = 4000
+    generator.client = FakeClient(draft_words=1500)
+
+    directory = tempfile.mkdtemp()
+    paths = []
+    for i in range(64):
+        data = {"url": f"https://docs.example.com/{i}", "page_type": "Guide", "summary": "summary " * 50,
+                "knowledge_points": [{"concept": f"C{i}.{k}", "importance": 3, "explanation": "explain " * 20}
+                                     for k in range(5)]}
+        path = os.path.join(directory, f"{i}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        paths.append(path)
+
+    result = generator.integrate_fragments(paths)
+    calls = generator.client.calls
+    assert result.startswith("## final") and "未完全润色" not in result
+    assert calls["final"] == 1
+    assert calls["merge"] < len(paths)
+    # 树形归约：N 份草稿最多合并 N - 1 次
+    assert 0 < calls["reduce"] <= calls["merge"] - 1
+    logger.success(f"Integrated {len(paths)} fragments with {calls}.")
+
+if __name__ == "__main__":
+    test_integrate_fragments_tree_reduce()
@@ -0,0 +1,67 @@
+import tempfile
+from langchain_core.messages import AIMessage
+from langchain_core.prompts import ChatPromptTemplate
+from loguru import logger
+from src.core.llm_client import LLMClient
+from src.utils.llm_cache import LLMResponseCache
+
+class FakeLLM:
+    def __init__(self, model_name="fake-model", temperature=0.1):
+        self.model_name = model_name
+        self.temperature = temperature
+        self.calls = 0
+
+    def invoke(self, prompt_value):
+        self.calls += 1
+        return AIMessage(content=f"answer {self.calls}")
+
+def test_llm_cache_hit_miss_and_bypass():
+    cache = LLMResponseCache(tempfile.mkdtemp())
+    prompt = ChatPromptTemplate.from_messages([("system", "Be brief."), ("user", "{question}")])
+    llm = FakeLLM()
+    client = LLMClient(llm, cache=cache)
+
+    first = client.invoke(prompt.invoke({"question": "What is an agent?"}))
+    again = client.invoke(prompt.invoke({"question": "What is an agent?"}))
+    assert first.content == again.content == "answer 1" and llm.calls == 1
+    assert cache.stats() == {"hits": 1, "misses": 1}
+
+    # 提示词或 temperature 不同则不命中
+    client.invoke(prompt.invoke({"question": "What is a tool?"}))
+    LLMClient(FakeLLM(temperature=0.7), cache=cache).invoke(prompt.invoke({"question": "What is an agent?"}))
+    assert llm.calls == 2 and cache.hits == 1
+
+    # 持久化：新的缓存实例仍可命中
+    reopened = LLMClient(FakeLLM(), cache=LLMResponseCache(cache.cache_dir))
+    assert reopened.invoke(prompt.invoke({"question": "What is an agent?"})).content == "answer 1"
+
+    # bypass：不读缓存，但刷新写入
+    cache.bypass = True
+    assert client.invoke(prompt.invoke({"question": "What is an agent?"})).content == "answer 3"
+    cache.bypass = False
+    assert client.invoke(prompt.invoke({"question": "What is an agent?"})).content == "answer 3"
+    logger.success("LLM cache hits, misses and bypass behave as expected.")
+
+def test_llm_cache_validate_and_eviction():
+    cache = LLMResponseCache(tempfile.mkdtemp(), max_bytes=200)
+    prompt = ChatPromptTemplate.from_messages([("user", "{question}")])
+    llm = FakeLLM()
+    client = LLMClient(llm, cache=cache)
+
+    def reject(content):
+        raise ValueError("unparseable")
+
+    # 校验失败的响应不写入缓存
+    client.invoke(prompt.invoke({"question": "q"}), validate=reject)
+    client.invoke(prompt.invoke({"question": "q"}), validate=reject)
+    assert llm.calls == 2
+
+    for i in range(50):
+        client.invoke(prompt.invoke({"question": f"q{i}"}))
+    total = cache._db().execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+    assert 0 < total <= 200
+    logger.success("LLM cache skips invalid responses and stays within its size cap.")
+
+if __name__ == "__main__":
+    test_llm_cache_hit_miss_and_bypass()
+    test_llm_cache_validate_and_eviction()
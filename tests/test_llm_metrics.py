@@ -0,0 +1,90 @@
+import json
+import os
+import tempfile
+from langchain_core.messages import AIMessage
+from langchain_core.prompts import ChatPromptTemplate
+from loguru import logger
+from src.core.llm_client import LLMClient, RateLimiter
+from src.utils.llm_cache import LLMResponseCache
+from src.utils.llm_metrics import LLMMetrics
+
+class RateLimited(Exception):
+    status_code = 429
+
+class FakeLLM:
+    """第一次调用返回 429，之后返回带用量信息的响应；usage 为 False 时不带用量信息"""
+
+    def __init__(self, fail_first=True, usage=True):
+        self.model_name = "fake-model"
+        self.temperature = 0.1
+        self.fail_first = fail_first
+        self.usage = usage
+        self.calls = 0
+
+    def invoke(self, prompt_value):
+        self.calls += 1
+        if self.fail_first and self.calls == 1:
+            raise RateLimited("rate limited")
+        if not self.usage:
+            return AIMessage(content="answer without usage metadata")
+        return AIMessage(content="answer", usage_metadata={"input_tokens": 120, "output_tokens": 30,
+                                                           "total_tokens": 150})
+
+def test_metrics_per_call_site():
+    metrics = LLMMetrics(prompt_price=2.0, completion_price=8.0)
+    prompt = ChatPromptTemplate.from_messages([("user", "{question}")])
+    client = LLMClient(FakeLLM(), backoff_base=0, cache=LLMResponseCache(tempfile.mkdtemp()), metrics=metrics)
+
+    client.invoke(prompt.invoke({"question": "q1"}), call_site="analyze_page")
+    client.invoke(prompt.invoke({"question": "q1"}), call_site="analyze_page")  # 缓存命中
+    client.invoke(prompt.invoke({"question": "q2"}), call_site="analyze_page")
+    LLMClient(FakeLLM(fail_first=False, usage=False), metrics=metrics).invoke(
+        prompt.invoke({"question": "polish"}), call_site="polish_section")
+
+    class Broken:
+        model_name, temperature = "fake-model", 0.1
+
+        def invoke(self, prompt_value):
+            raise ValueError("bad request")
+
+    try:
+        LLMClient(Broken(), metrics=metrics).invoke(prompt.invoke({"question": "q"}), call_site="integrate_fragments")
+        assert False, "expected error"
+    except ValueError:
+        pass
+
+    summary = metrics.summary()
+    analyze = summary["call_sites"]["analyze_page"]
+    assert analyze["calls"] == 2 and analyze["retries"] == 1 and analyze["cache_hits"] == 1
+    assert analyze["prompt_tokens"] == 240 and analyze["completion_tokens"] == 60
+    assert analyze["cost"] == round((240 * 2.0 + 60 * 8.0) / 1e6, 6) and analyze["estimated_calls"] == 0
+    polish = summary["call_sites"]["polish_section"]
+    assert polish["calls"] == 1 and polish["estimated_calls"] == 1 and polish["completion_tokens"] > 0
+    assert summary["call_sites"]["integrate_fragments"]["errors"] == 1
+    # 调用位置按 token 总数降序
+    assert list(summary["call_sites"])[0] == "analyze_page"
+    assert summary["total"]["calls"] == 3 and summary["total"]["errors"] == 1
+    assert 0 <= analyze["latency_s"]["p50"] <= analyze["latency_s"]["p99"] <= analyze["latency_s"]["max"]
+
+    path = os.path.join(tempfile.mkdtemp(), "demo", "metrics.json")
+    metrics.write(path)
+    with open(path, "r", encoding="utf-8") as f:
+        written = json.load(f)
+    assert written["call_sites"]["analyze_page"]["total_tokens"] == 300 and "generated_at" in written
+    metrics.log_summary()
+    logger.success("LLM metrics recorded tokens, retries and cache hits per call site.")
+
+def test_rate_limiter_counts_actual_usage():
+    limiter = RateLimiter(tokens_per_minute=1000)
+    prompt = ChatPromptTemplate.from_messages([("user", "{question}")])
+    LLMClient(FakeLLM(fail_first=False), rate_limiter=limiter).invoke(prompt.invoke({"question": "q"}))
+    # 预占的是估算的 prompt token，响应返回后改为实际的 prompt + completion 用量
+    assert limiter._tokens_in_window == 150 and [tokens for _, tokens in limiter._events] == [150]
+
+    limiter.settle(limiter.acquire(10), 40)
+    assert limiter._tokens_in_window == 190
+    logger.success("Rate limiter TPM window tracks actual prompt + completion usage.")
+
+if __name__ == "__main__":
+    test_metrics_per_call_site()
+    test_rate_limiter_counts_actual_usage()
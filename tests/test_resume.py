@@ -0,0 +1,128 @@
+import os
+import sys
+import threading
+import time
+import pytest
+import requests
+from loguru import logger
+from conftest import Crash, FakeExtractor, FakeGenerator
+from src.utils.blob_store import BlobStore
+from src.utils.config import settings
+
+def _titles(urls):
+    return [url.rsplit("/", 1)[-1] for url in urls]
+
+def test_resume_from_sqlite_checkpoint(graph_env):
+    urls = [f"https://docs.example.com/page-{i}" for i in range(10)]
+    # 单并发，使分支按顺序执行
+    config = {"configurable": {"thread_id": "resume-test"}, "max_concurrency": 1}
+    graph_env.use(extractor=FakeExtractor(), generator=FakeGenerator(crash_after=7))
+
+    # 第一次运行：处理 7 个页面后崩溃，已完成的分支逐个写入检查点
+    app = graph_env.create_app()
+    graph_env.approve(app, config, "resume-test", urls)
+    with pytest.raises(Crash):
+        app.invoke(None, config=config)
+
+    # 新进程：重新打开检查点文件，只重跑未完成的 URL
+    generator = FakeGenerator()
+    graph_env.use(generator=generator)
+    app = graph_env.create_app()
+    snapshot = app.get_state(config)
+    assert set(snapshot.next) == {"extract_url"} and len(snapshot.values["results"]) == 7
+    app.invoke(None, config=config)
+
+    assert generator.analyzed == _titles(urls[7:])
+    final = app.get_state(config)
+    assert not final.next and set(final.values["results"]) == set(urls)
+    assert len(final.values["fragment_files"]) == 10
+    logger.success("Resumed extraction from the last completed URL.")
+
+def test_fan_out_retries_and_packs_short_pages(graph_env, monkeypatch):
+    urls = [f"https://docs.example.com/guide/page-{i}" for i in range(6)]
+    config = {"configurable": {"thread_id": "fanout-test"}, "max_concurrency": 3}
+    not_found = requests.HTTPError(response=type("Response", (), {"status_code": 404})())
+    unavailable = requests.HTTPError(response=type("Response", (), {"status_code": 503})())
+    # page-1 超时一次后成功（分支内重试），page-2 返回 404（不重试，记为失败），
+    # page-3 持续 503，重试耗尽后记为 failed，join 照常执行
+    extractor = FakeExtractor(failures={urls[1]: [requests.Timeout("timed out")], urls[2]: [not_found],
+                                        urls[3]: [unavailable] * 5})
+    generator = FakeGenerator()
+    graph_env.use(extractor=extractor, generator=generator)
+    monkeypatch.setattr(settings.generation, "pack_tokens", 1000)
+
+    app = graph_env.create_app()
+    graph_env.approve(app, config, "fanout-test", urls)
+    app.invoke(None, config=config)
+
+    assert extractor.fetched.count(urls[1]) == 2 and extractor.fetched.count(urls[2]) == 1
+    assert extractor.fetched.count(urls[3]) == settings.pipeline.retry_attempts
+    assert not app.get_state(config).next
+    results = app.get_state(config).values["results"]
+    assert results[urls[2]]["error"] and not results[urls[1]].get("error")
+    assert results[urls[3]]["status"] == "failed" and results[urls[3]]["error"]
+    # 同一小节的短页面在 join 中一次合并分析
+    assert len(generator.analyzed) == 1 and len(generator.analyzed[0]) == 4
+    assert all(r["status"] == "analyzed" and "title" not in r for u, r in results.items()
+               if u not in (urls[2], urls[3]))
+    assert len(app.get_state(config).values["fragment_files"]) == 4
+    logger.success("Transient failures retried, short pages packed after the join.")
+
+class SlowGenerator(FakeGenerator):
+    """记录同时进行的分析数的峰值"""
+
+    def __init__(self):
+        super().__init__()
+        self.active = self.peak = 0
+        self._lock = threading.Lock()
+
+    def analyze_page(self, title, content):
+        with self._lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(0.05)
+        with self._lock:
+            self.active -= 1
+        return super().analyze_page(title, content)
+
+def test_analysis_concurrency_is_capped_separately(graph_env, monkeypatch):
+    urls = [f"https://docs.example.com/limit-{i}" for i in range(8)]
+    config = {"configurable": {"thread_id": "limit-test"}, "max_concurrency": 6}
+    extractor, generator = FakeExtractor(), SlowGenerator()
+    graph_env.use(extractor=extractor, generator=generator)
+    monkeypatch.setattr(settings.pipeline, "analyze_workers", 2)
+
+    app = graph_env.create_app()
+    graph_env.approve(app, config, "limit-test", urls)
+    app.invoke(None, config=config)
+
+    # 6 个分支并发抓取，同时调用 LLM 的不超过 ANALYZE_WORKERS
+    assert sorted(generator.analyzed) == sorted(_titles(urls)) and generator.peak == 2
+    logger.success(f"Analysis concurrency peaked at {generator.peak} with 6 concurrent branches.")
+
+def test_checkpoint_excludes_page_bodies(graph_env, monkeypatch):
+    urls = [f"https://docs.example.com/big-{i}" for i in range(10)]
+    config = {"configurable": {"thread_id": "blob-test"}}
+    graph_env.use(extractor=FakeExtractor(body_size=20000), generator=FakeGenerator())  # 每页约 200 KB
+    # 各页正文几乎相同，关闭去重以逐页落盘
+    monkeypatch.setattr(settings.pipeline, "dedup_enabled", False)
+
+    app = graph_env.create_app()
+    graph_env.approve(app, config, "blob-test", urls)
+    app.invoke(None, config=config)
+
+    results = app.get_state(config).values["results"]
+    blobs = BlobStore(os.path.join(graph_env.project_dir("blob-test"), "blobs"))
+    for record in results.values():
+        assert set(record) <= {"url", "status", "error", "size", "blob"}
+        assert record["size"] > 200000 and len(record["blob"]) == 64
+    # 汇合后正文已无用处，从正文存储中清理
+    assert not any(record["blob"] in blobs for record in results.values())
+    assert not os.listdir(blobs.root)
+    with open(graph_env.checkpoint_path, "rb") as f:
+        checkpoint = f.read()
+    assert b"BODY-TEXT" not in checkpoint and len(checkpoint) < 200000
+    logger.success(f"Checkpoint is {len(checkpoint)} bytes for 2 MB of page text.")
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -1,21 +1,161 @@
-from src.core.scanner import scanner
+from conftest import FakeExtractor, FakeGenerator
+from src.core.scanner import Scanner, SitemapEntry, parse_sitemap, scanner
+from src.graph import workflow
 from loguru import logger
+import functools
+import gzip
+import http.server
 import sys
+import threading
+import pytest
+
+NS = 'xmlns="http://www.sitemaps.org/schemas/sitemap/0.9"'
+
+def _urlset(entries):
+    urls = "".join(f"<url><loc>{loc}</loc>" + (f"<lastmod>{lastmod}</lastmod>" if lastmod else "") + "</url>"
+                   for loc, lastmod in entries)
+    return f'<?xml version="1.0" encoding="UTF-8"?><urlset {NS}>{urls}</urlset>'.encode("utf-8")
+
+def _index(locs):
+    sitemaps = "".join(f"<sitemap><loc>{loc}</loc></sitemap>" for loc in locs)
+    return f'<?xml version="1.0" encoding="UTF-8"?><sitemapindex {NS}>{sitemaps}</sitemapindex>'.encode("utf-8")
+
+class SitemapServer:
+    """在 tmp_path 上提供静态文件的本地服务器，记录每个请求的路径"""
+
+    def __init__(self, root):
+        self.root = root
+        self.requests = []
+        server = self
+
+        class Handler(http.server.SimpleHTTPRequestHandler):
+            def do_GET(self):
+                server.requests.append(self.path)
+                super().do_GET()
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(Handler, directory=str(root)))
+        self.base = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def write(self, name, content):
+        (self.root / name).write_bytes(content)
+        return f"{self.base}/{name}"
+
+@pytest.fixture
+def sitemap_server(tmp_path):
+    server = SitemapServer(tmp_path)
+    yield server
+    server.httpd.shutdown()
+    server.httpd.server_close()
+
+def test_parse_sitemap_urlset_and_gzip():
+    content = _urlset([("https://d.com/a", "2026-01-02"), ("https://d.com/b", None)])
+    sitemaps, entries = parse_sitemap(content)
+    assert sitemaps == [] and list(entries) == ["https://d.com/a", "https://d.com/b"]
+    assert entries["https://d.com/a"].lastmod == "2026-01-02" and entries["https://d.com/b"].lastmod is None
+    # .xml.gz 按 gzip 魔数自动解压，结果与未压缩时相同
+    assert parse_sitemap(gzip.compress(content)) == (sitemaps, entries)
+    assert parse_sitemap(_index(["https://d.com/s1.xml", "https://d.com/s2.xml.gz"]))[0] == \
+        ["https://d.com/s1.xml", "https://d.com/s2.xml.gz"]
+
+def test_parse_sitemap_large_document():
+    entries = [(f"https://d.com/page-{i}", f"2026-01-{i % 28 + 1:02d}") for i in range(20000)]
+    _, parsed = parse_sitemap(_urlset(entries))
+    assert len(parsed) == 20000 and parsed["https://d.com/page-19999"].lastmod == "2026-01-08"
+
+def test_scan_follows_nested_index_once(sitemap_server):
+    server = sitemap_server
+    docs = server.write("docs.xml", _urlset([("https://d.com/docs/a", "2026-01-01"), ("https://d.com/docs/b", None)]))
+    api = server.write("api.xml.gz", gzip.compress(_urlset([("https://d.com/api/x", "2026-02-01")])))
+    nested = server.write("nested.xml", _index([api, docs]))   # 重复引用 docs.xml
+    root = server.write("sitemap.xml", _index([docs, nested]))
+
+    local = Scanner(cache=None, max_workers=4)
+    entries = local.scan_entries(root, "https://d.com/docs")
+    assert [e.loc for e in entries] == ["https://d.com/docs/a", "https://d.com/docs/b"]
+    assert local.scan(root) == ["https://d.com/api/x", "https://d.com/docs/a", "https://d.com/docs/b"]
+    # 每次扫描中每个 sitemap 只抓取一次
+    assert sorted(server.requests) == sorted(["/sitemap.xml", "/docs.xml", "/nested.xml", "/api.xml.gz"] * 2)
+    logger.success(f"Scanned nested sitemap index with {len(server.requests) // 2} requests per scan.")
+
+def test_scan_node_does_not_rescan_prescanned_sitemap(sitemap_server, graph_env, monkeypatch):
+    server = sitemap_server
+    root = server.write("sitemap.xml", _urlset([("https://d.com/a", "2026-01-01"), ("https://d.com/b", None)]))
+    monkeypatch.setattr(workflow, "scanner", Scanner(cache=None))
+
+    # 没有目录结构时入口扫描一次 sitemap，lastmod 随初始状态传入，scan_node 不再请求
+    entries = workflow.scanner.scan_entries(root)
+    state = {"project_name": "prescan", "sitemap_url": root, "sitemap_lastmod": {e.loc: e.lastmod for e in entries}}
+    update = workflow.scan_node(state)
+    assert server.requests == ["/sitemap.xml"]
+    assert update["candidate_urls"] == ["https://d.com/a", "https://d.com/b"]
+
+    # 有目录结构（入口未扫描）时由 scan_node 扫描
+    update = workflow.scan_node({"project_name": "prescan", "sitemap_url": root, "sitemap_lastmod": {}})
+    assert server.requests == ["/sitemap.xml"] * 2 and update["sitemap_lastmod"]["https://d.com/a"] == "2026-01-01"
+
+def test_filter_changed_against_snapshot():
+    snapshot = {"https://d.com/no-lastmod": "2026-01-01", "https://d.com/older": "2026-03-01",
+                "https://d.com/same": "2026-03-01T10:00:00+02:00", "https://d.com/newer": "2026-03-01",
+                "https://d.com/unknown-before": None, "https://d.com/custom": "v1"}
+    entries = [SitemapEntry(loc="https://d.com/new", lastmod="2026-01-01"),
+               SitemapEntry(loc="https://d.com/no-lastmod"),
+               SitemapEntry(loc="https://d.com/older", lastmod="2026-02-01"),
+               SitemapEntry(loc="https://d.com/same", lastmod="2026-03-01T08:00:00Z"),   # 同一时刻，不同时区
+               SitemapEntry(loc="https://d.com/newer", lastmod="2026-03-02T00:00:00"),
+               SitemapEntry(loc="https://d.com/unknown-before", lastmod="2026-01-01"),
+               SitemapEntry(loc="https://d.com/custom", lastmod="v2")]                   # 无法解析时按字符串比较
+    # 新 URL、缺少 lastmod（无法判断）、上次没有 lastmod、lastmod 更新或不同的页面视为已变化
+    assert scanner.filter_changed(entries, snapshot) == [
+        "https://d.com/new", "https://d.com/no-lastmod", "https://d.com/newer", "https://d.com/unknown-before",
+        "https://d.com/custom"]
+    assert scanner.filter_changed(entries, {}) == [e.loc for e in entries]
+
+def test_changed_only_run_advances_snapshot(sitemap_server, graph_env, monkeypatch):
+    server = sitemap_server
+    pages = {"https://d.com/a": "2026-01-01", "https://d.com/b": "2026-01-01", "https://d.com/c": None}
+    root = server.write("sitemap.xml", _urlset(pages.items()))
+    monkeypatch.setattr(workflow, "scanner", Scanner(cache=None))
+    graph_env.use(extractor=FakeExtractor(bodies={url: f"body of {url}" for url in pages}), generator=FakeGenerator())
+    app = graph_env.create_app()
+
+    def scan(thread_id):
+        config = {"configurable": {"thread_id": thread_id}}
+        app.invoke({"project_name": "changed", "sitemap_url": root, "changed_only": True, "candidate_urls": [],
+                    "approved_urls": [], "results": {}, "fragment_files": [], "sitemap_lastmod": {},
+                    "current_step": "start", "error": None}, config=config)
+        return config, app.get_state(config).values["candidate_urls"]
+
+    # 第一次运行：没有快照，全部处理，成功的页面写入快照
+    config, candidates = scan("first")
+    assert candidates == list(pages)
+    app.update_state(config, {"approved_urls": candidates})
+    app.invoke(None, config=config)
+    assert workflow.scanner.load_snapshot(workflow._snapshot_path("changed")) == pages
+
+    # 第二次：只剩没有 lastmod 的页面；b 更新后也被选中
+    assert scan("second")[1] == ["https://d.com/c"]
+    server.write("sitemap.xml", _urlset({**pages, "https://d.com/b": "2026-02-01"}.items()))
+    assert scan("third")[1] == ["https://d.com/b", "https://d.com/c"]
+    logger.success("Changed-only runs selected new, undated and updated pages against the saved snapshot.")
 
 def test_scanner_module():
     url = "https://docs.langchain.com/sitemap.xml"
     prefix = "https://docs.langchain.com/oss/python/langchain"
-    
+
     logger.info("Testing Scanner module...")
     urls = scanner.scan(url, prefix)
-    
+
     if not urls:
         logger.error("Scanner failed to find URLs.")
         sys.exit(1)
-        
+
     logger.success(f"Scanner successfully found {len(urls)} URLs matching prefix.")
     for u in urls[:5]:
         print(f"Sample: {u}")
 
 if __name__ == "__main__":
-    test_scanner_module()
+    sys.exit(pytest.main([__file__, "-q"]))
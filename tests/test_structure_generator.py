@@ -0,0 +1,115 @@
+import json
+import os
+import stat
+import sys
+import pytest
+from loguru import logger
+from src.core.generator import generator
+from src.core.indexer import FragmentIndexer
+from src.core.structure_generator import generate_book
+
+def _build_project(root):
+    fragments_dir = os.path.join(root, "fragments")
+    os.makedirs(fragments_dir)
+    toc = []
+    for c in range(3):
+        chapter = {"title": f"Chapter {c}", "children": []}
+        for s in range(3):
+            section = {"title": f"Section {c}.{s}", "title_cn": f"小节 {c}.{s}", "children": [
+                {"title": f"Page {c}.{s}.{p}", "url": f"https://docs.example.com/p/{c}-{s}-{p}"} for p in range(3)]}
+            chapter["children"].append(section)
+        toc.append(chapter)
+    toc.append({"title": "Glossary", "keywords": ["glossary"]})
+    toc.append({"title": "Missing", "url": "https://docs.example.com/missing"})
+
+    urls = [page["url"] for chapter in toc[:3] for section in chapter["children"] for page in section["children"]]
+    for i, url in enumerate(urls + ["https://docs.example.com/glossary"]):
+        data = {"url": url, "summary": f"Summary of page {i}：中文摘要。", "page_type": "Guide",
+                "knowledge_points": [{"concept": f"Concept {i}.{k}", "explanation": "Explanation " * 5,
+                                      "importance": k % 5 + 1} for k in range(i % 3)]}
+        with open(os.path.join(fragments_dir, f"{i}.json"), "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+    with open(os.path.join(root, "toc_raw.json"), "w", encoding="utf-8") as f:
+        json.dump(toc, f, ensure_ascii=False)
+    return fragments_dir, toc
+
+def legacy_book(project_name, toc, fragments_dir, output_file):
+    """旧实现：递归字符串拼接，整本书拼成一个字符串后一次写入"""
+    indexer = FragmentIndexer(fragments_dir)
+    indexer.build_index()
+
+    def process_node(node, level=1):
+        text = ""
+        title_cn = node.get("title_cn")
+        text += f"{'#' * level} {node['title']} ({title_cn})\n\n" if title_cn else f"{'#' * level} {node['title']}\n\n"
+        fragment = indexer.find_fragment(node["url"]) if node.get("url") else None
+        if not fragment:
+            for kw in node.get("keywords", []):
+                fragment = indexer.find_fragment(kw)
+                if fragment:
+                    break
+        if fragment:
+            with open(fragment['path'], 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            text += f"{data.get('summary', '')}\n\n"
+            if data.get('knowledge_points'):
+                text += "#### Core Concepts\n"
+                for kp in data['knowledge_points']:
+                    text += f"- **{kp['concept']}** {generator._format_importance(kp.get('importance', 3))}: {kp['explanation']}\n"
+            text += "\n"
+        elif not node.get("children"):
+            text += "*(Content not found)*\n\n"
+        for child in node.get("children", []):
+            text += process_node(child, level + 1)
+        return text
+
+    final_content = f"# {project_name.capitalize()} Official Guide (Structured)\n\n"
+    final_content += "> Document generated via Content Extraction Pipeline based on official TOC.\n\n"
+    final_content += "".join(process_node(node, level=2) for node in toc)
+    with open(output_file, "w", encoding="utf-8") as f:
+        f.write(final_content)
+
+def test_streaming_book_matches_legacy_writer(tmp_path):
+    fragments_dir, toc = _build_project(str(tmp_path))
+    legacy_file, output_file = str(tmp_path / "legacy.md"), str(tmp_path / "book" / "structured.md")
+    legacy_book("demo", toc, fragments_dir, legacy_file)
+    generate_book("demo", fragments_dir, output_file)
+
+    with open(legacy_file, "rb") as f:
+        expected = f.read()
+    with open(output_file, "rb") as f:
+        assert f.read() == expected
+    assert b"*(Content not found)*" in expected and "小节 0.0".encode("utf-8") in expected
+    # 没有已有文件时按 umask 设置权限，且不留下临时文件
+    umask = os.umask(0)
+    os.umask(umask)
+    assert stat.S_IMODE(os.stat(output_file).st_mode) == 0o666 & ~umask
+    assert os.listdir(tmp_path / "book") == ["structured.md"]
+
+def test_failed_write_keeps_previous_book(tmp_path, monkeypatch):
+    fragments_dir, _ = _build_project(str(tmp_path))
+    output_file = str(tmp_path / "structured.md")
+    generate_book("demo", fragments_dir, output_file)
+    os.chmod(output_file, 0o600)
+    with open(output_file, "rb") as f:
+        previous = f.read()
+
+    def failing_structure(toc, fragments_dir):
+        yield "## Partial section\n\n"
+        raise OSError("disk full")
+
+    # 写到一半失败：旧书保持不变，临时文件被清理
+    monkeypatch.setattr(generator, "iter_structure", failing_structure)
+    generate_book("demo", fragments_dir, output_file)
+    with open(output_file, "rb") as f:
+        assert f.read() == previous
+    assert not [name for name in os.listdir(tmp_path) if name.startswith(".structured-")]
+
+    # 重新生成时沿用已有文件的权限
+    monkeypatch.undo()
+    generate_book("demo", fragments_dir, output_file)
+    assert stat.S_IMODE(os.stat(output_file).st_mode) == 0o600
+    logger.success("Book replaced atomically with the previous file's mode.")
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
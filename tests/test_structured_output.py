@@ -0,0 +1,125 @@
+import json
+import tempfile
+import httpx
+import openai
+from langchain_core.messages import AIMessage
+from langchain_core.prompts import ChatPromptTemplate
+from loguru import logger
+from src.core.generator import Generator
+from src.core.llm_client import LLMClient
+from src.graph.workflow import _is_transient
+from src.utils.llm_cache import LLMResponseCache
+
+GOOD = {"summary": "总结", "page_type": "Concept",
+        "knowledge_points": [{"concept": "Agent (智能体)", "explanation": "解释", "tags": [], "importance": 4}]}
+BAD = {"summary": "总结", "page_type": "Tutorial", "knowledge_points": []}  # page_type 不在允许的取值中
+
+class FakeStructured:
+    def __init__(self, llm, schema):
+        self.llm = llm
+        self.schema = schema
+
+    def invoke(self, prompt_value):
+        self.llm.prompts.append(prompt_value.to_string())
+        args = self.llm.replies.pop(0)
+        raw = AIMessage(content="", tool_calls=[{"name": self.schema.__name__, "args": args, "id": "call"}])
+        try:
+            return {"raw": raw, "parsed": self.schema.model_validate(args), "parsing_error": None}
+        except Exception as e:
+            return {"raw": raw, "parsed": None, "parsing_error": e}
+
+class FakeLLM:
+    """按顺序返回预设结果；structured 模式下模拟 function calling 的 include_raw 输出"""
+
+    def __init__(self, replies):
+        self.model_name = "fake-model"
+        self.temperature = 0.1
+        self.replies = list(replies)
+        self.prompts = []
+
+    def with_structured_output(self, schema, method="function_calling", include_raw=False):
+        return FakeStructured(self, schema)
+
+    def invoke(self, prompt_value):
+        self.prompts.append(prompt_value.to_string())
+        return AIMessage(content=json.dumps(self.replies.pop(0), ensure_ascii=False))
+
+def _generator(mode, llm, cache=None):
+    generator = Generator()
+    generator.is_mock_mode = False
+    generator.output_mode = mode
+    generator.repair_attempts = 2
+    generator.client = LLMClient(llm, cache=cache)
+    return generator
+
+def test_structured_output_repairs_invalid_result():
+    cache = LLMResponseCache(tempfile.mkdtemp())
+    llm = FakeLLM([BAD, GOOD])
+    generator = _generator("structured", llm, cache)
+
+    analysis = generator.analyze_page("Agents", "Agents call tools.")
+    assert analysis.page_type == "Concept" and analysis.knowledge_points[0].importance == 4
+    # 结构化模式不再发送格式说明；修复调用带上校验错误与原始输出
+    assert "properties" not in llm.prompts[0]
+    assert "Tutorial" in llm.prompts[1] and "page_type" in llm.prompts[1]
+    stats = generator.output_stats
+    assert stats["calls"] == 2 and stats["failures"] == 1 and stats["repairs"] == 1
+    assert stats["repair_tokens"] > 0 and stats["failed"] == 0
+
+    # 校验通过的结果写入缓存，重跑时不再调用模型
+    assert generator.analyze_page("Agents", "Agents call tools.") == analysis and not llm.replies
+    logger.success(f"Structured output repaired after one failure: {stats}")
+
+def test_repair_attempts_are_bounded():
+    llm = FakeLLM([BAD, BAD, BAD, GOOD])
+    generator = _generator("parser", llm)
+
+    assert generator.analyze_page("Agents", "Agents call tools.") is None
+    # 首次调用 + 2 次修复后放弃
+    assert len(llm.prompts) == 3 and llm.replies == [GOOD]
+    assert generator.output_stats["failures"] == 3 and generator.output_stats["failed"] == 1
+    logger.success("Repair loop gave up after the configured number of attempts.")
+
+class FailingLLM(FakeLLM):
+    def __init__(self, error):
+        super().__init__([])
+        self.error = error
+
+    def invoke(self, prompt_value):
+        raise self.error
+
+def test_transient_llm_errors_reach_the_caller():
+    unavailable = openai.InternalServerError("unavailable", body=None, response=httpx.Response(
+        503, request=httpx.Request("POST", "http://localhost:9/v1/chat/completions")))
+    generator = _generator("parser", FailingLLM(unavailable))
+    generator.client.max_retries = 0
+    # 客户端重试耗尽后抛出，由提取图的分支按临时性错误重试
+    try:
+        generator.analyze_page("Agents", "Agents call tools.")
+        assert False, "expected InternalServerError"
+    except openai.InternalServerError as e:
+        assert _is_transient(e)
+
+    generator = _generator("parser", FailingLLM(ValueError("bad request")))
+    generator.client.max_retries = 0
+    assert generator.analyze_page("Agents", "Agents call tools.") is None
+    logger.success("Transient LLM errors propagate to the branch retry, other errors still return None.")
+
+def test_prompt_version_covers_mode_and_pack_prompt():
+    generator = Generator()
+    generator.output_mode = "parser"
+    parser_version = generator._prompt_fingerprint()
+    generator.output_mode = "structured"
+    # 两种模式的片段不能在增量运行中互相复用
+    assert generator._prompt_fingerprint() != parser_version
+    # 合并分析的提示词变化同样使片段失效
+    structured_version = generator._prompt_fingerprint()
+    generator.pack_prompt = ChatPromptTemplate.from_messages([("system", "edited"), ("user", "{pages}")])
+    assert generator._prompt_fingerprint() != structured_version
+    logger.success("Prompt version changes with the output mode and the pack prompt.")
+
+if __name__ == "__main__":
+    test_structured_output_repairs_invalid_result()
+    test_repair_attempts_are_bounded()
+    test_prompt_version_covers_mode_and_pack_prompt()
+    test_transient_llm_errors_reach_the_caller()
@@ -0,0 +1,67 @@
+import os
+import random
+import tempfile
+import threading
+import time
+from langchain_core.messages import AIMessage
+from loguru import logger
+from src.core.visualizer import Visualizer
+
+class FakeClient:
+    """按章节标题返回图表，随机延迟以打乱完成顺序"""
+
+    def __init__(self, fail: str = None):
+        self.calls = []
+        self.fail = fail
+        self.lock = threading.Lock()
+
+    def invoke(self, prompt_value, call_site="llm"):
+        title = prompt_value.to_messages()[1].content.split("\n")[0].replace("章节标题: ", "").strip()
+        time.sleep(random.uniform(0, 0.02))
+        with self.lock:
+            self.calls.append(title)
+        if title == self.fail:
+            raise RuntimeError("upstream error")
+        return AIMessage(content=f"```mermaid\ngraph TD\n  A[{title}]\n```")
+
+def build_document(sections, edited=None):
+    parts = ["# Book\n\nPreface.\n\n"]
+    for i in range(sections):
+        body = f"Body of chapter {i}. " * 30
+        if i == edited:
+            body += "Edited paragraph."
+        parts.append(f"## Chapter {i}\n\n{body}\n\n")
+    return "".join(parts)
+
+def test_visualizer_concurrent_and_incremental():
+    visualizer = Visualizer()
+    visualizer.max_workers = 8
+    directory = tempfile.mkdtemp()
+    input_path = os.path.join(directory, "structured.md")
+    output_path = os.path.join(directory, "structured_with_diagrams.md")
+
+    with open(input_path, "w", encoding="utf-8") as f:
+        f.write(build_document(20))
+    visualizer.client = FakeClient(fail="## Chapter 7")
+    visualizer.process_document(input_path, output_path)
+    assert len(visualizer.client.calls) == 20
+
+    with open(output_path, encoding="utf-8") as f:
+        output = f.read()
+    # 按原顺序拼回，每个章节的图表紧跟其标题
+    positions = [output.index(f"## Chapter {i}\n\n```mermaid\ngraph TD\n  A[## Chapter {i}]") for i in range(20) if i != 7]
+    assert positions == sorted(positions)
+    assert "A[## Chapter 7]" not in output
+
+    # 第二次运行：只有修改过的章节与上次失败的章节会调用 LLM
+    with open(input_path, "w", encoding="utf-8") as f:
+        f.write(build_document(20, edited=3))
+    visualizer.client = FakeClient()
+    visualizer.process_document(input_path, output_path)
+    assert sorted(visualizer.client.calls) == ["## Chapter 3", "## Chapter 7"]
+    with open(output_path, encoding="utf-8") as f:
+        assert f.read().count("```mermaid") == 20
+    logger.success("Visualizer runs sections concurrently and skips unchanged ones.")
+
+if __name__ == "__main__":
+    test_visualizer_concurrent_and_incremental()